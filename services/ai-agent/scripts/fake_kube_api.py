@@ -0,0 +1,176 @@
+"""
+Minimal fake Kubernetes API server for exercising DIAGNOSTICS_BACKEND=api
+without a cluster.
+
+Serves a crash-looping `checkout` deployment in the `prod` namespace: pods,
+deployments, replicasets, services, events, pod logs and metrics.k8s.io usage.
+Unknown objects return a 404 Status like the real API server.
+
+Usage:
+    python scripts/fake_kube_api.py --port 8001
+    KUBE_API_URL=http://127.0.0.1:8001 DIAGNOSTICS_BACKEND=api python src/main.py
+"""
+
+import argparse
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _ts(minutes_ago: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+NAMESPACE = "prod"
+LABELS = {"app": "checkout"}
+
+OBJECTS = {
+    "pods": [
+        {
+            "metadata": {"name": "checkout-7d9f8b6c5-x2k4p", "namespace": NAMESPACE, "labels": LABELS,
+                         "creationTimestamp": _ts(90)},
+            "spec": {"nodeName": "node-a", "containers": [
+                {"name": "checkout", "image": "shop/checkout:1.4.2",
+                 "resources": {"limits": {"cpu": "500m", "memory": "256Mi"}}}]},
+            "status": {
+                "phase": "Running",
+                "conditions": [{"type": "Ready", "status": "False"}],
+                "containerStatuses": [{
+                    "name": "checkout", "ready": False, "restartCount": 7,
+                    "state": {"waiting": {"reason": "CrashLoopBackOff"}},
+                    "lastState": {"terminated": {"reason": "OOMKilled", "exitCode": 137}},
+                }],
+            },
+        },
+        {
+            "metadata": {"name": "checkout-7d9f8b6c5-q8m3z", "namespace": NAMESPACE, "labels": LABELS,
+                         "creationTimestamp": _ts(90)},
+            "spec": {"nodeName": "node-b", "containers": [{"name": "checkout", "image": "shop/checkout:1.4.2"}]},
+            "status": {
+                "phase": "Running",
+                "conditions": [{"type": "Ready", "status": "True"}],
+                "containerStatuses": [{"name": "checkout", "ready": True, "restartCount": 0,
+                                       "state": {"running": {"startedAt": _ts(90)}}}],
+            },
+        },
+    ],
+    "deployments": [{
+        "metadata": {"name": "checkout", "namespace": NAMESPACE, "labels": LABELS, "creationTimestamp": _ts(3000)},
+        "spec": {"replicas": 2, "template": {"spec": {"containers": [
+            {"name": "checkout", "image": "shop/checkout:1.4.2"}]}}},
+        "status": {"readyReplicas": 1, "updatedReplicas": 2, "availableReplicas": 1, "conditions": [
+            {"type": "Available", "status": "False", "reason": "MinimumReplicasUnavailable"}]},
+    }],
+    "replicasets": [{
+        "metadata": {"name": "checkout-7d9f8b6c5", "namespace": NAMESPACE, "labels": LABELS,
+                     "creationTimestamp": _ts(90)},
+        "spec": {"replicas": 2},
+        "status": {"replicas": 2, "readyReplicas": 1},
+    }],
+    "services": [{
+        "metadata": {"name": "checkout", "namespace": NAMESPACE, "labels": LABELS, "creationTimestamp": _ts(3000)},
+        "spec": {"type": "ClusterIP", "clusterIP": "10.96.12.34", "ports": [{"port": 8080, "protocol": "TCP"}]},
+    }],
+    "events": [
+        {"metadata": {"name": "checkout.1", "namespace": NAMESPACE}, "type": "Warning", "reason": "BackOff",
+         "count": 12, "lastTimestamp": _ts(1), "message": "Back-off restarting failed container",
+         "involvedObject": {"kind": "Pod", "name": "checkout-7d9f8b6c5-x2k4p"}},
+        {"metadata": {"name": "checkout.2", "namespace": NAMESPACE}, "type": "Warning", "reason": "OOMKilling",
+         "count": 7, "lastTimestamp": _ts(3), "message": "Memory cgroup out of memory: Killed process 1 (java)",
+         "involvedObject": {"kind": "Pod", "name": "checkout-7d9f8b6c5-x2k4p"}},
+    ],
+}
+
+LOGS = {
+    "checkout-7d9f8b6c5-x2k4p": [
+        "INFO Starting checkout service v1.4.2",
+        "INFO Loading product catalogue into cache",
+        "ERROR java.lang.OutOfMemoryError: Java heap space",
+    ],
+    "checkout-7d9f8b6c5-q8m3z": [
+        "INFO Starting checkout service v1.4.2",
+        "INFO Listening on :8080",
+    ],
+}
+
+METRICS = {
+    "checkout-7d9f8b6c5-x2k4p": {"cpu": "412000000n", "memory": "251Mi"},
+    "checkout-7d9f8b6c5-q8m3z": {"cpu": "35m", "memory": "180Mi"},
+}
+
+_GROUPS = r"(?:/api/v1|/apis/apps/v1|/apis/metrics\.k8s\.io/v1beta1)"
+_ROUTE = re.compile(_GROUPS + r"(?:/namespaces/(?P<ns>[^/]+))?/(?P<kind>[a-z]+)(?:/(?P<name>[^/]+))?(?P<log>/log)?$")
+
+
+def _matches(obj: dict, query: dict) -> bool:
+    for selector in query.get("labelSelector", []):
+        labels = obj.get("metadata", {}).get("labels", {})
+        if any(labels.get(k) != v for k, v in (term.split("=", 1) for term in selector.split(","))):
+            return False
+    for selector in query.get("fieldSelector", []):
+        key, _, value = selector.partition("=")
+        if key == "involvedObject.name" and obj.get("involvedObject", {}).get("name") != value:
+            return False
+    return True
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        match = _ROUTE.match(url.path)
+        if not match:
+            return self._not_found(url.path)
+        ns, kind, name = match.group("ns"), match.group("kind"), match.group("name")
+
+        if url.path.startswith("/apis/metrics.k8s.io"):
+            items = [{"metadata": {"name": pod, "namespace": NAMESPACE},
+                      "containers": [{"name": "checkout", "usage": usage}]}
+                     for pod, usage in METRICS.items()] if kind == "pods" else []
+        else:
+            items = OBJECTS.get(kind, [])
+        items = [o for o in items if ns is None or o["metadata"].get("namespace") == ns]
+
+        if match.group("log"):
+            if name not in LOGS:
+                return self._not_found(f'pods "{name}"')
+            lines = LOGS[name]
+            tail = int(query.get("tailLines", ["0"])[0])
+            body = "\n".join(lines[-tail:] if tail else lines) + "\n"
+            limit = int(query.get("limitBytes", ["0"])[0])
+            return self._send(200, body.encode()[:limit] if limit else body, "text/plain")
+        if name:
+            found = next((o for o in items if o["metadata"]["name"] == name), None)
+            if found is None:
+                return self._not_found(f'{kind} "{name}"')
+            return self._send(200, json.dumps(found))
+        return self._send(200, json.dumps({"kind": "List", "items": [o for o in items if _matches(o, query)]}))
+
+    def _not_found(self, what: str):
+        status = {"kind": "Status", "status": "Failure", "reason": "NotFound", "code": 404,
+                  "message": f"{what} not found"}
+        self._send(404, json.dumps(status))
+
+    def _send(self, code: int, body, content_type: str = "application/json"):
+        data = body if isinstance(body, bytes) else body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Kubernetes API server for diagnostics testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Fake Kubernetes API on http://{args.host}:{args.port} (namespace {NAMESPACE})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,27 @@
+import asyncio
 import os
-import subprocess
-import shlex
 import time
 import re
+import threading
+from typing import Optional
 from google.protobuf.json_format import MessageToJson, Parse
 from protos.contracts import orchestrator_pb2
 import uuid
 import json
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models
 from minio import Minio
 from llm.llm_provider import LLMProvider
+from llm.rate_limiter import current_priority, priority_for
+from agent.async_cache import AsyncTTLCache
+from agent.command_planner import extract_command_templates, plan_commands
+from agent.diagnostics_backend import NOT_FOUND_ERROR, create_diagnostics_backend, run_process
+from agent.resource_index import ResourceIndex, ResourceInfo
+from agent.schemas import COMMANDS_SCHEMA, DECISION_SCHEMA
+from prometheus_client import Counter, Histogram
+
+STAGE_DURATION = Histogram('orchestrator_agent_stage_duration_seconds', 'Duration of each analysis stage', ['stage'])
+COMMAND_PLANS = Counter('orchestrator_agent_diagnostic_plans_total', 'Diagnostic command lists by source', ['source'])
 
 
 class IncidentAgent:
@@ -26,7 +37,7 @@ class IncidentAgent:
         
         # Initialize RAG (Qdrant)
         self.qdrant_host = os.getenv("QDRANT_HOST", "qdrant")
-        self.qdrant = QdrantClient(host=self.qdrant_host, port=6333)
+        self.qdrant = AsyncQdrantClient(host=self.qdrant_host, port=6333)
         self.collection_name = "sre_knowledge"
         
         # Initialize MinIO
@@ -45,8 +56,73 @@ class IncidentAgent:
         # Alert deduplication cache
         self._alert_cache = {}
         self._cache_ttl = 300  # 5 minutes
+        self._alert_lock = threading.Lock()  # analyze() runs on multiple worker threads
+        
+        # Namespace resource listings shared across incidents (single-flight + TTL)
+        self._resource_cache = AsyncTTLCache(
+            "discovery",
+            ttl=float(os.getenv("DISCOVERY_CACHE_TTL", "30"))
+        )
+        
+        # Pipeline: two_call (LLM picks commands, then analyzes), single_call
+        # (commands planned from the runbook, one LLM call) or tool_loop
+        # (the model requests diagnostics through tool calls)
+        self.pipeline_mode = os.getenv("AGENT_PIPELINE_MODE", "two_call")
+        if self.pipeline_mode not in self.PIPELINE_MODES:
+            print(f"Unknown AGENT_PIPELINE_MODE '{self.pipeline_mode}', using two_call")
+            self.pipeline_mode = "two_call"
+        self.tool_max_steps = int(os.getenv("AGENT_TOOL_MAX_STEPS", "4"))
+        
+        # Diagnostics run concurrently: bounded kubectl processes, per-incident deadline
+        self.diagnostics_max_procs = int(os.getenv("DIAGNOSTICS_MAX_PROCS", "8"))
+        self.diagnostics_deadline = float(os.getenv("DIAGNOSTICS_DEADLINE_SECONDS", "45"))
+        self._diagnostics_slots = None  # asyncio.Semaphore, created on the agent loop
+        
+        # kubectl subprocesses, or direct Kubernetes API calls over a pooled client
+        # Output is streamed through head/tail windows; a command is stopped
+        # after DIAGNOSTICS_MAX_OUTPUT_BYTES
+        self.diagnostics = create_diagnostics_backend(
+            os.getenv("DIAGNOSTICS_BACKEND", "kubectl"),
+            max_output_bytes=int(os.getenv("DIAGNOSTICS_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+        )
+        
+        # Logs templated with counts, describe output reduced to states/exit codes
+        self.diagnostics_digest = os.getenv("DIAGNOSTICS_DIGEST", "true").lower() == "true"
+        
+        # Command output shared across incidents for a short time (single-flight + TTL)
+        self._diagnostic_cache = AsyncTTLCache(
+            "diagnostics",
+            ttl=float(os.getenv("DIAGNOSTICS_CACHE_TTL", "20"))
+        )
         
-        print(f"Agent initialized. RAG connected to {self.qdrant_host}, Docs at {self.minio_endpoint}")
+        # Dedicated event loop: all async clients live here and sync callers
+        # submit work to it, so many incidents can be in flight at once
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="agent-loop", daemon=True)
+        self._loop_thread.start()
+        
+        print(f"Agent initialized. RAG connected to {self.qdrant_host}, Docs at {self.minio_endpoint}, pipeline={self.pipeline_mode}, diagnostics={self.diagnostics.name}")
+
+    PIPELINE_MODES = ("two_call", "single_call", "tool_loop")
+
+    # Tool offered to the model in tool_loop mode
+    RUN_DIAGNOSTIC_TOOL = {
+        "type": "function",
+        "function": {
+            "name": "run_diagnostic",
+            "description": "Run one read-only kubectl command (get, describe, logs, top) and return its output.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "command": {
+                        "type": "string",
+                        "description": "Full command, e.g. kubectl logs <exact-pod-name> -n <namespace> --tail=100",
+                    },
+                },
+                "required": ["command"],
+            },
+        },
+    }
 
     # Security whitelist - only read-only kubectl commands allowed
     ALLOWED_COMMANDS = [
@@ -87,70 +163,87 @@ class IncidentAgent:
         # Limit length
         return sanitized[:500]
 
-    def _discover_resources(self, namespace: str) -> dict:
-        """
-        Discover actual K8s resources to provide accurate names to LLM.
-        This prevents the LLM from guessing wrong pod/deployment names.
+    async def _run_command(self, args: list, timeout: float) -> tuple:
         """
-        resources = {
-            "pods": [],
-            "deployments": [],
-            "services": [],
-            "replicasets": []
-        }
-        
-        discovery_commands = [
-            ("pods", ["kubectl", "get", "pods", "-n", namespace, "-o", "name"]),
-            ("deployments", ["kubectl", "get", "deployments", "-n", namespace, "-o", "name"]),
-            ("services", ["kubectl", "get", "services", "-n", namespace, "-o", "name"]),
-            ("replicasets", ["kubectl", "get", "replicasets", "-n", namespace, "-o", "name"]),
-        ]
+        Run a command as an asyncio subprocess.
         
-        for resource_type, cmd in discovery_commands:
-            try:
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True, 
-                    text=True, 
-                    timeout=10
-                )
-                if result.returncode == 0 and result.stdout.strip():
-                    # Parse output like "pod/myapp-abc123" -> "myapp-abc123"
-                    items = []
-                    for line in result.stdout.strip().split("\n"):
-                        if "/" in line:
-                            items.append(line.split("/", 1)[1])
-                        elif line.strip():
-                            items.append(line.strip())
-                    resources[resource_type] = items[:20]  # Limit to 20 per type
-            except subprocess.TimeoutExpired:
-                print(f"DISCOVERY: Timeout getting {resource_type}")
-            except Exception as e:
-                print(f"DISCOVERY: Failed to get {resource_type}: {e}")
+        Returns:
+            (returncode, stdout, stderr) with output decoded as text
         
-        print(f"DISCOVERY: Found {len(resources['pods'])} pods, {len(resources['deployments'])} deployments in {namespace}")
-        return resources
+        Raises:
+            asyncio.TimeoutError: If the command does not finish in time
+        """
+        return await run_process(args, timeout)
+
+    # Resource kinds listed during discovery
+    DISCOVERY_KINDS = ["pods", "deployments", "services", "replicasets"]
 
-    def _find_matching_resources(self, service_name: str, resources: dict) -> dict:
-        """Find resources that match the service name from the alert."""
-        matches = {
-            "pods": [],
-            "deployments": [],
-        }
+    # One tab-separated line per resource: kind, name, owner, app labels
+    DISCOVERY_TEMPLATE = (
+        '{range .items[*]}'
+        '{.kind}{"\\t"}{.metadata.name}{"\\t"}'
+        '{.metadata.ownerReferences[0].kind}{"\\t"}{.metadata.ownerReferences[0].name}{"\\t"}'
+        '{.metadata.labels.app}{"\\t"}{.metadata.labels.app\\.kubernetes\\.io/name}{"\\n"}'
+        '{end}'
+    )
+
+    async def _discover_resources(self, namespace: str) -> ResourceIndex:
+        """
+        Discover actual K8s resources to provide accurate names to LLM.
+        This prevents the LLM from guessing wrong pod/deployment names.
         
-        # Normalize service name for matching
-        service_lower = service_name.lower()
+        Listings are cached per namespace for DISCOVERY_CACHE_TTL seconds, and
+        concurrent incidents in one namespace share a single in-flight listing.
+        The returned index is shared and must not be mutated.
+        """
+        return await self._resource_cache.get_or_load(
+            namespace,
+            lambda: self._list_resources(namespace),
+            should_cache=bool
+        )
+
+    async def _list_resources(self, namespace: str) -> ResourceIndex:
+        """
+        List pods, deployments, services and replicasets in a namespace and index them.
         
-        for pod in resources.get("pods", []):
-            # Match if pod name contains service name or vice versa
-            if service_lower in pod.lower() or any(part in pod.lower() for part in service_lower.split("-")):
-                matches["pods"].append(pod)
+        All kinds are listed in a single kubectl call so process startup,
+        kubeconfig parsing and API discovery are paid once per incident.
+        """
+        cmd = [
+            "kubectl", "get", ",".join(self.DISCOVERY_KINDS),
+            "-n", namespace, "-o", f"jsonpath={self.DISCOVERY_TEMPLATE}"
+        ]
         
-        for deploy in resources.get("deployments", []):
-            if service_lower in deploy.lower() or any(part in deploy.lower() for part in service_lower.split("-")):
-                matches["deployments"].append(deploy)
+        infos = []
+        try:
+            returncode, stdout, stderr = await self._run_command(cmd, timeout=10)
+            if returncode != 0:
+                print(f"DISCOVERY: Failed to list resources: {stderr.strip()[:200]}")
+            
+            for line in stdout.split("\n"):
+                fields = line.split("\t")
+                if len(fields) < 2 or not fields[1]:
+                    continue
+                fields += [""] * (6 - len(fields))
+                infos.append(ResourceInfo(
+                    kind=fields[0],
+                    name=fields[1],
+                    owner_kind=fields[2],
+                    owner_name=fields[3],
+                    app_labels=[label for label in fields[4:6] if label]
+                ))
+        except asyncio.TimeoutError:
+            print(f"DISCOVERY: Timeout listing resources in {namespace}")
+        except Exception as e:
+            print(f"DISCOVERY: Failed to list resources: {e}")
         
-        return matches
+        index = ResourceIndex(infos)
+        print(f"DISCOVERY: Found {len(index.resources['pods'])} pods, {len(index.resources['deployments'])} deployments in {namespace}")
+        return index
+
+    def _find_matching_resources(self, service_name: str, index: ResourceIndex) -> dict:
+        """Find resources that match the service name from the alert, best match first."""
+        return index.match(service_name)
 
     def _extract_json(self, text: str) -> dict:
         """
@@ -182,7 +275,15 @@ class IncidentAgent:
         return {}
 
     def analyze(self, event: orchestrator_pb2.DomainEvent) -> orchestrator_pb2.Decision:
-        """Main analysis entry point."""
+        """
+        Main analysis entry point (blocking).
+        Runs analyze_async() on the agent's event loop and waits for the result.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.analyze_async(event), self._loop)
+        return future.result()
+
+    async def analyze_async(self, event: orchestrator_pb2.DomainEvent) -> orchestrator_pb2.Decision:
+        """Async analysis pipeline; safe to run many incidents concurrently."""
         # Filter out system component alerts
         if self._should_ignore_alert(event.service_name):
             print(f"IGNORED: Skipping system component alert for {event.service_name}")
@@ -192,54 +293,88 @@ class IncidentAgent:
         cache_key = f"{event.service_name}:{event.domain}"
         current_time = time.time()
         
-        if cache_key in self._alert_cache:
-            last_processed = self._alert_cache[cache_key]
-            time_since = current_time - last_processed
-            if time_since < self._cache_ttl:
-                print(f"RATE LIMIT: Skipping duplicate alert for {event.service_name} (processed {time_since:.0f}s ago)")
-                return self._cached_decision(event)
-        
-        # Update cache
-        self._alert_cache[cache_key] = current_time
-        
-        # Clean up old cache entries
-        self._alert_cache = {k: v for k, v in self._alert_cache.items() 
-                            if current_time - v < self._cache_ttl * 2}
+        with self._alert_lock:
+            if cache_key in self._alert_cache:
+                last_processed = self._alert_cache[cache_key]
+                time_since = current_time - last_processed
+                if time_since < self._cache_ttl:
+                    print(f"RATE LIMIT: Skipping duplicate alert for {event.service_name} (processed {time_since:.0f}s ago)")
+                    return self._cached_decision(event)
+            
+            # Update cache
+            self._alert_cache[cache_key] = current_time
+            
+            # Clean up old cache entries
+            self._alert_cache = {k: v for k, v in self._alert_cache.items() 
+                                if current_time - v < self._cache_ttl * 2}
         
         print(f"PROCESSING: New alert for {event.service_name}")
         
+        # LLM calls for this incident queue by severity, then event age
+        created_at = event.original_event.timestamp.seconds + event.original_event.timestamp.nanos / 1e9
+        current_priority.set(priority_for(event.original_event.severity, created_at or None))
+        
         # Extract namespace from metadata (convert protobuf map to dict)
         metadata = dict(event.original_event.metadata) if event.original_event.metadata else {}
         namespace = metadata.get("namespace", "default")
         namespace = self._sanitize_input(namespace)
         
-        # 1. Discover actual K8s resources (prevents wrong name guessing)
-        resources = self._discover_resources(namespace)
-        matching = self._find_matching_resources(event.service_name, resources)
-        
-        # 2. Build context from RAG
-        context = self._build_context(event)
+        # 1+2. Discover actual K8s resources (prevents wrong name guessing) and
+        # build context from RAG. The branches are independent, so run them together.
+        prepare_start = time.monotonic()
+        index, (context, templates) = await asyncio.gather(
+            self._timed("discovery", self._discover_resources(namespace)),
+            self._timed("rag_context", self._build_context(event))
+        )
+        STAGE_DURATION.labels(stage="prepare").observe(time.monotonic() - prepare_start)
+        resources = index.resources
+        matching = self._find_matching_resources(event.service_name, index)
+        
+        if self.pipeline_mode == "tool_loop":
+            # 3-7. Model requests diagnostics itself within one conversation
+            return await self._timed(
+                "analysis",
+                self._analyze_with_tools(event, context, namespace, resources, matching)
+            )
         
         # 3. Get diagnostic commands (with resource awareness)
-        diagnostic_commands = self._get_diagnostic_commands(event, context, namespace, resources, matching)
+        if self.pipeline_mode == "single_call":
+            # Planned from the runbook's own commands, no LLM call
+            diagnostic_commands = (
+                self._plan_diagnostic_commands(event, templates, namespace, matching)
+                or self._generate_fallback_commands(namespace, resources, matching)
+            )
+        else:
+            diagnostic_commands = await self._timed(
+                "diagnostic_commands",
+                self._get_diagnostic_commands(event, context, namespace, resources, matching, templates)
+            )
         
         # 4. Execute diagnostics
-        diagnostics = self._run_diagnostics(diagnostic_commands)
+        diagnostics = await self._timed("diagnostics", self._run_diagnostics(diagnostic_commands, namespace))
         
         # 5. Build analysis prompt
         prompt = self._build_prompt(event, context, diagnostics)
         
         try:
             # 6. Call LLM for final analysis
-            response_text = self.llm.generate(prompt)
+            response_text = await self._timed("analysis", self.llm.agenerate(prompt, expect_json=True, json_schema=DECISION_SCHEMA))
             
             # 7. Parse decision
-            return self._parse_decision(response_text, event)
+            return await self._parse_decision(response_text, event)
             
         except Exception as e:
             print(f"LLM generation failed: {e}")
             return self._fallback_decision(event, str(e))
 
+    async def _timed(self, stage: str, coro):
+        """Await a pipeline stage and record its duration."""
+        start = time.monotonic()
+        try:
+            return await coro
+        finally:
+            STAGE_DURATION.labels(stage=stage).observe(time.monotonic() - start)
+
     def _cached_decision(self, event) -> orchestrator_pb2.Decision:
         """Return a cached/skipped decision for duplicate alerts."""
         decision = orchestrator_pb2.Decision()
@@ -258,23 +393,24 @@ class IncidentAgent:
         decision.confidence_score = 0.0
         return decision
 
-    def _get_diagnostic_commands(self, event, context: str, namespace: str, 
-                                  resources: dict, matching: dict) -> list:
+    async def _get_diagnostic_commands(self, event, context: str, namespace: str, 
+                                  resources: dict, matching: dict, templates: list = None) -> list:
         """
-        PHASE 1: Ask LLM to generate diagnostic commands.
-        Now includes actual resource names to prevent guessing.
+        PHASE 1: Pick diagnostic commands.
+        Uses the runbook's command templates when they apply to the matched
+        resources; otherwise asks the LLM, giving it actual resource names to
+        prevent guessing.
         """
+        planned = self._plan_diagnostic_commands(event, templates or [], namespace, matching)
+        if planned:
+            return planned
+        
         service_name = self._sanitize_input(event.service_name)
         raw_payload_str = str(event.original_event.raw_payload) if event.original_event.raw_payload else ""
         raw_payload = self._sanitize_input(raw_payload_str[:1000])
         
         # Build resource context for LLM
-        resource_context = f"""
-AVAILABLE RESOURCES IN NAMESPACE '{namespace}':
-- Pods: {matching.get('pods', [])[:10] or resources.get('pods', [])[:10]}
-- Deployments: {matching.get('deployments', [])[:5] or resources.get('deployments', [])[:5]}
-- All Pods (if needed): {resources.get('pods', [])[:15]}
-"""
+        resource_context = self._resource_context(namespace, resources, matching)
         
         prompt = f"""You are an SRE assistant. Generate kubectl diagnostic commands for this alert.
 
@@ -306,7 +442,7 @@ OUTPUT FORMAT (valid JSON only):
 """
 
         try:
-            response_text = self.llm.generate(prompt)
+            response_text = await self.llm.agenerate(prompt, expect_json=True, json_schema=COMMANDS_SCHEMA)
             data = self._extract_json(response_text)
             commands = data.get("commands", [])
             
@@ -322,14 +458,94 @@ OUTPUT FORMAT (valid JSON only):
             
             # If no valid commands, generate safe fallbacks
             if not validated:
-                validated = self._generate_fallback_commands(namespace, resources, matching)
+                return self._generate_fallback_commands(namespace, resources, matching)
             
+            COMMAND_PLANS.labels(source="llm").inc()
             return validated
             
         except Exception as e:
             print(f"DIAGNOSTICS: LLM failed: {e}")
             return self._generate_fallback_commands(namespace, resources, matching)
 
+    def _resource_context(self, namespace: str, resources: dict, matching: dict) -> str:
+        """Discovered resource names for prompts, best matches first."""
+        return f"""
+AVAILABLE RESOURCES IN NAMESPACE '{namespace}':
+- Pods: {matching.get('pods', [])[:10] or resources.get('pods', [])[:10]}
+- Deployments: {matching.get('deployments', [])[:5] or resources.get('deployments', [])[:5]}
+- All Pods (if needed): {resources.get('pods', [])[:15]}
+"""
+
+    def _plan_diagnostic_commands(self, event, templates: list, namespace: str, matching: dict) -> list:
+        """Instantiate the runbook's command templates for the matched resources (no LLM call); [] if none apply."""
+        commands = plan_commands(
+            templates,
+            namespace,
+            matching,
+            service_name=self._sanitize_input(event.service_name)
+        )
+        if commands:
+            COMMAND_PLANS.labels(source="runbook").inc()
+            for cmd in commands:
+                print(f"DIAGNOSTICS: Planned: {cmd}")
+        return commands
+
+    async def _analyze_with_tools(self, event, context: str, namespace: str,
+                                  resources: dict, matching: dict) -> orchestrator_pb2.Decision:
+        """
+        Tool-calling pipeline: the model asks for diagnostics through the
+        run_diagnostic tool and answers with the decision JSON in the same
+        conversation, so the incident context is built and sent once.
+        """
+        instructions = f"""{self._resource_context(namespace, resources, matching)}
+No diagnostics have been run yet. Call the run_diagnostic tool with read-only
+kubectl commands (get, describe, logs, top) using EXACT resource names from the
+lists above and always -n {namespace}; add --tail=100 to logs. You may call it
+up to {self.tool_max_steps} rounds. Then reply with the final JSON only."""
+        messages = [{"role": "user", "content": self._build_prompt(event, context, instructions)}]
+        
+        try:
+            for step in range(self.tool_max_steps + 1):
+                kwargs = {}
+                if step == self.tool_max_steps:
+                    # Budget used up: force an answer
+                    kwargs["tool_choice"] = "none"
+                    messages.append({"role": "user", "content": "Diagnostics budget used up. Reply now with the final JSON only."})
+                
+                response = await self.llm.achat(messages, tools=[self.RUN_DIAGNOSTIC_TOOL], **kwargs)
+                if not response.tool_calls:
+                    return await self._parse_decision(response.text, event)
+                
+                messages.append(response.assistant_message())
+                outputs = await asyncio.gather(*(
+                    self._run_tool_call(call, namespace, index)
+                    for index, call in enumerate(response.tool_calls)
+                ))
+                for call, output in zip(response.tool_calls, outputs):
+                    messages.append({"role": "tool", "tool_call_id": call["id"], "content": output})
+        except Exception as e:
+            print(f"LLM tool loop failed: {e}")
+            return self._fallback_decision(event, str(e))
+        
+        return self._fallback_decision(event, "No decision after tool calls")
+
+    # Diagnostics the model may request in a single tool-calling round
+    MAX_TOOL_CALLS_PER_STEP = 5
+
+    async def _run_tool_call(self, call: dict, namespace: str, index: int) -> str:
+        """Execute one run_diagnostic call and return its output for the model."""
+        if call["name"] != self.RUN_DIAGNOSTIC_TOOL["function"]["name"]:
+            return f"Unknown tool: {call['name']}"
+        if index >= self.MAX_TOOL_CALLS_PER_STEP:
+            return f"Skipped: at most {self.MAX_TOOL_CALLS_PER_STEP} diagnostics per round"
+        
+        cmd = str(call["arguments"].get("command", "")).strip()
+        if not any(cmd.startswith(allowed) for allowed in self.ALLOWED_COMMANDS):
+            print(f"DIAGNOSTICS: BLOCKED (whitelist): {cmd}")
+            return "Blocked: only kubectl get/describe/logs/top are allowed"
+        
+        return await self._run_diagnostics([cmd], namespace)
+
     def _generate_fallback_commands(self, namespace: str, resources: dict, matching: dict) -> list:
         """Generate safe fallback diagnostic commands."""
         commands = []
@@ -347,117 +563,164 @@ OUTPUT FORMAT (valid JSON only):
         # Always get recent events
         commands.append(f"kubectl get events -n {namespace} --sort-by=.lastTimestamp | tail -20")
         
+        COMMAND_PLANS.labels(source="fallback").inc()
         print(f"DIAGNOSTICS: Using {len(commands)} fallback commands")
         return commands[:5]
 
-    def _build_context(self, event) -> str:
-        """Build context from RAG (vector search + MinIO fetch)."""
+    async def _build_context(self, event) -> tuple:
+        """
+        Build context from RAG (vector search + MinIO fetch).
+        
+        Returns:
+            (context text, runbook command templates)
+        """
         try:
             raw_payload_str = str(event.original_event.raw_payload) if event.original_event.raw_payload else ""
             query_text = f"{event.service_name} {raw_payload_str}"
             
             print(f"RAG: Embedding query: {query_text[:50]}...")
-            embedding = self.llm.embed(query_text)
+            embedding = await self.llm.aembed(query_text)
             
             print("RAG: Searching Knowledge Base...")
-            search_response = self.qdrant.query_points(
+            search_response = await self.qdrant.query_points(
                 collection_name=self.collection_name,
                 query=embedding,
                 limit=1
             )
             
             if not search_response.points:
-                return "No specific runbook found. Use general troubleshooting."
+                return "No specific runbook found. Use general troubleshooting.", []
                 
             hit = search_response.points[0]
             print(f"RAG: Found runbook '{hit.payload.get('title')}' (Score: {hit.score})")
             
+            # Extracted at ingestion; older indexes fall back to parsing the content
+            templates = hit.payload.get('command_templates')
+            
             filename = hit.payload.get('minio_path')
             bucket = hit.payload.get('minio_bucket', self.bucket_name)
             
             try:
-                response = self.minio_client.get_object(bucket, filename)
-                content = response.read().decode('utf-8')
-                response.close()
-                response.release_conn()
+                # MinIO client is blocking; run it on the default executor
+                content = await asyncio.to_thread(self._fetch_runbook, bucket, filename)
             except Exception as e:
                 print(f"MinIO Fetch Failed: {e}")
-                return "Runbook found but failed to retrieve content."
+                return "Runbook found but failed to retrieve content.", templates or []
+            
+            if templates is None:
+                templates = extract_command_templates(content)
             
             return f"""
 RELEVANT RUNBOOK:
 Title: {hit.payload.get('title')}
 Content:
 {content[:3000]}
-"""
+""", templates
             
         except Exception as e:
             print(f"RAG Failed: {e}")
-            return "Context retrieval failed."
+            return "Context retrieval failed.", []
 
-    def _run_diagnostics(self, commands: list) -> str:
-        """Execute kubectl commands with proper parsing and error handling."""
-        diagnostics = []
-        
-        print(f"DIAGNOSTICS: Executing {len(commands)} commands...")
+    def _fetch_runbook(self, bucket: str, filename: str) -> str:
+        """Fetch runbook content from MinIO."""
+        response = self.minio_client.get_object(bucket, filename)
+        try:
+            return response.read().decode('utf-8')
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def _run_diagnostics(self, commands: list, namespace: Optional[str] = None) -> str:
+        """
+        Execute kubectl commands concurrently with proper parsing and error handling.
         
+        Processes are bounded node-wide by DIAGNOSTICS_MAX_PROCS; once the
+        per-incident DIAGNOSTICS_DEADLINE_SECONDS passes, unfinished commands
+        are cancelled and whatever completed is returned. A command the API
+        server answers with NotFound invalidates `namespace`'s resource cache.
+        """
+        allowed = []
         for cmd in commands:
             # Security re-check
-            if not any(cmd.strip().startswith(allowed) for allowed in self.ALLOWED_COMMANDS):
+            if not any(cmd.strip().startswith(allowed_cmd) for allowed_cmd in self.ALLOWED_COMMANDS):
                 print(f"DIAGNOSTICS: BLOCKED (security): {cmd}")
                 continue
-            
-            try:
-                # Use shlex for proper shell-like parsing
-                # Handle pipes specially
-                if "|" in cmd:
-                    # For piped commands, use shell=True but only for safe commands
-                    result = subprocess.run(
-                        cmd,
-                        shell=True,
-                        capture_output=True, 
-                        text=True, 
-                        timeout=30
-                    )
-                else:
-                    # Parse command properly
-                    cmd_parts = shlex.split(cmd)
-                    result = subprocess.run(
-                        cmd_parts,
-                        capture_output=True, 
-                        text=True, 
-                        timeout=30
-                    )
-                
-                print(f"DIAGNOSTICS: Ran: {cmd[:80]}...")
-                
-                if result.returncode == 0 and result.stdout:
-                    output = result.stdout[:3000]
-                    diagnostics.append(f"=== {cmd} ===\n{output}")
-                elif result.stderr:
-                    # Include error info - helpful for LLM analysis
-                    error_msg = result.stderr[:500]
-                    diagnostics.append(f"=== {cmd} ===\nCommand failed: {error_msg}")
-                    print(f"DIAGNOSTICS: Error: {error_msg[:100]}")
-                else:
-                    diagnostics.append(f"=== {cmd} ===\n(No output)")
-                    
-            except subprocess.TimeoutExpired:
-                diagnostics.append(f"=== {cmd} ===\nTimeout after 30s")
-                print(f"DIAGNOSTICS: Timeout: {cmd}")
-            except ValueError as e:
-                # shlex parsing error
-                print(f"DIAGNOSTICS: Parse error for '{cmd}': {e}")
-                diagnostics.append(f"=== {cmd} ===\nParse error: {e}")
-            except Exception as e:
-                diagnostics.append(f"=== {cmd} ===\nFailed: {e}")
-                print(f"DIAGNOSTICS: Error: {e}")
+            allowed.append(cmd)
         
-        if not diagnostics:
+        if not allowed:
             return "No diagnostic information could be gathered."
         
+        print(f"DIAGNOSTICS: Executing {len(allowed)} commands...")
+        
+        tasks = [asyncio.ensure_future(self._run_diagnostic(cmd, namespace)) for cmd in allowed]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=self.diagnostics_deadline)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        if pending:
+            print(f"DIAGNOSTICS: Deadline of {self.diagnostics_deadline:.0f}s reached, {len(pending)} commands cancelled")
+        
+        diagnostics = []
+        for cmd, task in zip(allowed, tasks):
+            if task in done:
+                diagnostics.append(task.result())
+            else:
+                diagnostics.append(f"=== {cmd} ===\nNot finished within the {self.diagnostics_deadline:.0f}s diagnostics deadline")
+        
         return "\n\n".join(diagnostics)
 
+    def _diagnostics_semaphore(self) -> asyncio.Semaphore:
+        """Node-wide cap on concurrent diagnostics; created lazily on the agent loop."""
+        if self._diagnostics_slots is None:
+            self._diagnostics_slots = asyncio.Semaphore(self.diagnostics_max_procs)
+        return self._diagnostics_slots
+
+    async def _execute_diagnostic(self, cmd: str) -> tuple:
+        """Run a diagnostic command under the concurrency budget; returns (returncode, stdout, stderr)."""
+        async with self._diagnostics_semaphore():
+            result = await self.diagnostics.run(cmd, timeout=30, digest=self.diagnostics_digest)
+        
+        print(f"DIAGNOSTICS: Ran: {cmd[:80]}...")
+        return result
+
+    async def _run_diagnostic(self, cmd: str, namespace: Optional[str] = None) -> str:
+        """Run one diagnostic command and format its output section."""
+        try:
+            # Identical commands from concurrent/nearby incidents share one run;
+            # only successful output is cached
+            returncode, stdout, stderr = await self._diagnostic_cache.get_or_load(
+                " ".join(cmd.split()),
+                lambda: self._execute_diagnostic(cmd),
+                should_cache=lambda result: result[0] == 0
+            )
+            
+            # Discovered names went stale (pod replaced since listing): refresh next time
+            if namespace and returncode != 0 and NOT_FOUND_ERROR in stderr:
+                self._resource_cache.invalidate(namespace)
+            
+            if returncode == 0 and stdout:
+                output = stdout[:3000]
+                return f"=== {cmd} ===\n{output}"
+            if stderr:
+                # Include error info - helpful for LLM analysis
+                error_msg = stderr[:500]
+                print(f"DIAGNOSTICS: Error: {error_msg[:100]}")
+                return f"=== {cmd} ===\nCommand failed: {error_msg}"
+            return f"=== {cmd} ===\n(No output)"
+                
+        except asyncio.TimeoutError:
+            print(f"DIAGNOSTICS: Timeout: {cmd}")
+            return f"=== {cmd} ===\nTimeout after 30s"
+        except ValueError as e:
+            # Command parsing error
+            print(f"DIAGNOSTICS: Parse error for '{cmd}': {e}")
+            return f"=== {cmd} ===\nParse error: {e}"
+        except Exception as e:
+            print(f"DIAGNOSTICS: Error: {e}")
+            return f"=== {cmd} ===\nFailed: {e}"
+
     def _build_prompt(self, event, context: str, diagnostics: str) -> str:
         """Build the final analysis prompt."""
         return f"""You are a Senior Site Reliability Engineer (SRE). 
@@ -511,7 +774,7 @@ OUTPUT FORMAT (JSON only):
 }}
 """
 
-    def _parse_decision(self, llm_output: str, event) -> orchestrator_pb2.Decision:
+    async def _parse_decision(self, llm_output: str, event) -> orchestrator_pb2.Decision:
         """Parse LLM output into Decision protobuf with retry on failure."""
         decision = orchestrator_pb2.Decision()
         decision.decision_id = str(uuid.uuid4())
@@ -533,7 +796,7 @@ Original output:
 Return ONLY valid JSON in this format:
 {{"analysis": "...", "confidence_score": 0.5, "proposed_actions": []}}
 """
-                retry_response = self.llm.generate(retry_prompt)
+                retry_response = await self.llm.agenerate(retry_prompt, expect_json=True, json_schema=DECISION_SCHEMA)
                 data = self._extract_json(retry_response)
             except Exception as e:
                 print(f"PARSE: Retry failed: {e}")
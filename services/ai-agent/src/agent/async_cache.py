@@ -0,0 +1,90 @@
+"""
+Small in-memory TTL cache for the agent's event loop.
+Concurrent lookups for the same key share one in-flight load (single-flight),
+so a burst of incidents triggers one underlying call instead of many.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from prometheus_client import Counter
+
+CACHE_REQUESTS = Counter('orchestrator_agent_cache_requests_total', 'Agent cache lookups', ['cache', 'result'])
+
+
+class AsyncTTLCache:
+    """
+    TTL + LRU cache with single-flight loading.
+
+    Not thread-safe: all calls must come from the same event loop.
+
+    Usage:
+        cache = AsyncTTLCache("discovery", ttl=30)
+        value = await cache.get_or_load(key, lambda: fetch(key))
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 256):
+        """
+        Initialize the cache.
+
+        Args:
+            name: Label used in metrics
+            ttl: Seconds an entry stays fresh
+            max_entries: LRU bound on stored entries
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Return a fresh cached value, join an in-flight load, or start a new one.
+
+        Args:
+            key: Cache key
+            loader: Zero-arg coroutine factory producing the value
+            should_cache: Optional predicate; results it rejects are returned but not stored
+        """
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            CACHE_REQUESTS.labels(cache=self.name, result="hit").inc()
+            return entry[1]
+
+        task = self._in_flight.get(key)
+        if task:
+            CACHE_REQUESTS.labels(cache=self.name, result="coalesced").inc()
+        else:
+            CACHE_REQUESTS.labels(cache=self.name, result="miss").inc()
+            task = asyncio.ensure_future(loader())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._on_loaded(key, t, should_cache))
+
+        # Shield so one cancelled waiter does not cancel the shared load
+        return await asyncio.shield(task)
+
+    def _on_loaded(self, key: Hashable, task: asyncio.Task, should_cache) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        value = task.result()
+        if should_cache and not should_cache(value):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a cached entry so the next lookup reloads it."""
+        self._entries.pop(key, None)
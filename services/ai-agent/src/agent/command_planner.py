@@ -0,0 +1,170 @@
+"""
+Deterministic diagnostic command planning.
+Turns the kubectl commands quoted in a runbook into concrete, read-only
+commands for the resources matched to an alert, without an LLM call.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from agent.diagnostics_backend import RESOURCES
+
+# Read-only kubectl verbs a plan may contain
+READ_ONLY_VERBS = ("get", "describe", "logs", "top")
+
+# Inline code spans in markdown runbooks
+_CODE_SPAN = re.compile(r'`(kubectl [^`\n]+)`')
+_PLACEHOLDER = re.compile(r'<([^<>\s]+)>')
+# Anything outside this set could reach a shell (pipes, substitutions, redirects)
+_SAFE_COMMAND = re.compile(r'^[A-Za-z0-9 _\-=./:,]+$')
+_K8S_NAME = re.compile(r'^[a-z0-9]([-a-z0-9.]*[a-z0-9])?$')
+_NAMESPACE_FLAG = re.compile(r'(^|\s)(-n|--namespace|-A|--all-namespaces)(\s|=|$)')
+_SELECTOR = re.compile(r'(^|\s)(-l|--selector)(\s+|=)(\S+)')
+# Label keys that name an application; other selector terms are never rewritten
+_APP_LABELS = ("app", "app.kubernetes.io/name", "k8s-app")
+
+# Kinds the agent's ClusterRole grants get/list on (deploy/helm/orchestrator/
+# templates/ai-agent.yaml); the API backend maps exactly these
+READABLE_RESOURCES = set(RESOURCES)
+
+EVENTS_COMMAND = "kubectl get events -n {namespace} --sort-by=.lastTimestamp | tail -20"
+
+
+def extract_command_templates(text: str) -> List[str]:
+    """
+    Return the read-only kubectl commands quoted in a runbook, in order, deduplicated.
+
+    Placeholders such as <pod-name> are kept for plan_commands() to fill in;
+    remediation commands (scale, delete, exec, ...) are dropped.
+    """
+    templates = []
+    for match in _CODE_SPAN.finditer(text or ""):
+        command = " ".join(match.group(1).split())
+        parts = command.split()
+        if len(parts) < 2 or parts[1] not in READ_ONLY_VERBS:
+            continue
+        if not _SAFE_COMMAND.match(_PLACEHOLDER.sub("x", command)):
+            continue
+        if command not in templates:
+            templates.append(command)
+    return templates
+
+
+def plan_commands(
+    templates: List[str],
+    namespace: str,
+    matching: Dict[str, List[str]],
+    service_name: str = "",
+    limit: int = 5,
+) -> List[str]:
+    """
+    Instantiate command templates against the resources matched to an alert.
+
+    Placeholders are filled from the best-matching pod or deployment, app
+    label selectors are pointed at the alerting service (selectors in
+    templates that pin their own namespace name a fixed component and are
+    kept), logs are capped with --tail and the namespace is added when the
+    template has none. Templates with placeholders or selectors that cannot
+    be resolved, or for resources the agent may not read, are skipped.
+
+    Returns:
+        Up to `limit` commands, ending with recent namespace events when
+        there is room; empty unless at least one command targets the
+        alerting service's own resources
+    """
+    values = {
+        "pod": (matching.get("pods") or [None])[0],
+        "deployment": (matching.get("deployments") or [None])[0],
+        "service": service_name if _K8S_NAME.match(service_name or "") else None,
+    }
+
+    commands = []
+    specific = False
+    for template in templates:
+        if not readable(template):
+            continue
+        planned = _instantiate(template, namespace, values)
+        if planned is None:
+            continue
+        command, targeted = planned
+        if command not in commands and len(commands) < limit:
+            commands.append(command)
+            specific = specific or targeted
+
+    if not specific:
+        return []
+    if len(commands) < limit and not any(c.startswith("kubectl get events") for c in commands):
+        commands.append(EVENTS_COMMAND.format(namespace=namespace))
+    return commands
+
+
+def readable(command: str) -> bool:
+    """Whether the agent's ServiceAccount may read what the command asks for."""
+    parts = command.split()
+    if parts[1] == "logs":
+        return True
+    positional = [p for p in parts[2:] if not p.startswith("-")]
+    if not positional:
+        return False
+    kinds = positional[0].split("/")[0].lower()
+    return all(kind in READABLE_RESOURCES for kind in kinds.split(","))
+
+
+def _instantiate(template: str, namespace: str, values: Dict[str, Optional[str]]) -> Optional[Tuple[str, bool]]:
+    """(command, targets the alerting service) or None if the template cannot be resolved."""
+    unresolved = []
+    filled = []
+
+    def fill(match):
+        value = _placeholder_value(match.group(1).lower(), values)
+        if value is None:
+            unresolved.append(match.group(1))
+            return match.group(0)
+        filled.append(value)
+        return value
+
+    command = _PLACEHOLDER.sub(fill, template)
+    if unresolved:
+        return None
+
+    targeted = bool(filled)
+    pinned = bool(_NAMESPACE_FLAG.search(command))
+    selector = _SELECTOR.search(command)
+    if selector and not pinned:
+        resolved = _resolve_selector(selector.group(4), values)
+        if resolved is None:
+            return None
+        command = command[:selector.start(4)] + resolved + command[selector.end(4):]
+        targeted = True
+
+    parts = command.split()
+    if parts[1] == "logs" and "--tail" not in command:
+        command += " --tail=100"
+    if not pinned:
+        command += f" -n {namespace}"
+    return command, targeted
+
+
+def _resolve_selector(selector: str, values: Dict[str, Optional[str]]) -> Optional[str]:
+    """Point app-label terms at the alerting service; None if a term names something else."""
+    target = values["service"] or values["deployment"]
+    own = {v for v in (values["service"], values["deployment"]) if v}
+    terms = []
+    for term in selector.split(","):
+        key, eq, value = term.partition("=")
+        if eq and value in own:
+            terms.append(term)
+        elif eq and key in _APP_LABELS and target:
+            terms.append(f"{key}={target}")
+        else:
+            return None
+    return ",".join(terms)
+
+
+def _placeholder_value(name: str, values: Dict[str, Optional[str]]) -> Optional[str]:
+    """Resolve a placeholder such as "pod-name" or "deployment-name"; None if unknown."""
+    if "pod" in name:
+        return values["pod"]
+    if "deployment" in name or name in ("name", "app", "service", "service-name"):
+        return values["deployment"] or values["service"]
+    return None
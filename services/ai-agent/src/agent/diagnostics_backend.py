@@ -0,0 +1,906 @@
+"""
+Backends that execute whitelisted diagnostic commands.
+KubectlBackend forks kubectl (piped commands through a shell); KubeApiBackend
+maps get/describe/logs/top onto direct Kubernetes API calls over a pooled
+keep-alive HTTP client and applies `| head`/`| tail` itself, so no process or
+shell is involved.
+"""
+
+import asyncio
+import json
+import os
+import shlex
+import signal
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from agent.log_digest import OutputDigest, output_digest
+from prometheus_client import Counter
+
+DIGEST_CHARS = Counter('orchestrator_agent_diagnostic_digest_chars_total', 'Diagnostic output size before and after digesting', ['stage'])
+
+# Output kept per command: the start and the most recent end of the stream
+OUTPUT_HEAD_BYTES = 1000
+OUTPUT_TAIL_BYTES = 1900
+STDERR_HEAD_BYTES = 500
+STDERR_TAIL_BYTES = 0
+READ_CHUNK_BYTES = 64 * 1024
+
+# stderr prefix for a missing object, from kubectl and KubeApiError alike
+NOT_FOUND_ERROR = "Error from server (NotFound)"
+
+
+class BoundedOutput:
+    """
+    Keeps the first `head_bytes` and last `tail_bytes` of a byte stream.
+
+    Memory stays bounded however much is written; `total` counts every byte
+    seen so the omitted span can be reported.
+
+    Usage:
+        out = BoundedOutput(1000, 1900)
+        out.write(chunk)
+        text = out.text()
+    """
+
+    def __init__(self, head_bytes: int = OUTPUT_HEAD_BYTES, tail_bytes: int = OUTPUT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self._head = bytearray()
+        self._tail = bytearray()
+        self.total = 0
+        self.stopped = False  # set when the producer was cut off at the byte budget
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_bytes - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if data and self.tail_bytes:
+            self._tail += data
+            if len(self._tail) > self.tail_bytes:
+                del self._tail[:-self.tail_bytes]
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self._head) - len(self._tail)
+
+    def text(self) -> str:
+        """Decoded head and tail with a marker for the omitted middle."""
+        head = self._head.decode('utf-8', errors='replace')
+        tail = bytes(self._tail)
+        omitted = self.omitted
+        if omitted:
+            # Start the tail window on a whole line
+            newline = tail.find(b"\n")
+            if 0 <= newline < len(tail) - 1:
+                omitted += newline + 1
+                tail = tail[newline + 1:]
+        text = head
+        if omitted:
+            text += f"\n... [{omitted} bytes omitted] ...\n"
+        text += tail.decode('utf-8', errors='replace')
+        if self.stopped:
+            text += f"\n[output stopped after {self.total} bytes]"
+        return text
+
+
+def bounded_text(raw: BoundedOutput, digest: Optional[OutputDigest] = None) -> str:
+    """
+    The output kept for a command: its digest when one was fed the full
+    stream and is shorter, otherwise the raw head/tail windows. The digest is
+    capped by the same windows.
+    """
+    if digest is None:
+        return raw.text()
+    summary = digest.finish()
+    if summary is None or len(summary) >= raw.total:
+        text = raw.text()
+    else:
+        capped = BoundedOutput(raw.head_bytes, raw.tail_bytes)
+        capped.write(summary.encode('utf-8'))
+        text = capped.text()
+        if raw.stopped:
+            text += f"\n[output stopped after {raw.total} bytes]"
+    DIGEST_CHARS.labels(stage="raw").inc(raw.total)
+    DIGEST_CHARS.labels(stage="digest").inc(len(text))
+    return text
+
+
+async def run_process(
+    args: list,
+    timeout: float,
+    max_bytes: Optional[int] = None,
+    digest: Optional[OutputDigest] = None
+) -> tuple:
+    """
+    Run a command as an asyncio subprocess.
+
+    Args:
+        args: Command and arguments
+        timeout: Seconds before the process is killed
+        max_bytes: Stream the output through head/tail windows and kill the
+            process after this many stdout bytes (None = capture everything)
+        digest: Fed the full stdout stream when max_bytes is set; see communicate_bounded()
+
+    Returns:
+        (returncode, stdout, stderr) with output decoded as text
+
+    Raises:
+        asyncio.TimeoutError: If the command does not finish in time
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=max_bytes is not None
+    )
+    if max_bytes is None:
+        return await communicate(proc, timeout)
+    return await communicate_bounded(proc, timeout, max_bytes, digest)
+
+
+async def communicate(proc, timeout: float) -> tuple:
+    """Collect output from a subprocess, killing it on timeout or cancellation."""
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    except asyncio.CancelledError:
+        # Diagnostics deadline: don't leave the process running
+        proc.kill()
+        raise
+    return (
+        proc.returncode,
+        stdout.decode('utf-8', errors='replace'),
+        stderr.decode('utf-8', errors='replace')
+    )
+
+
+async def communicate_bounded(
+    proc,
+    timeout: float,
+    max_bytes: int,
+    digest: Optional[OutputDigest] = None
+) -> tuple:
+    """
+    Stream a subprocess's output through BoundedOutput windows.
+
+    Once `max_bytes` of stdout have been read the process is killed, so a
+    `kubectl logs` on a chatty pod never pulls the whole log into memory.
+    A process stopped this way reports returncode 0 with its partial output.
+    The process should lead its own session (start_new_session=True) so
+    that the kill reaches every stage of a shell pipeline.
+
+    With a `digest`, every stdout chunk is also fed to it before windowing,
+    and a successful command returns the (capped) digest instead.
+    """
+    stdout = BoundedOutput(OUTPUT_HEAD_BYTES, OUTPUT_TAIL_BYTES)
+    stderr = BoundedOutput(STDERR_HEAD_BYTES, STDERR_TAIL_BYTES)
+
+    async def pump(stream, sink: BoundedOutput, budget: Optional[int], digest=None) -> None:
+        while True:
+            chunk = await stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                return
+            sink.write(chunk)
+            if digest is not None:
+                digest.feed(chunk)
+            if budget is not None and sink.total >= budget:
+                sink.stopped = True
+                _kill_group(proc)
+                return
+
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            pump(proc.stdout, stdout, max_bytes, digest),
+            pump(proc.stderr, stderr, max_bytes)
+        ), timeout=timeout)
+        await proc.wait()
+    except asyncio.TimeoutError:
+        _kill_group(proc)
+        await proc.wait()
+        raise
+    except asyncio.CancelledError:
+        # Diagnostics deadline: don't leave the process running
+        _kill_group(proc)
+        raise
+    returncode = 0 if stdout.stopped else proc.returncode
+    return returncode, bounded_text(stdout, digest if returncode == 0 else None), stderr.text()
+
+
+def _kill_group(proc) -> None:
+    """Kill a process and everything in its process group."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # Already gone, or not a group leader
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+class DiagnosticsBackend(ABC):
+    """Executes one whitelisted diagnostic command."""
+
+    name = "base"
+
+    @abstractmethod
+    async def run(self, cmd: str, timeout: float, digest: bool = False) -> tuple:
+        """
+        Execute a command.
+
+        Args:
+            cmd: Whitelisted kubectl command
+            timeout: Seconds before the command is abandoned
+            digest: Digest stdout (see agent.log_digest) from the full output,
+                before it is cut to the head/tail windows
+
+        Returns:
+            (returncode, stdout, stderr)
+
+        Raises:
+            asyncio.TimeoutError: If the command does not finish in time
+            ValueError: If the command cannot be parsed
+        """
+
+    async def close(self) -> None:
+        """Release pooled resources."""
+
+
+class KubectlBackend(DiagnosticsBackend):
+    """Runs commands with the kubectl binary, streaming output under a byte budget."""
+
+    name = "kubectl"
+
+    def __init__(self, max_output_bytes: int = 1024 * 1024):
+        self.max_output_bytes = max_output_bytes
+
+    async def run(self, cmd: str, timeout: float, digest: bool = False) -> tuple:
+        stream_digest = output_digest(cmd) if digest else None
+        # Use shlex for proper shell-like parsing
+        # Handle pipes specially
+        if "|" in cmd:
+            # For piped commands, use a shell but only for safe commands
+            proc = await asyncio.create_subprocess_shell(
+                cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+            return await communicate_bounded(proc, timeout, self.max_output_bytes, stream_digest)
+        # Parse command properly
+        return await run_process(shlex.split(cmd), timeout, max_bytes=self.max_output_bytes, digest=stream_digest)
+
+
+class UnsupportedCommand(Exception):
+    """The command uses a resource, flag or pipe the API backend does not implement."""
+
+
+@dataclass
+class KubectlCommand:
+    """A parsed read-only kubectl command."""
+    verb: str
+    resource: str = ""
+    name: str = ""
+    namespace: str = "default"
+    all_namespaces: bool = False
+    selector: str = ""
+    tail: Optional[int] = None
+    previous: bool = False
+    container: str = ""
+    sort_by: str = ""
+    # ("head" | "tail", lines) applied to stdout in order
+    pipes: List[Tuple[str, int]] = field(default_factory=list)
+
+
+# kubectl resource name/alias -> (plural, API prefix, namespaced)
+RESOURCES: Dict[str, Tuple[str, str, bool]] = {}
+for _aliases, _plural, _prefix, _namespaced in [
+    (("pods", "pod", "po"), "pods", "/api/v1", True),
+    (("deployments", "deployment", "deploy"), "deployments", "/apis/apps/v1", True),
+    (("replicasets", "replicaset", "rs"), "replicasets", "/apis/apps/v1", True),
+    (("services", "service", "svc"), "services", "/api/v1", True),
+    (("events", "event", "ev"), "events", "/api/v1", True),
+    (("persistentvolumeclaims", "persistentvolumeclaim", "pvc"), "persistentvolumeclaims", "/api/v1", True),
+    (("nodes", "node", "no"), "nodes", "/api/v1", False),
+]:
+    for _alias in _aliases:
+        RESOURCES[_alias] = (_plural, _prefix, _namespaced)
+
+
+def parse_command(cmd: str) -> KubectlCommand:
+    """
+    Parse a whitelisted kubectl command (optionally piped into head/tail).
+
+    Raises:
+        UnsupportedCommand: For anything the API backend cannot serve natively
+        ValueError: If the command cannot be tokenized
+    """
+    stages = cmd.split("|")
+    args = shlex.split(stages[0])
+    if len(args) < 2 or args[0] != "kubectl":
+        raise UnsupportedCommand("not a kubectl command")
+
+    parsed = KubectlCommand(verb=args[1])
+    if parsed.verb not in ("get", "describe", "logs", "top"):
+        raise UnsupportedCommand(f"verb '{parsed.verb}'")
+
+    positional = []
+    rest = args[2:]
+    i = 0
+    while i < len(rest):
+        arg = rest[i]
+        flag, eq, inline = arg.partition("=")
+
+        def value():
+            nonlocal i
+            if eq:
+                return inline
+            i += 1
+            if i >= len(rest):
+                raise UnsupportedCommand(f"missing value for {flag}")
+            return rest[i]
+
+        if flag in ("-n", "--namespace"):
+            parsed.namespace = value()
+        elif arg in ("-A", "--all-namespaces"):
+            parsed.all_namespaces = True
+        elif flag in ("-l", "--selector"):
+            parsed.selector = value()
+        elif flag == "--tail":
+            parsed.tail = int(value())
+        elif arg in ("-p", "--previous", "--previous=true"):
+            parsed.previous = True
+        elif flag in ("-c", "--container"):
+            parsed.container = value()
+        elif flag == "--sort-by":
+            parsed.sort_by = value()
+        elif arg.startswith("-"):
+            raise UnsupportedCommand(f"flag '{arg}'")
+        else:
+            positional.append(arg)
+        i += 1
+
+    if parsed.verb == "logs":
+        target = positional[0] if positional else ""
+        kind, slash, name = target.rpartition("/")
+        if slash and kind not in ("pod", "pods", "po"):
+            raise UnsupportedCommand(f"logs for '{kind}'")
+        parsed.resource, parsed.name = "pods", name
+        if not parsed.name and not parsed.selector:
+            raise UnsupportedCommand("logs without a pod or selector")
+    else:
+        if not positional:
+            raise UnsupportedCommand("missing resource type")
+        resource, slash, name = positional[0].partition("/")
+        if "," in resource or resource not in RESOURCES:
+            raise UnsupportedCommand(f"resource '{positional[0]}'")
+        parsed.resource = RESOURCES[resource][0]
+        parsed.name = name or (positional[1] if len(positional) > 1 else "")
+        if parsed.verb == "top" and parsed.resource not in ("pods", "nodes"):
+            raise UnsupportedCommand(f"top {resource}")
+
+    for stage in stages[1:]:
+        parts = shlex.split(stage)
+        if not parts or parts[0] not in ("head", "tail"):
+            raise UnsupportedCommand(f"pipe '{stage.strip()}'")
+        if len(parts) == 2 and parts[1].startswith("-") and parts[1][1:].isdigit():
+            lines = int(parts[1][1:])
+        elif len(parts) == 3 and parts[1] == "-n" and parts[2].isdigit():
+            lines = int(parts[2])
+        elif len(parts) == 1:
+            lines = 10
+        else:
+            raise UnsupportedCommand(f"pipe '{stage.strip()}'")
+        parsed.pipes.append((parts[0], lines))
+    return parsed
+
+
+class KubeApiError(Exception):
+    """Non-2xx response from the API server, rendered like kubectl's error line."""
+
+    def __init__(self, status: int, reason: str, message: str):
+        super().__init__(f"Error from server ({reason}): {message}")
+        self.status = status
+
+
+class KubeApiBackend(DiagnosticsBackend):
+    """
+    Serves get/describe/logs/top from the Kubernetes API directly.
+
+    Uses the pod's service account (in-cluster) or an explicit base URL such as
+    the fake API server in scripts/fake_kube_api.py. Commands it cannot map
+    (CRDs, -o, unknown pipes, ...) go to `fallback` when one is configured.
+
+    Usage:
+        backend = KubeApiBackend.from_env(fallback=KubectlBackend())
+        returncode, stdout, stderr = await backend.run("kubectl get pods -n prod", timeout=30)
+    """
+
+    name = "api"
+
+    SA_DIR = "/var/run/secrets/kubernetes.io/serviceaccount"
+    # Bound service account tokens rotate; re-read the file this often
+    TOKEN_REFRESH_SECONDS = 60
+    # Pods whose logs are fetched for `logs -l <selector>`
+    MAX_SELECTOR_PODS = 5
+
+    def __init__(
+        self,
+        base_url: str,
+        token_path: Optional[str] = None,
+        ca_path: Optional[str] = None,
+        max_connections: int = 10,
+        fallback: Optional[DiagnosticsBackend] = None,
+        max_output_bytes: int = 1024 * 1024
+    ):
+        """
+        Initialize the backend.
+
+        Args:
+            base_url: API server URL
+            token_path: Bearer token file (None = no auth header)
+            ca_path: CA bundle for TLS verification (None = system CAs)
+            max_connections: Connection pool size
+            fallback: Backend for commands that cannot be served natively
+            max_output_bytes: Log bytes requested from the server (limitBytes)
+        """
+        self.base_url = base_url.rstrip("/")
+        self.token_path = token_path
+        self.ca_path = ca_path
+        self.max_connections = max_connections
+        self.fallback = fallback
+        self.max_output_bytes = max_output_bytes
+        self._client = None
+        self._token = None
+        self._token_read_at = 0.0
+
+    @classmethod
+    def from_env(cls, fallback: Optional[DiagnosticsBackend] = None, **kwargs) -> "KubeApiBackend":
+        """KUBE_API_URL if set (no auth), otherwise the in-cluster service account."""
+        url = os.getenv("KUBE_API_URL")
+        if url:
+            return cls(url, fallback=fallback, **kwargs)
+        host = os.getenv("KUBERNETES_SERVICE_HOST")
+        port = os.getenv("KUBERNETES_SERVICE_PORT", "443")
+        if not host:
+            raise RuntimeError("not running in a cluster and KUBE_API_URL is not set")
+        return cls(
+            f"https://{host}:{port}",
+            token_path=os.path.join(cls.SA_DIR, "token"),
+            ca_path=os.path.join(cls.SA_DIR, "ca.crt"),
+            fallback=fallback,
+            **kwargs
+        )
+
+    async def run(self, cmd: str, timeout: float, digest: bool = False) -> tuple:
+        try:
+            parsed = parse_command(cmd)
+        except UnsupportedCommand as e:
+            if self.fallback:
+                print(f"DIAGNOSTICS: API backend cannot serve {e}, using {self.fallback.name}")
+                return await self.fallback.run(cmd, timeout, digest=digest)
+            return 1, "", f"error: unsupported by API backend: {e}"
+
+        import httpx
+
+        try:
+            stdout = await asyncio.wait_for(self._execute(parsed), timeout=timeout)
+        except KubeApiError as e:
+            return 1, "", str(e)
+        except httpx.TimeoutException:
+            raise asyncio.TimeoutError()
+        except httpx.HTTPError as e:
+            return 1, "", f"Unable to connect to the server: {e}"
+
+        for kind, lines in parsed.pipes:
+            rows = stdout.splitlines()
+            rows = rows[:lines] if kind == "head" else rows[-lines:] if lines else []
+            stdout = "\n".join(rows) + ("\n" if rows else "")
+        # Same head/tail windows (and digest of the full text) as subprocess output
+        data = stdout.encode('utf-8')
+        output = BoundedOutput()
+        output.write(data)
+        stream_digest = output_digest(cmd) if digest else None
+        if stream_digest is not None:
+            stream_digest.feed(data)
+        return 0, bounded_text(output, stream_digest), ""
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # --- HTTP -------------------------------------------------------------
+
+    def _http(self):
+        # Created lazily so it binds to the agent's event loop
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                verify=self.ca_path if self.ca_path and os.path.exists(self.ca_path) else True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=30.0
+            )
+        return self._client
+
+    def _headers(self) -> dict:
+        if not self.token_path:
+            return {}
+        now = time.monotonic()
+        if self._token is None or now - self._token_read_at > self.TOKEN_REFRESH_SECONDS:
+            with open(self.token_path) as f:
+                self._token = f.read().strip()
+            self._token_read_at = now
+        return {"Authorization": f"Bearer {self._token}"}
+
+    async def _request(self, path: str, params: Optional[dict] = None, text: bool = False):
+        response = await self._http().get(path, params=params or None, headers=self._headers())
+        if response.status_code >= 400:
+            try:
+                status = response.json()
+                reason, message = status.get("reason", "Unknown"), status.get("message", response.text)
+            except ValueError:
+                reason, message = response.reason_phrase, response.text.strip()
+            raise KubeApiError(response.status_code, reason, message)
+        return response.text if text else response.json()
+
+    def _path(self, cmd: KubectlCommand, resource: Optional[str] = None, name: str = "") -> str:
+        plural, prefix, namespaced = RESOURCES[resource or cmd.resource]
+        path = prefix
+        if namespaced and not cmd.all_namespaces:
+            path += f"/namespaces/{cmd.namespace}"
+        path += f"/{plural}"
+        return f"{path}/{name}" if name else path
+
+    async def _list(self, cmd: KubectlCommand, resource: Optional[str] = None, selector: str = "") -> List[dict]:
+        params = {"labelSelector": selector} if selector else None
+        return (await self._request(self._path(cmd, resource), params)).get("items", [])
+
+    # --- verbs ------------------------------------------------------------
+
+    async def _execute(self, cmd: KubectlCommand) -> str:
+        if cmd.verb == "logs":
+            return await self._logs(cmd)
+        if cmd.verb == "top":
+            return await self._top(cmd)
+        if cmd.name:
+            items = [await self._request(self._path(cmd, name=cmd.name))]
+        else:
+            items = await self._list(cmd, selector=cmd.selector)
+        if cmd.verb == "describe":
+            sections = [await self._describe(cmd, item) for item in items[:5]]
+            return "\n\n".join(sections) + "\n"
+        return render_table(cmd.resource, items, cmd.sort_by, cmd.all_namespaces)
+
+    async def _logs(self, cmd: KubectlCommand) -> str:
+        params = {}
+        if cmd.tail is not None:
+            params["tailLines"] = cmd.tail
+        if cmd.previous:
+            params["previous"] = "true"
+        if cmd.container:
+            params["container"] = cmd.container
+
+        if cmd.name:
+            # The server stops reading the log at limitBytes
+            params["limitBytes"] = self.max_output_bytes
+            return await self._request(self._path(cmd, name=cmd.name) + "/log", params, text=True)
+
+        pods = [p["metadata"]["name"] for p in await self._list(cmd, selector=cmd.selector)]
+        if not pods:
+            return "No resources found.\n"
+        pods = pods[:self.MAX_SELECTOR_PODS]
+        params["limitBytes"] = max(1, self.max_output_bytes // len(pods))
+        logs = await asyncio.gather(*(
+            self._request(self._path(cmd, name=pod) + "/log", params, text=True) for pod in pods
+        ), return_exceptions=True)
+        sections = []
+        for pod, log in zip(pods, logs):
+            body = str(log) if isinstance(log, Exception) else log.rstrip("\n")
+            sections.append(f"==> {pod} <==\n{body}")
+        return "\n".join(sections) + "\n"
+
+    async def _top(self, cmd: KubectlCommand) -> str:
+        path = "/apis/metrics.k8s.io/v1beta1"
+        if cmd.resource == "pods":
+            path += "" if cmd.all_namespaces else f"/namespaces/{cmd.namespace}"
+        path += f"/{cmd.resource}"
+        if cmd.name:
+            items = [await self._request(f"{path}/{cmd.name}")]
+        else:
+            params = {"labelSelector": cmd.selector} if cmd.selector else None
+            items = (await self._request(path, params)).get("items", [])
+
+        rows = []
+        for item in items:
+            usages = [c.get("usage", {}) for c in item.get("containers", [])] or [item.get("usage", {})]
+            cpu = sum(cpu_millicores(u.get("cpu", "0")) for u in usages)
+            memory = sum(memory_bytes(u.get("memory", "0")) for u in usages)
+            rows.append((item["metadata"]["name"], cpu, memory))
+        if "memory" in cmd.sort_by:
+            rows.sort(key=lambda r: -r[2])
+        elif "cpu" in cmd.sort_by:
+            rows.sort(key=lambda r: -r[1])
+        return format_table(
+            ["NAME", "CPU(cores)", "MEMORY(bytes)"],
+            [[name, f"{cpu:.0f}m", f"{memory / 2**20:.0f}Mi"] for name, cpu, memory in rows]
+        )
+
+    async def _describe(self, cmd: KubectlCommand, obj: dict) -> str:
+        meta = obj.get("metadata", {})
+        lines = [f"Name: {meta.get('name')}"]
+        if meta.get("namespace"):
+            lines.append(f"Namespace: {meta['namespace']}")
+        if meta.get("labels"):
+            lines.append("Labels: " + ", ".join(f"{k}={v}" for k, v in meta["labels"].items()))
+
+        spec, status = obj.get("spec", {}), obj.get("status", {})
+        if cmd.resource == "pods":
+            lines += describe_pod(spec, status)
+        elif cmd.resource == "deployments":
+            lines += describe_deployment(spec, status)
+        elif cmd.resource == "nodes":
+            lines += describe_node(status)
+        elif status:
+            lines.append(f"Status: {json.dumps(status, separators=(',', ':'))[:1000]}")
+
+        if meta.get("namespace") and cmd.resource != "events":
+            selector = f"involvedObject.name={meta['name']}"
+            events = (await self._request(
+                f"/api/v1/namespaces/{meta['namespace']}/events", {"fieldSelector": selector}
+            )).get("items", [])
+            lines.append("Events:")
+            if not events:
+                lines.append("  <none>")
+            for event in sorted(events, key=event_time)[-10:]:
+                lines.append(
+                    f"  {age(event_time(event))} {event.get('type', '')} {event.get('reason', '')}"
+                    f" (x{event.get('count', 1)}): {event.get('message', '').strip()}"
+                )
+        return "\n".join(lines)
+
+
+# --- rendering ---------------------------------------------------------------
+
+def format_table(headers: List[str], rows: List[List[str]]) -> str:
+    """Left-aligned columns like kubectl's default output."""
+    if not rows:
+        return "No resources found.\n"
+    widths = [max(len(str(r[i])) for r in [headers] + rows) for i in range(len(headers))]
+    return "".join(
+        "   ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip() + "\n"
+        for row in [headers] + rows
+    )
+
+
+def render_table(resource: str, items: List[dict], sort_by: str = "", with_namespace: bool = False) -> str:
+    """Render a `kubectl get` listing for the supported resources."""
+    if resource == "events":
+        items = sorted(items, key=event_time)
+        headers = ["LAST SEEN", "TYPE", "REASON", "OBJECT", "MESSAGE"]
+        rows = [[
+            age(event_time(e)), e.get("type", ""), e.get("reason", ""),
+            f"{e.get('involvedObject', {}).get('kind', '').lower()}/{e.get('involvedObject', {}).get('name', '')}",
+            " ".join(e.get("message", "").split())[:200],
+        ] for e in items]
+    else:
+        headers, row = _COLUMNS.get(resource, (["NAME", "AGE"], lambda o: [o["metadata"]["name"], _created(o)]))
+        rows = [row(item) for item in items]
+    if with_namespace:
+        headers = ["NAMESPACE"] + headers
+        rows = [[item.get("metadata", {}).get("namespace", "")] + r for item, r in zip(items, rows)]
+    return format_table(headers, rows)
+
+
+def _created(obj: dict) -> str:
+    return age(parse_time(obj.get("metadata", {}).get("creationTimestamp")))
+
+
+def _pod_row(pod: dict) -> List[str]:
+    statuses = pod.get("status", {}).get("containerStatuses", [])
+    ready = sum(1 for s in statuses if s.get("ready"))
+    restarts = sum(s.get("restartCount", 0) for s in statuses)
+    return [pod["metadata"]["name"], f"{ready}/{len(statuses)}", pod_status(pod), str(restarts), _created(pod)]
+
+
+def _deployment_row(d: dict) -> List[str]:
+    spec, status = d.get("spec", {}), d.get("status", {})
+    return [
+        d["metadata"]["name"], f"{status.get('readyReplicas', 0)}/{spec.get('replicas', 0)}",
+        str(status.get("updatedReplicas", 0)), str(status.get("availableReplicas", 0)), _created(d),
+    ]
+
+
+def _replicaset_row(rs: dict) -> List[str]:
+    spec, status = rs.get("spec", {}), rs.get("status", {})
+    return [
+        rs["metadata"]["name"], str(spec.get("replicas", 0)), str(status.get("replicas", 0)),
+        str(status.get("readyReplicas", 0)), _created(rs),
+    ]
+
+
+def _service_row(svc: dict) -> List[str]:
+    spec = svc.get("spec", {})
+    ports = ",".join(f"{p.get('port')}/{p.get('protocol', 'TCP')}" for p in spec.get("ports", []))
+    return [svc["metadata"]["name"], spec.get("type", ""), spec.get("clusterIP", ""), ports or "<none>", _created(svc)]
+
+
+def _pvc_row(pvc: dict) -> List[str]:
+    status = pvc.get("status", {})
+    return [
+        pvc["metadata"]["name"], status.get("phase", ""), pvc.get("spec", {}).get("volumeName", ""),
+        status.get("capacity", {}).get("storage", ""), _created(pvc),
+    ]
+
+
+def _node_row(node: dict) -> List[str]:
+    ready = next((c for c in node.get("status", {}).get("conditions", []) if c.get("type") == "Ready"), {})
+    state = "Ready" if ready.get("status") == "True" else "NotReady"
+    version = node.get("status", {}).get("nodeInfo", {}).get("kubeletVersion", "")
+    return [node["metadata"]["name"], state, _created(node), version]
+
+
+_COLUMNS = {
+    "pods": (["NAME", "READY", "STATUS", "RESTARTS", "AGE"], _pod_row),
+    "deployments": (["NAME", "READY", "UP-TO-DATE", "AVAILABLE", "AGE"], _deployment_row),
+    "replicasets": (["NAME", "DESIRED", "CURRENT", "READY", "AGE"], _replicaset_row),
+    "services": (["NAME", "TYPE", "CLUSTER-IP", "PORT(S)", "AGE"], _service_row),
+    "persistentvolumeclaims": (["NAME", "STATUS", "VOLUME", "CAPACITY", "AGE"], _pvc_row),
+    "nodes": (["NAME", "STATUS", "AGE", "VERSION"], _node_row),
+}
+
+
+def pod_status(pod: dict) -> str:
+    """The STATUS column: a container's waiting/terminated reason wins over the phase."""
+    status = pod.get("status", {})
+    for container in status.get("containerStatuses", []):
+        state = container.get("state", {})
+        for key in ("waiting", "terminated"):
+            if state.get(key, {}).get("reason"):
+                return state[key]["reason"]
+    return status.get("reason") or status.get("phase", "Unknown")
+
+
+def _container_state(state: dict) -> str:
+    if not state:
+        return "<none>"
+    key, detail = next(iter(state.items()))
+    parts = [detail.get("reason", "")]
+    if "exitCode" in detail:
+        parts.append(f"exit code {detail['exitCode']}")
+    text = ", ".join(p for p in parts if p)
+    return f"{key.capitalize()} ({text})" if text else key.capitalize()
+
+
+def describe_pod(spec: dict, status: dict) -> List[str]:
+    lines = [f"Node: {spec.get('nodeName', '<none>')}", f"Status: {status.get('phase', 'Unknown')}"]
+    if status.get("reason") or status.get("message"):
+        lines.append(f"Reason: {status.get('reason', '')} {status.get('message', '')}".rstrip())
+    statuses = {s["name"]: s for s in status.get("containerStatuses", [])}
+    lines.append("Containers:")
+    for container in spec.get("containers", []):
+        cs = statuses.get(container["name"], {})
+        lines.append(
+            f"  {container['name']}: image={container.get('image')} ready={cs.get('ready', False)}"
+            f" restarts={cs.get('restartCount', 0)}"
+        )
+        lines.append(f"    State: {_container_state(cs.get('state', {}))}")
+        if cs.get("lastState"):
+            lines.append(f"    Last State: {_container_state(cs['lastState'])}")
+        limits = container.get("resources", {}).get("limits")
+        if limits:
+            lines.append("    Limits: " + ", ".join(f"{k}={v}" for k, v in limits.items()))
+    conditions = status.get("conditions", [])
+    if conditions:
+        lines.append("Conditions: " + ", ".join(f"{c['type']}={c['status']}" for c in conditions))
+    return lines
+
+
+def describe_deployment(spec: dict, status: dict) -> List[str]:
+    lines = [
+        f"Replicas: {spec.get('replicas', 0)} desired | {status.get('updatedReplicas', 0)} updated"
+        f" | {status.get('readyReplicas', 0)} ready | {status.get('availableReplicas', 0)} available"
+    ]
+    containers = spec.get("template", {}).get("spec", {}).get("containers", [])
+    if containers:
+        lines.append("Images: " + ", ".join(f"{c['name']}={c.get('image')}" for c in containers))
+    for condition in status.get("conditions", []):
+        lines.append(
+            f"Condition: {condition.get('type')}={condition.get('status')} {condition.get('reason', '')}"
+            f" {condition.get('message', '')}".rstrip()
+        )
+    return lines
+
+
+def describe_node(status: dict) -> List[str]:
+    lines = []
+    for condition in status.get("conditions", []):
+        lines.append(
+            f"Condition: {condition.get('type')}={condition.get('status')} {condition.get('reason', '')}".rstrip()
+        )
+    for key in ("capacity", "allocatable"):
+        if status.get(key):
+            lines.append(f"{key.capitalize()}: " + ", ".join(f"{k}={v}" for k, v in status[key].items()))
+    return lines
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def event_time(event: dict) -> datetime:
+    for value in (event.get("lastTimestamp"), event.get("eventTime"), event.get("metadata", {}).get("creationTimestamp")):
+        parsed = parse_time(value)
+        if parsed:
+            return parsed
+    return datetime.fromtimestamp(0, timezone.utc)
+
+
+def age(when: Optional[datetime]) -> str:
+    """kubectl-style age: 45s, 12m, 5h, 3d."""
+    if when is None:
+        return "<unknown>"
+    seconds = max(0, int((datetime.now(timezone.utc) - when).total_seconds()))
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+_CPU_UNITS = {"n": 1e-6, "u": 1e-3, "m": 1.0}
+_MEMORY_UNITS = {"Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40, "K": 10**3, "M": 10**6, "G": 10**9, "T": 10**12}
+
+
+def cpu_millicores(quantity: str) -> float:
+    if quantity and quantity[-1] in _CPU_UNITS:
+        return float(quantity[:-1]) * _CPU_UNITS[quantity[-1]]
+    return float(quantity or 0) * 1000
+
+
+def memory_bytes(quantity: str) -> float:
+    for suffix in sorted(_MEMORY_UNITS, key=len, reverse=True):
+        if quantity.endswith(suffix):
+            return float(quantity[:-len(suffix)]) * _MEMORY_UNITS[suffix]
+    return float(quantity or 0)
+
+
+def create_diagnostics_backend(kind: str, max_output_bytes: int = 1024 * 1024) -> DiagnosticsBackend:
+    """
+    Build a backend by name: "kubectl" (default) or "api".
+
+    `max_output_bytes` caps how much output one command may produce before it
+    is stopped; only head/tail windows of it are kept either way.
+
+    The API backend falls back to kubectl for commands it cannot serve, and
+    the whole backend falls back to kubectl when no API server is configured.
+    """
+    kind = (kind or "kubectl").lower()
+    if kind == "api":
+        try:
+            return KubeApiBackend.from_env(
+                fallback=KubectlBackend(max_output_bytes),
+                max_output_bytes=max_output_bytes
+            )
+        except Exception as e:
+            print(f"DIAGNOSTICS: API backend unavailable ({e}), using kubectl")
+    elif kind != "kubectl":
+        print(f"DIAGNOSTICS: Unknown backend '{kind}', using kubectl")
+    return KubectlBackend(max_output_bytes)
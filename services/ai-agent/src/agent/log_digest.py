@@ -0,0 +1,388 @@
+"""
+Local digest of diagnostic command output before it goes into the prompt.
+Repeated log lines are clustered into Drain-style templates with counts,
+error lines are listed first, and `describe` output is reduced to container
+states, exit codes and warnings. Digests are built incrementally so the
+diagnostics backends can feed them the full stream before truncating it.
+No network calls.
+"""
+
+import re
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import List, Optional, Tuple
+
+# Variable tokens masked before clustering (order matters: most specific first)
+_MASKS = [
+    re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'),
+    re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.I),
+    re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'),
+    re.compile(r'\b0x[0-9a-f]+\b|\b[0-9a-f]{12,}\b', re.I),
+    re.compile(r'(?<![A-Za-z])[-+]?\d+(?:\.\d+)?(?:ms|s|m|h|Mi|Ki|Gi|%)?(?![A-Za-z])'),
+]
+_WILDCARD = "<*>"
+
+_ERROR_LINE = re.compile(
+    r'\b(error|err|exception|traceback|fatal|panic|critical|failed|failure|refused|'
+    r'timeout|timed out|oomkilled|out of memory|killed|denied|unavailable)\b',
+    re.I
+)
+
+# Lines added by BoundedOutput and multi-pod log fetches, kept verbatim
+_PASSTHROUGH = re.compile(r'^(\.\.\. \[\d+ bytes omitted\] \.\.\.|\[output stopped after \d+ bytes\]|==> .* <==)$')
+
+# Well-known container exit codes
+EXIT_CODES = {
+    1: "application error",
+    126: "command not executable",
+    127: "command not found",
+    134: "SIGABRT (abort)",
+    137: "SIGKILL (OOMKilled or killed by the kubelet)",
+    139: "SIGSEGV (segmentation fault)",
+    143: "SIGTERM (graceful shutdown)",
+}
+
+_EXIT_CODE = re.compile(r'exit code:?\s*(\d+)', re.I)
+_DESCRIBE_KEEP = re.compile(
+    r'^\s*(Name|Namespace|Node|Status|Reason|Message|State|Last State|Ready|Restart Count|'
+    r'Restarts|Image|Limits|Requests|cpu|memory|Replicas|Condition|Conditions)\b\s*:|'
+    r'^\s*(Containers|Events)\s*:|\b(Warning|OOMKilled|CrashLoopBackOff|ImagePullBackOff|'
+    r'ErrImagePull|Evicted|FailedScheduling|Unhealthy|BackOff)\b|'
+    # Container headers ("  checkout:") and condition rows ("  Ready   False")
+    r'^  [a-z0-9][-a-z0-9]*:$|^\s+[A-Z][A-Za-z]+\s+(True|False|Unknown)$'
+)
+
+
+class LogCluster:
+    """One log template: tokens with variable positions replaced by <*>."""
+
+    def __init__(self, tokens: List[str], line: str, error: bool):
+        self.tokens = tokens
+        self.count = 1
+        self.example = line
+        self.error = error
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> float:
+        same = sum(1 for a, b in zip(self.tokens, tokens) if a == b or a == _WILDCARD)
+        return same / len(tokens)
+
+    def merge(self, tokens: List[str], error: bool) -> None:
+        self.tokens = [a if a == b else _WILDCARD for a, b in zip(self.tokens, tokens)]
+        self.count += 1
+        self.error = self.error or error
+
+
+class LogTemplater:
+    """
+    Online Drain-style clustering of log lines.
+
+    Lines are masked (timestamps, IDs, IPs, numbers), grouped by token count
+    and the first token, and merged into the most similar cluster when at
+    least `similarity` of their tokens agree.
+
+    Usage:
+        templater = LogTemplater()
+        for line in lines:
+            templater.add(line)
+        clusters = templater.clusters
+    """
+
+    def __init__(self, similarity: float = 0.6, max_clusters: int = 200):
+        self.similarity = similarity
+        self.max_clusters = max_clusters
+        self.clusters: List[LogCluster] = []
+        self._groups = {}
+        self.lines = 0
+
+    def add(self, line: str) -> None:
+        self.lines += 1
+        tokens = mask(line).split()
+        if not tokens:
+            return
+        error = bool(_ERROR_LINE.search(line))
+        group = self._groups.setdefault((len(tokens), tokens[0]), [])
+        best: Optional[LogCluster] = None
+        best_score = 0.0
+        for cluster in group:
+            score = cluster.similarity(tokens)
+            if score > best_score:
+                best, best_score = cluster, score
+        if best is not None and best_score >= self.similarity:
+            best.merge(tokens, error)
+        elif len(self.clusters) < self.max_clusters:
+            cluster = LogCluster(tokens, line.strip(), error)
+            group.append(cluster)
+            self.clusters.append(cluster)
+
+
+def mask(line: str) -> str:
+    for pattern in _MASKS:
+        line = pattern.sub(_WILDCARD, line)
+    return line
+
+
+class OutputDigest(ABC):
+    """
+    Incremental digest of one command's stdout.
+
+    Output is fed as it is read, before any head/tail truncation, and split
+    into lines; subclasses keep only what their digest needs.
+
+    Usage:
+        digest = output_digest("kubectl logs checkout-1 -n prod")
+        for chunk in chunks:
+            digest.feed(chunk)
+        text = digest.finish()  # None when there is nothing to digest
+    """
+
+    # Longest partial line buffered while waiting for its newline
+    MAX_LINE_BYTES = 64 * 1024
+
+    def __init__(self):
+        self._partial = bytearray()
+
+    def feed(self, data: bytes) -> None:
+        self._partial += data
+        *lines, rest = self._partial.split(b"\n")
+        self._partial = bytearray(rest[:self.MAX_LINE_BYTES])
+        for line in lines:
+            self.add(line.decode('utf-8', errors='replace').rstrip("\r"))
+
+    def finish(self) -> Optional[str]:
+        if self._partial:
+            self.add(self._partial.decode('utf-8', errors='replace'))
+            self._partial = bytearray()
+        return self.text()
+
+    @abstractmethod
+    def add(self, line: str) -> None:
+        """Consume one line of output (without its newline)."""
+
+    @abstractmethod
+    def text(self) -> Optional[str]:
+        """The digest of the lines added so far, or None to keep the output as is."""
+
+
+class LogDigest(OutputDigest):
+    """Error templates first, then the most frequent ones, then the last few raw lines."""
+
+    def __init__(self, max_templates: int = 30, last_lines: int = 5):
+        super().__init__()
+        self.max_templates = max_templates
+        self.templater = LogTemplater()
+        self.notes = []
+        self.last = deque(maxlen=last_lines)
+
+    def add(self, line: str) -> None:
+        if not line.strip():
+            return
+        if _PASSTHROUGH.match(line.strip()):
+            self.notes.append(line.strip())
+            return
+        self.templater.add(line)
+        self.last.append(line)
+
+    def text(self) -> Optional[str]:
+        clusters = self.templater.clusters
+        if not clusters:
+            return None
+
+        errors = [c for c in clusters if c.error]
+        others = sorted((c for c in clusters if not c.error), key=lambda c: -c.count)
+        shown = (errors + others)[:self.max_templates]
+
+        lines = [f"[digest: {self.templater.lines} lines -> {len(clusters)} templates]"]
+        lines += self.notes
+        if errors:
+            lines.append("Errors:")
+            lines += [_cluster_line(c) for c in shown if c.error]
+        rest = [c for c in shown if not c.error]
+        if rest:
+            lines.append("Other:")
+            lines += [_cluster_line(c) for c in rest]
+        if len(clusters) > len(shown):
+            lines.append(f"  ... {len(clusters) - len(shown)} more templates")
+        if self.last:
+            lines.append("Last lines:")
+            lines += [f"  {line.strip()[:300]}" for line in self.last]
+        return "\n".join(lines) + "\n"
+
+
+def _cluster_line(cluster: LogCluster) -> str:
+    # A template that never varied reads better as the original line
+    text = cluster.example if cluster.count == 1 else cluster.template
+    return f"  [x{cluster.count}] {text[:300]}"
+
+
+class DescribeDigest(OutputDigest):
+    """Identity, container state/exit code, resource and warning lines of `describe` output."""
+
+    def __init__(self, max_lines: int = 60):
+        super().__init__()
+        self.max_lines = max_lines
+        self.kept = []
+        self.kept_total = 0
+        self.lines = 0
+        self.exit_codes = set()
+        self.oom_killed = False
+        self._previous = None
+
+    def add(self, line: str) -> None:
+        self.lines += 1
+        self.exit_codes.update(int(code) for code in _EXIT_CODE.findall(line))
+        self.oom_killed = self.oom_killed or bool(re.search(r'\bOOMKilled\b', line))
+        stripped = line.rstrip()
+        if not stripped:
+            return
+        keep = (
+            _DESCRIBE_KEEP.search(stripped)
+            or _EXIT_CODE.search(stripped)
+            or _ERROR_LINE.search(stripped)
+            or _PASSTHROUGH.match(stripped.strip())
+        )
+        if keep and stripped != self._previous:
+            self.kept_total += 1
+            if len(self.kept) < self.max_lines:
+                self.kept.append(" ".join(stripped.split()) if len(stripped) > 200 else stripped)
+            self._previous = stripped
+
+    def text(self) -> Optional[str]:
+        if not self.kept:
+            return None
+        lines = [f"[digest: {self.lines} lines -> {min(self.kept_total, self.max_lines)}]"]
+        findings = _findings(self.exit_codes, self.oom_killed)
+        if findings:
+            lines.append("Findings: " + "; ".join(findings))
+        lines += self.kept
+        return "\n".join(lines) + "\n"
+
+
+def exit_code_findings(text: str) -> List[str]:
+    """Explain the container exit codes mentioned in the text (e.g. 137 -> OOMKilled)."""
+    codes = {int(m) for m in _EXIT_CODE.findall(text)}
+    return _findings(codes, bool(re.search(r'\bOOMKilled\b', text)))
+
+
+def _findings(codes: set, oom_killed: bool) -> List[str]:
+    findings = []
+    for code in sorted(codes):
+        meaning = EXIT_CODES.get(code, "non-zero exit" if code else "completed")
+        findings.append(f"exit code {code}: {meaning}")
+    if oom_killed and 137 not in codes:
+        findings.append("OOMKilled: container exceeded its memory limit")
+    return findings
+
+
+class TableDigest(OutputDigest):
+    """
+    Repeated rows collapsed, keeping order and counts.
+
+    Rows must be identical to collapse: pod names, READY and RESTARTS cells
+    are what the analysis acts on. Only event tables are compared without
+    their LAST SEEN/FIRST SEEN columns, so one event reported at different
+    times collapses into its first row.
+    """
+
+    # Columns ignored when comparing rows: the same event seen at different times
+    TIME_COLUMNS = ("LAST SEEN", "FIRST SEEN")
+
+    def __init__(self):
+        super().__init__()
+        self.rows = {}
+        self.total = 0
+        self._ignored = None
+
+    def add(self, line: str) -> None:
+        if not line.strip():
+            return
+        if self._ignored is None:
+            # Header row: locate the time columns by their offsets
+            self._ignored = _column_spans(line, self.TIME_COLUMNS)
+            key = line
+        else:
+            key = _without_spans(line, self._ignored)
+        entry = self.rows.setdefault(key, [line, 0])
+        entry[1] += 1
+        self.total += 1
+
+    def text(self) -> Optional[str]:
+        if self.total == len(self.rows):
+            return None
+        return "\n".join(line if n == 1 else f"{line}  [x{n}]" for line, n in self.rows.values()) + "\n"
+
+
+def _column_spans(header: str, names: Tuple[str, ...]) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the named columns in an aligned kubectl table header."""
+    spans = []
+    for name in names:
+        start = header.find(name)
+        if start < 0 or (start and header[start - 1] != " "):
+            continue
+        end = start + len(name)
+        while end < len(header) and header[end] == " ":
+            end += 1
+        spans.append((start, end if end < len(header) else len(header)))
+    return sorted(spans)
+
+
+def _without_spans(line: str, spans: List[Tuple[int, int]]) -> str:
+    for start, end in reversed(spans):
+        line = line[:start] + line[end:]
+    return line
+
+
+def output_digest(command: str) -> Optional[OutputDigest]:
+    """The digest for a command's kubectl verb, or None when its output is kept as is."""
+    parts = command.split()
+    verb = parts[1] if len(parts) > 1 and parts[0] == "kubectl" else ""
+    if verb == "logs":
+        return LogDigest()
+    if verb == "describe":
+        return DescribeDigest()
+    if verb in ("get", "top"):
+        return TableDigest()
+    return None
+
+
+def _digest_text(digest: OutputDigest, text: str) -> str:
+    digest.feed(text.encode('utf-8'))
+    result = digest.finish()
+    return text if result is None else result
+
+
+def digest_logs(text: str, max_templates: int = 30, last_lines: int = 5) -> str:
+    """
+    Digest log output: error templates first, then the most frequent ones,
+    each with its count, followed by the last few raw lines.
+    """
+    return _digest_text(LogDigest(max_templates, last_lines), text)
+
+
+def digest_describe(text: str, max_lines: int = 60) -> str:
+    """Keep identity, container state/exit code, resource and warning lines of `describe` output."""
+    return _digest_text(DescribeDigest(max_lines), text)
+
+
+def digest_table(text: str) -> str:
+    """Collapse identical rows (e.g. repeated events), keeping order and counts."""
+    return _digest_text(TableDigest(), text)
+
+
+def digest_output(command: str, text: str) -> Tuple[str, bool]:
+    """
+    Digest one command's complete output according to its kubectl verb.
+
+    Returns:
+        (text, digested) - the original text when the digest would not be shorter
+    """
+    digest = output_digest(command)
+    if digest is None:
+        return text, False
+    result = _digest_text(digest, text)
+    if len(result) >= len(text):
+        return text, False
+    return result, True
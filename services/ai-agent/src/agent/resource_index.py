@@ -0,0 +1,156 @@
+"""
+Precomputed index over discovered K8s resources.
+Built once per namespace listing and used to match an alert's service name
+to the pods and deployments that actually belong to it.
+"""
+
+import bisect
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+
+@dataclass
+class ResourceInfo:
+    """A discovered resource with the metadata used for matching."""
+    kind: str
+    name: str
+    owner_kind: str = ""
+    owner_name: str = ""
+    app_labels: List[str] = field(default_factory=list)
+
+
+# Match scores, highest wins
+SCORE_EXACT = 100      # name equals the service (pods: via their owning deployment)
+SCORE_LABEL = 90       # app / app.kubernetes.io/name label equals the service
+SCORE_PREFIX = 60      # name starts with "<service>-"
+SCORE_TOKENS = 40      # every token of a multi-part service name appears in the name
+
+
+class ResourceIndex:
+    """
+    Token/prefix index over pods and deployments in one namespace.
+
+    Matching is ranked: owner-reference and label matches come first, then
+    name prefix, then names containing every token of a multi-part service
+    name. A single token such as "api" never matches by substring alone, which
+    keeps generic service names from selecting the whole namespace.
+
+    Usage:
+        index = ResourceIndex(infos)
+        index.resources            # {"pods": [...], "deployments": [...], ...}
+        index.match("payment-api") # {"pods": [...], "deployments": [...]}
+    """
+
+    KINDS = {
+        "Pod": "pods",
+        "Deployment": "deployments",
+        "Service": "services",
+        "ReplicaSet": "replicasets",
+    }
+
+    def __init__(self, infos: List[ResourceInfo]):
+        self.resources: Dict[str, List[str]] = {key: [] for key in self.KINDS.values()}
+        self._by_kind: Dict[str, Dict[str, ResourceInfo]] = defaultdict(dict)
+        # kind -> token -> names containing that token
+        self._tokens: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        # kind -> sorted (lowercase, original) names for prefix lookups
+        self._sorted: Dict[str, List[str]] = {}
+        # kind -> label value -> names
+        self._labels: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+
+        for info in infos:
+            key = self.KINDS.get(info.kind)
+            if not key:
+                continue
+            self.resources[key].append(info.name)
+            self._by_kind[key][info.name] = info
+            lowered = info.name.lower()
+            for token in lowered.split("-"):
+                self._tokens[key][token].add(info.name)
+            for label in info.app_labels:
+                self._labels[key][label.lower()].add(info.name)
+
+        for key, infos_by_name in self._by_kind.items():
+            self._sorted[key] = sorted((name.lower(), name) for name in infos_by_name)
+
+        # deployment -> pods it owns (pod -> ReplicaSet -> Deployment)
+        self._pods_by_deployment: Dict[str, List[str]] = defaultdict(list)
+        for pod in self._by_kind["pods"]:
+            owner = self.deployment_of(pod)
+            if owner:
+                self._pods_by_deployment[owner].append(pod)
+
+    def __bool__(self) -> bool:
+        return any(self.resources.values())
+
+    def deployment_of(self, pod: str) -> Optional[str]:
+        """Resolve a pod's owning deployment via its ReplicaSet owner reference."""
+        info = self._by_kind["pods"].get(pod)
+        if not info or info.owner_kind != "ReplicaSet":
+            return None
+        rs = self._by_kind["replicasets"].get(info.owner_name)
+        if rs and rs.owner_kind == "Deployment":
+            return rs.owner_name
+        return None
+
+    def match(self, service_name: str, limit: int = 20) -> dict:
+        """Return ranked pods and deployments belonging to a service."""
+        service = service_name.lower().strip()
+        if not service:
+            return {"pods": [], "deployments": []}
+
+        deployments = self._score("deployments", service)
+        pods = self._score("pods", service)
+
+        for deployment, score in deployments.items():
+            # Pods inherit their deployment's score: owner refs beat name guesses
+            for pod in self._pods_by_deployment.get(deployment, ()):
+                pods[pod] = max(pods.get(pod, 0), score)
+
+        return {
+            "pods": self._ranked(pods, limit),
+            "deployments": self._ranked(deployments, limit),
+        }
+
+    def _score(self, key: str, service: str) -> Dict[str, int]:
+        scores: Dict[str, int] = {}
+
+        def bump(names, score):
+            for name in names:
+                if scores.get(name, 0) < score:
+                    scores[name] = score
+
+        # Name tokens: every token of the service must be present. A single
+        # token is too weak on its own (e.g. "api"), so it needs a stronger match.
+        tokens = [t for t in service.split("-") if t]
+        if len(tokens) > 1:
+            # Intersect smallest posting lists first
+            postings = sorted((self._tokens[key].get(t, set()) for t in tokens), key=len)
+            candidates = set(postings[0])
+            for names in postings[1:]:
+                if not candidates:
+                    break
+                candidates &= names
+            bump(candidates, SCORE_TOKENS)
+
+        # Name prefix "<service>-" via binary search over sorted names
+        sorted_names = self._sorted.get(key, [])
+        prefix = service + "-"
+        idx = bisect.bisect_left(sorted_names, (prefix, ""))
+        while idx < len(sorted_names) and sorted_names[idx][0].startswith(prefix):
+            bump([sorted_names[idx][1]], SCORE_PREFIX)
+            idx += 1
+
+        bump(self._labels[key].get(service, ()), SCORE_LABEL)
+
+        # Exact name
+        idx = bisect.bisect_left(sorted_names, (service, ""))
+        while idx < len(sorted_names) and sorted_names[idx][0] == service:
+            bump([sorted_names[idx][1]], SCORE_EXACT)
+            idx += 1
+        return scores
+
+    @staticmethod
+    def _ranked(scores: Dict[str, int], limit: int) -> List[str]:
+        return [name for name, _ in sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))][:limit]
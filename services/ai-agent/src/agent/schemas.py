@@ -0,0 +1,100 @@
+"""
+JSON schemas for structured LLM output.
+Derived from the Decision/Action protobuf descriptors so the schema the model
+is constrained to always matches what _parse_decision() fills in.
+"""
+
+from typing import Dict, Iterable, Optional
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from protos.contracts import orchestrator_pb2
+
+# Fields the agent assigns itself, never the model
+SERVER_ASSIGNED_FIELDS = {"decision_id", "incident_id", "action_id", "approver"}
+
+# Remediation actions the executor supports
+ACTION_TYPES = [
+    "restart_pod",
+    "scale_deployment",
+    "rolling_restart_deployment",
+    "rollback_deployment",
+]
+
+_SCALAR_TYPES = {
+    FieldDescriptor.TYPE_STRING: "string",
+    FieldDescriptor.TYPE_BOOL: "boolean",
+    FieldDescriptor.TYPE_DOUBLE: "number",
+    FieldDescriptor.TYPE_FLOAT: "number",
+    FieldDescriptor.TYPE_INT32: "integer",
+    FieldDescriptor.TYPE_INT64: "integer",
+    FieldDescriptor.TYPE_UINT32: "integer",
+    FieldDescriptor.TYPE_UINT64: "integer",
+}
+
+
+def message_schema(
+    descriptor: Descriptor,
+    exclude: Iterable[str] = SERVER_ASSIGNED_FIELDS,
+    overrides: Optional[Dict[str, dict]] = None,
+) -> dict:
+    """
+    Build a JSON schema object for a protobuf message.
+
+    Args:
+        descriptor: Message descriptor (e.g. orchestrator_pb2.Decision.DESCRIPTOR)
+        exclude: Field names left out at every nesting level
+        overrides: "Message.field" -> extra schema keys (e.g. an enum)
+    """
+    exclude = set(exclude)
+    overrides = overrides or {}
+    properties = {}
+    for field in descriptor.fields:
+        if field.name in exclude:
+            continue
+        schema = _field_schema(field, exclude, overrides)
+        schema.update(overrides.get(f"{descriptor.name}.{field.name}", {}))
+        properties[field.name] = schema
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+    }
+
+
+def _field_schema(field: FieldDescriptor, exclude: set, overrides: Dict[str, dict]) -> dict:
+    if field.type == FieldDescriptor.TYPE_MESSAGE:
+        if field.message_type.GetOptions().map_entry:
+            value_field = field.message_type.fields_by_name["value"]
+            return {"type": "object", "additionalProperties": _field_schema(value_field, exclude, overrides)}
+        item = message_schema(field.message_type, exclude, overrides)
+    else:
+        item = {"type": _SCALAR_TYPES.get(field.type, "string")}
+
+    if _is_repeated(field):
+        return {"type": "array", "items": item}
+    return item
+
+
+def _is_repeated(field: FieldDescriptor) -> bool:
+    # FieldDescriptor.label was removed in protobuf 7; is_repeated replaces it
+    is_repeated = getattr(field, "is_repeated", None)
+    if is_repeated is not None:
+        return is_repeated
+    return field.label == FieldDescriptor.LABEL_REPEATED
+
+
+DECISION_SCHEMA = message_schema(
+    orchestrator_pb2.Decision.DESCRIPTOR,
+    overrides={
+        "Decision.confidence_score": {"minimum": 0, "maximum": 1},
+        "Action.action_type": {"enum": ACTION_TYPES},
+    },
+)
+
+COMMANDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "commands": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["commands"],
+}
@@ -0,0 +1,248 @@
+"""
+Caching for LLM calls.
+In-memory TTL/LRU layer with an optional SQLite store so entries survive restarts.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from prometheus_client import Counter
+
+CACHE_HITS = Counter('orchestrator_llm_cache_hits_total', 'LLM cache hits', ['cache'])
+CACHE_MISSES = Counter('orchestrator_llm_cache_misses_total', 'LLM cache misses', ['cache'])
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache with per-entry expiry.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at or time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SqliteCacheStore:
+    """
+    Size-bounded key/blob store in a local SQLite file.
+
+    Entries expire `ttl` seconds after being written (ttl=None keeps them until
+    evicted); once `max_entries` is exceeded the least recently used are dropped.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int, ttl: Optional[float] = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)")
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return (value, created_at) or None if missing/expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if self.ttl is not None and row[1] + self.ttl <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+            return row[0], row[1]
+
+    def put(self, key: str, value: bytes) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), now, now)
+            )
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+
+class ResponseCache:
+    """
+    Cache for LLM completion responses.
+
+    Keys are a SHA-256 over the model, messages and request parameters
+    (sampling, output format). Only whitespace is normalized: IDs and
+    timestamps in a prompt belong to the request, so prompts for different
+    incidents never share an entry.
+
+    Usage:
+        cache = ResponseCache(ttl=600, path="/tmp/llm-cache.db")
+        key = cache.key(model, messages, temperature=0)
+        text = cache.get(key)
+        if text is None:
+            text = call_llm()
+            cache.put(key, text)
+    """
+
+    _WHITESPACE = re.compile(r'\s+')
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 512, path: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds a response stays valid
+            max_entries: LRU bound (memory and disk)
+            path: Optional SQLite file for persistence (None = memory only)
+        """
+        self._memory = TTLCache(ttl, max_entries)
+        self._store = SqliteCacheStore(path, "responses", max_entries, ttl) if path else None
+
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        return cls._WHITESPACE.sub(" ", text).strip()
+
+    def key(self, model: str, messages: List[dict], **params) -> str:
+        payload = {
+            "model": model,
+            "messages": [
+                {**msg, "content": self.normalize(msg["content"])} if isinstance(msg.get("content"), str) else msg
+                for msg in messages
+            ],
+            "params": params,
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_first([key])
+
+    def get_first(self, keys: List[str]) -> Optional[str]:
+        """The entry for the first key that has one; counts a single hit or miss."""
+        text = None
+        for key in keys:
+            text = self._load(key)
+            if text is not None:
+                break
+
+        if text is None:
+            CACHE_MISSES.labels(cache="response").inc()
+        else:
+            CACHE_HITS.labels(cache="response").inc()
+        return text
+
+    def _load(self, key: str) -> Optional[str]:
+        text = self._memory.get(key)
+        if text is None and self._store:
+            row = self._store.get(key)
+            if row:
+                text = bytes(row[0]).decode('utf-8')
+                self._memory.put(key, text, expires_at=row[1] + self._memory.ttl)
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        if not text:
+            return
+        self._memory.put(key, text)
+        if self._store:
+            self._store.put(key, text.encode('utf-8'))
+
+
+class EmbeddingCache:
+    """
+    Cache for embedding vectors.
+
+    Keys are a SHA-256 of the embedding model and input text. Vectors are
+    stored as packed float32 blobs (4 bytes per dimension) and never expire;
+    the store is bounded by `max_entries` with least-recently-used eviction.
+
+    Usage:
+        cache = EmbeddingCache(path="/tmp/ai-agent/embeddings.db")
+        vector = cache.get(model, text)
+        if vector is None:
+            vector = embed(text)
+            cache.put(model, text, vector)
+    """
+
+    def __init__(self, max_entries: int = 5000, path: Optional[str] = None, memory_entries: int = 512):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Max vectors kept on disk
+            path: Optional SQLite file for persistence (None = memory only)
+            memory_entries: Max vectors kept in memory
+        """
+        self._memory = TTLCache(math.inf, memory_entries if path else max_entries)
+        self._store = SqliteCacheStore(path, "embeddings", max_entries) if path else None
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.key(model, text)
+        vector = self._memory.get(key)
+        if vector is None and self._store:
+            row = self._store.get(key)
+            if row:
+                packed = array('f')
+                packed.frombytes(bytes(row[0]))
+                vector = packed.tolist()
+                self._memory.put(key, vector)
+
+        if vector is None:
+            CACHE_MISSES.labels(cache="embedding").inc()
+        else:
+            CACHE_HITS.labels(cache="embedding").inc()
+        return vector
+
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        if not vector:
+            return
+        key = self.key(model, text)
+        self._memory.put(key, list(vector))
+        if self._store:
+            self._store.put(key, array('f', vector).tobytes())
@@ -0,0 +1,199 @@
+"""
+Circuit breaker for LLM providers.
+Stops sending calls to a model whose recent calls mostly fail or are too slow,
+so an outage costs callers a fast error instead of the full retry ladder.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from prometheus_client import Gauge
+
+CIRCUIT_STATE = Gauge('orchestrator_llm_circuit_state', 'LLM circuit breaker state (0=closed, 1=half-open, 2=open)', ['model'])
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the model's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker driven by error rate and slow-call rate.
+
+    Outcomes are kept for `window` seconds. Once at least `min_calls` are in
+    the window and either rate crosses its threshold, the circuit opens and
+    rejects calls for `open_seconds`. It then goes half-open and lets
+    `half_open_calls` probes through: if they all succeed it closes, any
+    failure re-opens it.
+
+    Usage:
+        breaker = CircuitBreaker("gemini/gemini-2.5-flash")
+        if not breaker.allow():
+            raise CircuitOpenError(...)
+        start = time.monotonic()
+        try:
+            result = call()
+        except Exception:
+            breaker.record(False, time.monotonic() - start)
+            raise
+        breaker.record(True, time.monotonic() - start)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        error_rate: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_call_rate: float = 0.8,
+        window: float = 60.0,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1
+    ):
+        """
+        Initialize the breaker.
+
+        Args:
+            name: Model name, used in logs and metrics
+            error_rate: Failure fraction that opens the circuit
+            slow_call_seconds: Calls slower than this count as slow
+            slow_call_rate: Slow-call fraction that opens the circuit
+            window: Seconds of history considered
+            min_calls: Calls needed in the window before rates are evaluated
+            open_seconds: How long the circuit stays open before probing
+            half_open_calls: Probe calls allowed while half-open
+        """
+        self.name = name
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0  # half-open calls in flight
+        self._successes = 0  # successful half-open probes
+        # (timestamp, failed, slow)
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(model=name).set(_STATE_VALUES[CLOSED])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open_locked(time.monotonic())
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed; every allowed call must be settled with record() or release()."""
+        with self._lock:
+            self._maybe_half_open_locked(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def record(self, success: bool, duration: float) -> None:
+        """Record the outcome of an allowed call."""
+        now = time.monotonic()
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if not success or slow:
+                    self._open_locked(now, "probe failed" if not success else "probe slow")
+                    return
+                self._successes += 1
+                if self._successes >= self.half_open_calls:
+                    self._transition_locked(CLOSED)
+                    print(f"CIRCUIT_BREAKER: {self.name} closed")
+                return
+
+            if self._state != CLOSED:
+                return
+
+            self._outcomes.append((now, not success, slow))
+            self._trim_locked(now)
+            total = len(self._outcomes)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, _, is_slow in self._outcomes if is_slow)
+            if failures / total >= self.error_rate:
+                self._open_locked(now, f"error rate {failures}/{total}")
+            elif slow_calls / total >= self.slow_call_rate:
+                self._open_locked(now, f"slow-call rate {slow_calls}/{total}")
+
+    def release(self) -> None:
+        """Settle an allowed call whose outcome says nothing about provider health (rate limited, cancelled)."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def _maybe_half_open_locked(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition_locked(HALF_OPEN)
+            print(f"CIRCUIT_BREAKER: {self.name} half-open, probing")
+
+    def _open_locked(self, now: float, reason: str) -> None:
+        self._opened_at = now
+        self._transition_locked(OPEN)
+        print(f"CIRCUIT_BREAKER: {self.name} opened ({reason}) for {self.open_seconds:.0f}s")
+
+    def _transition_locked(self, state: str) -> None:
+        self._state = state
+        self._probes = 0
+        self._successes = 0
+        self._outcomes.clear()
+        CIRCUIT_STATE.labels(model=self.name).set(_STATE_VALUES[state])
+
+    def _trim_locked(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+
+class CircuitBreakerRegistry:
+    """
+    One CircuitBreaker per model, created lazily with shared settings.
+
+    Usage:
+        breakers = CircuitBreakerRegistry(error_rate=0.5, open_seconds=30)
+        breakers.get("openai/gpt-4o-mini").allow()
+    """
+
+    def __init__(self, enabled: bool = True, **settings):
+        """
+        Initialize the registry.
+
+        Args:
+            enabled: When False, get() returns None and calls are never rejected
+            **settings: CircuitBreaker keyword arguments applied to every breaker
+        """
+        self.enabled = enabled
+        self.settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> Optional[CircuitBreaker]:
+        """Return the breaker for a model, or None when breakers are disabled."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = CircuitBreaker(model, **self.settings)
+                self._breakers[model] = breaker
+            return breaker
@@ -0,0 +1,81 @@
+"""
+Incremental detection of a complete JSON object in streamed LLM output.
+Lets a streaming completion be cut off as soon as the object the caller
+asked for has arrived, instead of paying for trailing prose.
+"""
+
+import json
+from typing import Optional
+
+
+class JsonObjectScanner:
+    """
+    Finds the first complete top-level JSON object in text fed chunk by chunk.
+
+    Brackets inside strings (including escaped quotes) are ignored. A balanced
+    {...} span that does not parse (e.g. "{namespace}" in prose) is skipped and
+    scanning resumes after its opening brace.
+
+    Usage:
+        scanner = JsonObjectScanner()
+        for chunk in stream:
+            if scanner.feed(chunk) is not None:
+                break
+        text = scanner.result or scanner.text
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.result: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return self._buffer
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Add a chunk; return the complete JSON object once one has been seen."""
+        if self.result is not None:
+            return self.result
+        if not chunk:
+            return None
+
+        self._buffer += chunk
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            if self._start < 0:
+                if ch == "{":
+                    self._start = self._pos
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = buffer[self._start:self._pos + 1]
+                    try:
+                        json.loads(candidate)
+                    except ValueError:
+                        # Not JSON after all: rescan from just past the bogus opening brace
+                        self._pos = self._start + 1
+                        self._start = -1
+                        continue
+                    self.result = candidate
+                    return candidate
+            self._pos += 1
+        return None
@@ -3,16 +3,31 @@ LLM Provider abstraction layer using LiteLLM.
 Provides a unified interface for multiple LLM providers with built-in rate limiting.
 """
 
+import asyncio
+import json
 import os
+import re
 import time
 from typing import Optional, List, Any
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import litellm
-from litellm import completion, embedding
+from litellm import completion, embedding, acompletion, aembedding
 from litellm.exceptions import RateLimitError, APIError, ServiceUnavailableError
+from prometheus_client import Counter
 
-from llm.rate_limiter import SmartRateLimiter
+from llm.cache import EmbeddingCache, ResponseCache
+from llm.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError
+from llm.json_stream import JsonObjectScanner
+from llm.rate_limit_backend import LocalBackend, create_backend
+from llm.rate_limiter import RateLimiterRegistry, RateLimitQueueFull, SmartRateLimiter
+
+STREAM_EARLY_STOPS = Counter('orchestrator_llm_stream_early_stops_total', 'Streamed completions stopped after the JSON object', ['model'])
+FAILOVERS = Counter('orchestrator_llm_failovers_total', 'Completion calls moved off a model in the chain', ['model', 'reason'])
+
+
+class _ModelUnavailable(Exception):
+    """A non-final model in the chain has no rate limit budget right now."""
 
 
 @dataclass
@@ -22,6 +37,22 @@ class LLMResponse:
     model: str
     usage: dict
     raw_response: Any = None
+    # [{"id": ..., "name": ..., "arguments": {...}}] when the model called tools
+    tool_calls: List[dict] = field(default_factory=list)
+    
+    def assistant_message(self) -> dict:
+        """This response as an assistant message, for continuing a chat()."""
+        message = {"role": "assistant", "content": self.text or ""}
+        if self.tool_calls:
+            message["tool_calls"] = [
+                {
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])},
+                }
+                for call in self.tool_calls
+            ]
+        return message
 
 
 class LLMProvider:
@@ -31,12 +62,24 @@ class LLMProvider:
     Features:
     - Multiple provider support via LiteLLM
     - Smart rate limiting with Retry-After header support
+    - Separate rate limit buckets per endpoint (completion/embedding) and model
+    - Optional token-per-minute limits, reconciled against reported usage
+    - Severity-ordered waiting with shedding of low-priority calls (see rate_limiter.current_priority)
     - Automatic retries with exponential backoff
     - Easy provider switching via environment variables
+    - Async variants (agenerate/aembed) for use inside an event loop
+    - Response cache (TTL + LRU, optional SQLite persistence)
+    - Persistent embedding cache (float32 vectors in SQLite)
+    - Model chain: rate-limited or failing models fail over to the next one immediately
+    - Optional hedged request to the next model when the first is slow (async path)
+    - Circuit breaker per model: fail fast while a provider is erroring or slow
+    - Streaming mode for JSON output: stop as soon as the object is complete
+    - Schema-constrained output (response_format) on models that support it
     
     Usage:
         llm = LLMProvider()  # Uses GEMINI_API_KEY env var
         response = llm.generate("Analyze this incident...")
+        response = await llm.agenerate("Analyze this incident...")
         
         # Or with explicit config:
         llm = LLMProvider(
@@ -61,8 +104,16 @@ class LLMProvider:
         model: Optional[str] = None,
         max_retries: int = 5,
         rate_limit_rpm: float = 5.0,
+        embed_rate_limit_rpm: float = 60.0,
+        rate_limit_tpm: Optional[float] = None,
+        embed_rate_limit_tpm: Optional[float] = None,
         rate_limit_enabled: bool = True,
         timeout: float = 120.0,
+        cache_enabled: Optional[bool] = None,
+        fallback_models: Optional[List[str]] = None,
+        hedge_after: Optional[float] = None,
+        streaming: Optional[bool] = None,
+        structured_output: Optional[bool] = None,
     ):
         """
         Initialize the LLM provider.
@@ -71,11 +122,38 @@ class LLMProvider:
             model: LiteLLM model string (e.g., "gemini/gemini-2.5-flash")
                    Defaults to LLM_MODEL env var or "gemini/gemini-2.5-flash"
             max_retries: Maximum retry attempts for failed calls
-            rate_limit_rpm: Requests per minute limit (set high for self-hosted)
+            rate_limit_rpm: Completion requests per minute (set high for self-hosted)
+            embed_rate_limit_rpm: Embedding requests per minute
+            rate_limit_tpm: Completion tokens per minute (None = not enforced)
+            embed_rate_limit_tpm: Embedding tokens per minute (None = not enforced)
             rate_limit_enabled: Enable/disable rate limiting
             timeout: Request timeout in seconds
+            cache_enabled: Cache generate() responses and embeddings
+                           Defaults to LLM_CACHE_ENABLED env var (true)
+            fallback_models: Models tried in order after the primary one
+                             Defaults to LLM_FALLBACK_MODELS env var (comma-separated)
+            hedge_after: Seconds before a slow async call is hedged on the next model
+                         Defaults to LLM_HEDGE_AFTER_SECONDS env var (0 = off)
+            streaming: Stream expect_json calls and stop at the first complete JSON object
+                       Defaults to LLM_STREAMING env var (false)
+            structured_output: Send json_schema as response_format where supported
+                               Defaults to LLM_STRUCTURED_OUTPUT env var (true)
         """
         self.model = model or os.getenv("LLM_MODEL", "gemini/gemini-2.5-flash")
+        if fallback_models is None:
+            fallback_models = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+        # Primary first; duplicates dropped so a model is never tried twice per round
+        self.models = list(dict.fromkeys([self.model] + fallback_models))
+        if hedge_after is None:
+            hedge_after = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))
+        self.hedge_after = hedge_after
+        if streaming is None:
+            streaming = os.getenv("LLM_STREAMING", "false").lower() == "true"
+        self.streaming = streaming
+        if structured_output is None:
+            structured_output = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+        self.structured_output = structured_output
+        self._schema_support = {}
         self.max_retries = max_retries
         self.timeout = timeout
         
@@ -83,23 +161,82 @@ class LLMProvider:
         env_rpm = os.getenv("LLM_RATE_LIMIT_RPM")
         if env_rpm:
             rate_limit_rpm = float(env_rpm)
+        env_embed_rpm = os.getenv("LLM_EMBED_RATE_LIMIT_RPM")
+        if env_embed_rpm:
+            embed_rate_limit_rpm = float(env_embed_rpm)
+        env_tpm = os.getenv("LLM_RATE_LIMIT_TPM")
+        if env_tpm:
+            rate_limit_tpm = float(env_tpm)
+        env_embed_tpm = os.getenv("LLM_EMBED_RATE_LIMIT_TPM")
+        if env_embed_tpm:
+            embed_rate_limit_tpm = float(env_embed_tpm)
+        
+        # Bucket state: "local" (per process), "file" (same-node workers) or
+        # "redis" (all replicas share one budget and Retry-After window)
+        backend_kind = os.getenv("LLM_RATE_LIMIT_BACKEND", "local")
+        try:
+            backend = create_backend(
+                backend_kind,
+                state_path=os.getenv("LLM_RATE_LIMIT_STATE_PATH", "/tmp/ai-agent/ratelimit.json"),
+                redis_url=os.getenv("LLM_RATE_LIMIT_REDIS_URL")
+            )
+        except Exception as e:
+            print(f"LLM Provider: Rate limit backend '{backend_kind}' unavailable ({e}), using local")
+            backend = LocalBackend()
         
-        # Disable rate limiting for self-hosted (high RPM = effectively disabled)
-        if rate_limit_rpm >= 1000:
-            rate_limit_enabled = False
+        # One bucket per (endpoint, model); per-model overrides from env.
+        # Buckets at >= 1000 RPM are disabled (self-hosted).
+        overrides = RateLimiterRegistry.parse_overrides("completion", os.getenv("LLM_RATE_LIMITS"))
+        overrides.update(RateLimiterRegistry.parse_overrides("embedding", os.getenv("LLM_EMBED_RATE_LIMITS")))
+        self.rate_limits = RateLimiterRegistry(
+            defaults={
+                "completion": (rate_limit_rpm, rate_limit_tpm),
+                "embedding": (embed_rate_limit_rpm, embed_rate_limit_tpm),
+            },
+            overrides=overrides,
+            enabled=rate_limit_enabled,
+            max_queue_depth=int(os.getenv("LLM_QUEUE_MAX_DEPTH", "20")),
+            shed_level=int(os.getenv("LLM_QUEUE_SHED_LEVEL", "2")),
+            backend=backend
+        )
         
-        self.rate_limiter = SmartRateLimiter(
-            requests_per_minute=rate_limit_rpm,
-            enabled=rate_limit_enabled
+        # Circuit breakers per model (error rate / slow-call rate over a window)
+        self.breakers = CircuitBreakerRegistry(
+            enabled=os.getenv("LLM_CIRCUIT_ENABLED", "true").lower() == "true",
+            error_rate=float(os.getenv("LLM_CIRCUIT_ERROR_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("LLM_CIRCUIT_SLOW_CALL_SECONDS", "30")),
+            slow_call_rate=float(os.getenv("LLM_CIRCUIT_SLOW_CALL_RATE", "0.8")),
+            window=float(os.getenv("LLM_CIRCUIT_WINDOW_SECONDS", "60")),
+            min_calls=int(os.getenv("LLM_CIRCUIT_MIN_CALLS", "5")),
+            open_seconds=float(os.getenv("LLM_CIRCUIT_OPEN_SECONDS", "30"))
         )
         
+        # Primary completion bucket (kept for monitoring/compatibility)
+        self.rate_limiter = self.rate_limits.get("completion", self.model)
+        
+        # Configure response cache
+        if cache_enabled is None:
+            cache_enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+        self.response_cache = None
+        self.embedding_cache = None
+        if cache_enabled:
+            self.response_cache = ResponseCache(
+                ttl=float(os.getenv("LLM_CACHE_TTL", "600")),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+                path=os.getenv("LLM_CACHE_PATH") or None
+            )
+            self.embedding_cache = EmbeddingCache(
+                max_entries=int(os.getenv("LLM_EMBED_CACHE_MAX_ENTRIES", "5000")),
+                path=os.getenv("LLM_EMBED_CACHE_PATH", "/tmp/ai-agent/embeddings.db") or None
+            )
+        
         # Configure LiteLLM
         litellm.set_verbose = os.getenv("LLM_DEBUG", "false").lower() == "true"
         
         # Set API keys from environment
         self._configure_api_keys()
         
-        print(f"LLM Provider initialized: model={self.model}, rpm={rate_limit_rpm}, retries={max_retries}")
+        print(f"LLM Provider initialized: models={' -> '.join(self.models)}, rpm={rate_limit_rpm}, tpm={rate_limit_tpm or 'off'}, embed_rpm={embed_rate_limit_rpm}, retries={max_retries}")
     
     def _configure_api_keys(self) -> None:
         """Configure API keys for various providers from environment."""
@@ -125,6 +262,9 @@ class LLMProvider:
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
+        expect_json: bool = False,
+        json_schema: Optional[dict] = None,
+        cache: Optional[bool] = None,
         **kwargs
     ) -> str:
         """
@@ -135,6 +275,12 @@ class LLMProvider:
             system_prompt: Optional system prompt
             temperature: Sampling temperature (0.0-1.0)
             max_tokens: Maximum tokens to generate
+            expect_json: The caller only needs the first JSON object in the
+                         response; in streaming mode the call stops once it is complete
+            json_schema: JSON schema the response must follow; enforced through
+                         response_format on models that support it
+            cache: Use the response cache; by default only deterministic
+                   (temperature 0) calls are cached
             **kwargs: Additional arguments passed to LiteLLM
             
         Returns:
@@ -143,90 +289,548 @@ class LLMProvider:
         Raises:
             Exception: If all retries fail
         """
-        messages = []
+        messages = self._build_messages(prompt, system_prompt)
         
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
+        cache_keys, cached = self._cache_lookup(messages, temperature, max_tokens, expect_json, json_schema, cache, kwargs)
+        if cached is not None:
+            return cached
         
-        messages.append({"role": "user", "content": prompt})
+        response = self._call_with_retry(
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream_json=expect_json and self.streaming,
+            json_schema=json_schema if self.structured_output else None,
+            **kwargs
+        )
+        self._cache_store(cache_keys, response)
+        return response.text
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        expect_json: bool = False,
+        json_schema: Optional[dict] = None,
+        cache: Optional[bool] = None,
+        **kwargs
+    ) -> str:
+        """Async variant of generate(); waits without blocking the event loop."""
+        messages = self._build_messages(prompt, system_prompt)
+        
+        cache_keys, cached = self._cache_lookup(messages, temperature, max_tokens, expect_json, json_schema, cache, kwargs)
+        if cached is not None:
+            return cached
         
-        return self._call_with_retry(
+        response = await self._acall_with_retry(
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
+            stream_json=expect_json and self.streaming,
+            json_schema=json_schema if self.structured_output else None,
             **kwargs
         )
+        self._cache_store(cache_keys, response)
+        return response.text
+    
+    async def achat(
+        self,
+        messages: List[dict],
+        tools: Optional[List[dict]] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> LLMResponse:
+        """
+        One turn of a multi-turn conversation, optionally with tool calling.
+        
+        Not cached. Append response.assistant_message() and the tool results
+        to `messages` before the next turn.
+        
+        Args:
+            messages: Conversation so far (OpenAI message format)
+            tools: OpenAI-style function tool definitions
+            temperature: Sampling temperature (0.0-1.0)
+            max_tokens: Maximum tokens to generate
+            **kwargs: Additional arguments passed to LiteLLM
+            
+        Returns:
+            LLMResponse with text and/or tool_calls
+        """
+        if tools:
+            kwargs["tools"] = tools
+        return await self._acall_with_retry(
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+    
+    def _build_messages(self, prompt: str, system_prompt: Optional[str] = None) -> List[dict]:
+        """Build the chat message list for a prompt."""
+        messages = []
+        
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    def _cache_lookup(self, messages: List[dict], temperature: float, max_tokens: Optional[int],
+                      expect_json: bool, json_schema: Optional[dict], cache: Optional[bool],
+                      kwargs: dict) -> tuple:
+        """
+        Return (cache_keys, cached_text); both None when the call is not cached.
+        
+        Only deterministic calls (temperature 0) are cached unless `cache`
+        opts in or out explicitly. Responses are keyed by the model that
+        produced them, so cache_keys maps every model in the chain to its key;
+        the lookup prefers earlier models.
+        """
+        if cache is None:
+            cache = temperature == 0
+        if not self.response_cache or not cache:
+            return None, None
+        keys = {
+            model: self.response_cache.key(
+                model, messages, temperature=temperature, max_tokens=max_tokens,
+                expect_json=expect_json, json_schema=json_schema, **kwargs
+            )
+            for model in self.models
+        }
+        return keys, self.response_cache.get_first(list(keys.values()))
+    
+    def _cache_store(self, cache_keys: Optional[dict], response: LLMResponse) -> None:
+        """Cache a response under the key of the model that answered it."""
+        if cache_keys and self.response_cache and response.model in cache_keys:
+            self.response_cache.put(cache_keys[response.model], response.text)
     
     def _call_with_retry(
         self,
         messages: List[dict],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
+        stream_json: bool = False,
+        json_schema: Optional[dict] = None,
         **kwargs
-    ) -> str:
+    ) -> LLMResponse:
         """
         Call LLM with retry logic and rate limiting.
         
         Handles:
         - Rate limiting (proactive + reactive)
+        - Failover along the model chain: earlier models are skipped when their
+          bucket is empty or circuit is open and abandoned on error; only the
+          last model waits
+        - Fail fast (CircuitOpenError) when the last model's circuit is open
         - Automatic retries with exponential backoff
         - Retry-After header parsing
+        - Optional streaming with early stop at the first complete JSON object
         """
         last_error = None
+        reserved = self._estimate_tokens(messages, max_tokens)
         
         for attempt in range(self.max_retries):
+            for i, model in enumerate(self.models):
+                last = i == len(self.models) - 1
+                try:
+                    return self._call_model(
+                        model, messages, temperature, max_tokens, reserved,
+                        wait=last, stream_json=stream_json, json_schema=json_schema, **kwargs
+                    )
+                except _ModelUnavailable:
+                    FAILOVERS.labels(model=model, reason="no_budget").inc()
+                except CircuitOpenError:
+                    if last:
+                        raise
+                    FAILOVERS.labels(model=model, reason="circuit_open").inc()
+                except Exception as e:
+                    last_error = e
+                    limiter = self.rate_limits.get("completion", model)
+                    if not last:
+                        self._note_failure(e, model, limiter)
+                        continue
+                    wait_time = self._retry_delay(e, attempt, limiter)
+                    if wait_time:
+                        time.sleep(wait_time)
+        
+        raise Exception(f"LLM call failed after {self.max_retries} attempts: {last_error}")
+    
+    async def _acall_with_retry(
+        self,
+        messages: List[dict],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        stream_json: bool = False,
+        json_schema: Optional[dict] = None,
+        **kwargs
+    ) -> LLMResponse:
+        """Async variant of _call_with_retry(), with optional hedging."""
+        last_error = None
+        reserved = self._estimate_tokens(messages, max_tokens)
+        
+        for attempt in range(self.max_retries):
+            for i, model in enumerate(self.models):
+                last = i == len(self.models) - 1
+                try:
+                    if self.hedge_after and not last:
+                        return await self._ahedged_call(
+                            model, self.models[i + 1], messages, temperature, max_tokens, reserved,
+                            stream_json=stream_json, json_schema=json_schema, **kwargs
+                        )
+                    return await self._acall_model(
+                        model, messages, temperature, max_tokens, reserved,
+                        wait=last, stream_json=stream_json, json_schema=json_schema, **kwargs
+                    )
+                except _ModelUnavailable:
+                    FAILOVERS.labels(model=model, reason="no_budget").inc()
+                except CircuitOpenError:
+                    if last:
+                        raise
+                    FAILOVERS.labels(model=model, reason="circuit_open").inc()
+                except Exception as e:
+                    last_error = e
+                    limiter = self.rate_limits.get("completion", model)
+                    if not last:
+                        self._note_failure(e, model, limiter)
+                        continue
+                    wait_time = self._retry_delay(e, attempt, limiter)
+                    if wait_time:
+                        await asyncio.sleep(wait_time)
+        
+        raise Exception(f"LLM call failed after {self.max_retries} attempts: {last_error}")
+    
+    def _call_model(self, model: str, messages: List[dict], temperature: float, max_tokens: Optional[int],
+                    reserved: int, wait: bool = True, stream_json: bool = False,
+                    json_schema: Optional[dict] = None, **kwargs) -> LLMResponse:
+        """
+        One completion call against one model.
+        
+        Raises:
+            CircuitOpenError: If the model's circuit is open
+            _ModelUnavailable: If wait is False and the model's bucket is empty
+        """
+        breaker = self._check_circuit(model)
+        limiter = self.rate_limits.get("completion", model)
+        start = time.monotonic()
+        error = None
+        try:
+            # Wait for rate limit token (or just check, for models we can fail over from)
+            if not limiter.acquire(timeout=None if wait else 0, llm_tokens=reserved):
+                raise _ModelUnavailable(model)
+            
+            start = time.monotonic()
             try:
-                # Wait for rate limit token
-                self.rate_limiter.acquire()
-                
-                # Make the API call
                 response = completion(
-                    model=self.model,
+                    model=model,
                     messages=messages,
                     temperature=temperature,
                     max_tokens=max_tokens,
                     timeout=self.timeout,
+                    stream=stream_json,
+                    **self._output_format(model, json_schema),
                     **kwargs
                 )
-                
-                # Extract response headers if available (for rate limit info)
-                if hasattr(response, '_response') and hasattr(response._response, 'headers'):
-                    self.rate_limiter.update_from_headers(dict(response._response.headers))
-                
-                # Extract text from response
-                return response.choices[0].message.content
-                
-            except RateLimitError as e:
-                last_error = e
-                retry_after = self._extract_retry_after(e)
-                self.rate_limiter.report_rate_limit_error(retry_after)
-                
-                print(f"LLM_PROVIDER: Rate limit hit (attempt {attempt + 1}/{self.max_retries})")
-                
-                # Wait before retry
-                wait_time = retry_after if retry_after else (2 ** attempt) * 10
-                wait_time = min(wait_time, 120)  # Cap at 2 minutes
-                print(f"LLM_PROVIDER: Waiting {wait_time:.1f}s before retry...")
-                time.sleep(wait_time)
-                
-            except (APIError, ServiceUnavailableError) as e:
-                last_error = e
-                wait_time = (2 ** attempt) * 5  # Exponential backoff
-                wait_time = min(wait_time, 60)
-                
-                print(f"LLM_PROVIDER: API error (attempt {attempt + 1}/{self.max_retries}): {e}")
-                print(f"LLM_PROVIDER: Waiting {wait_time:.1f}s before retry...")
-                time.sleep(wait_time)
-                
+                if stream_json:
+                    text = self._collect_stream(response, model)
+                    limiter.reconcile(reserved, self._streamed_tokens(reserved, max_tokens, text))
+                    return LLMResponse(text=text, model=model, usage={})
+                return self._handle_response(response, model, limiter, reserved)
+            except Exception:
+                limiter.reconcile(reserved, 0)
+                raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._settle_circuit(breaker, error, start)
+    
+    async def _acall_model(self, model: str, messages: List[dict], temperature: float, max_tokens: Optional[int],
+                           reserved: int, wait: bool = True, stream_json: bool = False,
+                           json_schema: Optional[dict] = None, **kwargs) -> LLMResponse:
+        """Async variant of _call_model()."""
+        breaker = self._check_circuit(model)
+        limiter = self.rate_limits.get("completion", model)
+        start = time.monotonic()
+        error = None
+        try:
+            if not await limiter.acquire_async(timeout=None if wait else 0, llm_tokens=reserved):
+                raise _ModelUnavailable(model)
+            
+            start = time.monotonic()
+            try:
+                response = await acompletion(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=self.timeout,
+                    stream=stream_json,
+                    **self._output_format(model, json_schema),
+                    **kwargs
+                )
+                if stream_json:
+                    text = await self._acollect_stream(response, model)
+                    limiter.reconcile(reserved, self._streamed_tokens(reserved, max_tokens, text))
+                    return LLMResponse(text=text, model=model, usage={})
+                return self._handle_response(response, model, limiter, reserved)
+            except Exception:
+                limiter.reconcile(reserved, 0)
+                raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._settle_circuit(breaker, error, start)
+    
+    def _check_circuit(self, model: str) -> Optional[CircuitBreaker]:
+        """Return the model's breaker after admitting a call; raise CircuitOpenError if it is open."""
+        breaker = self.breakers.get(model)
+        if breaker and not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {model}")
+        return breaker
+    
+    @staticmethod
+    def _settle_circuit(breaker: Optional[CircuitBreaker], error: Optional[BaseException], start: float) -> None:
+        """Record a call's outcome; rate limits and cancellations say nothing about provider health."""
+        if breaker is None:
+            return
+        if error is None:
+            breaker.record(True, time.monotonic() - start)
+        elif isinstance(error, (RateLimitError, RateLimitQueueFull, _ModelUnavailable, asyncio.CancelledError)):
+            breaker.release()
+        else:
+            breaker.record(False, time.monotonic() - start)
+    
+    async def _ahedged_call(self, model: str, backup: str, messages: List[dict], temperature: float,
+                            max_tokens: Optional[int], reserved: int, stream_json: bool = False,
+                            json_schema: Optional[dict] = None, **kwargs) -> LLMResponse:
+        """
+        Call `model`; if it has not answered after hedge_after seconds, also call
+        `backup` and return whichever succeeds first (the other is cancelled).
+        
+        Raises the primary call's error if both fail.
+        """
+        primary = asyncio.ensure_future(
+            self._acall_model(model, messages, temperature, max_tokens, reserved,
+                              wait=False, stream_json=stream_json, json_schema=json_schema, **kwargs)
+        )
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return primary.result()
+            
+            print(f"LLM_PROVIDER: {model} slower than {self.hedge_after:.1f}s, hedging with {backup}")
+            FAILOVERS.labels(model=model, reason="hedged").inc()
+            hedge = asyncio.ensure_future(
+                self._acall_model(backup, messages, temperature, max_tokens, reserved,
+                                  wait=False, stream_json=stream_json, json_schema=json_schema, **kwargs)
+            )
+            pending.add(hedge)
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+                    if task is hedge and not isinstance(error, (_ModelUnavailable, CircuitOpenError)):
+                        self._note_failure(error, backup, self.rate_limits.get("completion", backup))
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _note_failure(self, error: Exception, model: str, limiter: SmartRateLimiter) -> None:
+        """Record a failed call on a model we are failing over from."""
+        if isinstance(error, RateLimitQueueFull):
+            # Shed from this model's queue only; the next model may have room
+            FAILOVERS.labels(model=model, reason="shed").inc()
+            print(f"LLM_PROVIDER: {model} queue full, failing over")
+        elif isinstance(error, RateLimitError):
+            # Block the bucket so later calls skip this model until its window passes
+            limiter.report_rate_limit_error(self._extract_retry_after(error))
+            FAILOVERS.labels(model=model, reason="rate_limited").inc()
+            print(f"LLM_PROVIDER: {model} rate limited, failing over")
+        else:
+            FAILOVERS.labels(model=model, reason="error").inc()
+            print(f"LLM_PROVIDER: {model} failed, failing over: {error}")
+    
+    def _handle_response(self, response: Any, model: str, limiter: SmartRateLimiter, reserved: int) -> LLMResponse:
+        """Feed rate limit headers and usage back to the limiter and extract text and tool calls."""
+        # Extract response headers if available (for rate limit info)
+        if hasattr(response, '_response') and hasattr(response._response, 'headers'):
+            limiter.update_from_headers(dict(response._response.headers))
+        
+        limiter.reconcile(reserved, self._usage_tokens(response))
+        
+        message = response.choices[0].message
+        tool_calls = []
+        for call in getattr(message, 'tool_calls', None) or []:
+            try:
+                arguments = json.loads(call.function.arguments or "{}")
+            except (json.JSONDecodeError, TypeError):
+                arguments = {}
+            tool_calls.append({"id": call.id, "name": call.function.name, "arguments": arguments})
+        
+        usage = getattr(response, 'usage', None)
+        return LLMResponse(
+            text=message.content or "",
+            model=model,
+            usage=dict(usage) if usage else {},
+            raw_response=response,
+            tool_calls=tool_calls
+        )
+    
+    def _output_format(self, model: str, json_schema: Optional[dict]) -> dict:
+        """
+        response_format kwargs for a model: a JSON schema where supported,
+        plain JSON mode where only that is, otherwise nothing (prompt-only).
+        """
+        if not json_schema:
+            return {}
+        
+        support = self._schema_support.get(model)
+        if support is None:
+            support = "none"
+            try:
+                if litellm.supports_response_schema(model=model):
+                    support = "schema"
+                elif "response_format" in (litellm.get_supported_openai_params(model=model) or []):
+                    support = "json"
             except Exception as e:
-                last_error = e
-                print(f"LLM_PROVIDER: Unexpected error (attempt {attempt + 1}/{self.max_retries}): {e}")
-                
-                if attempt < self.max_retries - 1:
-                    wait_time = (2 ** attempt) * 2
-                    time.sleep(wait_time)
+                print(f"LLM_PROVIDER: Could not check structured output support for {model}: {e}")
+            self._schema_support[model] = support
         
-        raise Exception(f"LLM call failed after {self.max_retries} attempts: {last_error}")
+        if support == "schema":
+            return {"response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": json_schema},
+            }}
+        if support == "json":
+            return {"response_format": {"type": "json_object"}}
+        return {}
+    
+    def _collect_stream(self, stream: Any, model: str) -> str:
+        """Read a streamed completion until the first JSON object is complete (or the stream ends)."""
+        scanner = JsonObjectScanner()
+        try:
+            for chunk in stream:
+                if scanner.feed(self._chunk_text(chunk)) is not None:
+                    STREAM_EARLY_STOPS.labels(model=model).inc()
+                    break
+        finally:
+            self._close_stream(stream)
+        return scanner.result or scanner.text
+    
+    @staticmethod
+    def _close_stream(stream: Any) -> None:
+        """
+        Abort a sync stream so the provider stops generating.
+        
+        LiteLLM's sync wrapper has no close(); close the provider stream it
+        wraps (an SDK stream or generator holding the HTTP response) instead.
+        """
+        close = getattr(stream, "close", None)
+        if not callable(close):
+            inner = getattr(stream, "completion_stream", None)
+            if inner is None:
+                return
+            stream.completion_stream = None
+            close = getattr(inner, "close", None)
+            if not callable(close):
+                return
+        try:
+            close()
+        except Exception as e:
+            print(f"LLM_PROVIDER: Error closing stream: {e}")
+    
+    async def _acollect_stream(self, stream: Any, model: str) -> str:
+        """Async variant of _collect_stream()."""
+        scanner = JsonObjectScanner()
+        try:
+            async for chunk in stream:
+                if scanner.feed(self._chunk_text(chunk)) is not None:
+                    STREAM_EARLY_STOPS.labels(model=model).inc()
+                    break
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if callable(aclose):
+                await aclose()
+        return scanner.result or scanner.text
+    
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Text delta of one streamed chunk ("" for role/usage-only chunks)."""
+        choices = getattr(chunk, "choices", None)
+        if not choices:
+            return ""
+        delta = getattr(choices[0], "delta", None)
+        return getattr(delta, "content", None) or ""
+    
+    def _streamed_tokens(self, reserved: int, max_tokens: Optional[int], text: str) -> int:
+        """Usage for a stream stopped early: the reserved prompt estimate plus the output actually read."""
+        return reserved - (max_tokens or self.DEFAULT_OUTPUT_TOKENS) + SmartRateLimiter.estimate_tokens(text)
+    
+    # Output tokens assumed when max_tokens is not set
+    DEFAULT_OUTPUT_TOKENS = 512
+    
+    def _estimate_tokens(self, messages: List[dict], max_tokens: Optional[int] = None) -> int:
+        """Estimate prompt + completion tokens to reserve before a call."""
+        prompt_tokens = sum(
+            SmartRateLimiter.estimate_tokens(msg.get("content") or "")
+            for msg in messages
+            if isinstance(msg.get("content"), str)
+        )
+        return prompt_tokens + (max_tokens or self.DEFAULT_OUTPUT_TOKENS)
+    
+    @staticmethod
+    def _usage_tokens(response: Any) -> Optional[int]:
+        """Total tokens reported by the provider, if any."""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None
+        total = usage.get('total_tokens') if isinstance(usage, dict) else getattr(usage, 'total_tokens', None)
+        return int(total) if total else None
+    
+    def _retry_delay(self, error: Exception, attempt: int, limiter: SmartRateLimiter) -> float:
+        """
+        Classify a failed completion call and return seconds to wait before retrying.
+        
+        Rate limit errors honour Retry-After, API errors back off exponentially,
+        and unexpected errors back off briefly (no wait after the last attempt).
+        Shed requests are re-raised immediately.
+        """
+        if isinstance(error, RateLimitQueueFull):
+            raise error
+        
+        if isinstance(error, RateLimitError):
+            retry_after = self._extract_retry_after(error)
+            limiter.report_rate_limit_error(retry_after)
+            
+            print(f"LLM_PROVIDER: Rate limit hit (attempt {attempt + 1}/{self.max_retries})")
+            
+            # Wait before retry
+            wait_time = retry_after if retry_after else (2 ** attempt) * 10
+            wait_time = min(wait_time, 120)  # Cap at 2 minutes
+            print(f"LLM_PROVIDER: Waiting {wait_time:.1f}s before retry...")
+            return wait_time
+        
+        if isinstance(error, (APIError, ServiceUnavailableError)):
+            wait_time = (2 ** attempt) * 5  # Exponential backoff
+            wait_time = min(wait_time, 60)
+            
+            print(f"LLM_PROVIDER: API error (attempt {attempt + 1}/{self.max_retries}): {error}")
+            print(f"LLM_PROVIDER: Waiting {wait_time:.1f}s before retry...")
+            return wait_time
+        
+        print(f"LLM_PROVIDER: Unexpected error (attempt {attempt + 1}/{self.max_retries}): {error}")
+        if attempt < self.max_retries - 1:
+            return (2 ** attempt) * 2
+        return 0
     
     def _extract_retry_after(self, error: Exception) -> Optional[float]:
         """Extract Retry-After value from error response."""
@@ -243,7 +847,6 @@ class LLMProvider:
         # Try to parse from error message (Gemini format)
         error_str = str(error)
         if 'retry after' in error_str.lower():
-            import re
             match = re.search(r'retry after (\d+)', error_str.lower())
             if match:
                 return float(match.group(1))
@@ -261,42 +864,94 @@ class LLMProvider:
         Returns:
             Embedding vector as list of floats
         """
-        # Use appropriate embedding model based on provider
-        embed_model = model
-        if not embed_model:
-            if self.model.startswith('gemini/'):
-                embed_model = "gemini/text-embedding-004"
-            elif self.model.startswith('openai/'):
-                embed_model = "openai/text-embedding-3-small"
-            else:
-                # Default to OpenAI-compatible embeddings
-                embed_model = "text-embedding-3-small"
+        embed_model = self._embedding_model(model)
+        
+        if self.embedding_cache:
+            cached = self.embedding_cache.get(embed_model, text)
+            if cached is not None:
+                return cached
+        
+        limiter = self.rate_limits.get("embedding", embed_model)
+        reserved = SmartRateLimiter.estimate_tokens(text)
         
         for attempt in range(self.max_retries):
             try:
-                self.rate_limiter.acquire()
+                limiter.acquire(llm_tokens=reserved)
                 
                 response = embedding(
                     model=embed_model,
                     input=[text]
                 )
                 
-                return response.data[0]['embedding']
+                limiter.reconcile(reserved, self._usage_tokens(response))
+                return self._store_embedding(embed_model, text, response.data[0]['embedding'])
+                
+            except Exception as e:
+                time.sleep(self._embed_retry_delay(e, attempt, limiter))
+        
+        raise Exception(f"Embedding call failed after {self.max_retries} attempts")
+    
+    async def aembed(self, text: str, model: Optional[str] = None) -> List[float]:
+        """Async variant of embed()."""
+        embed_model = self._embedding_model(model)
+        
+        if self.embedding_cache:
+            cached = self.embedding_cache.get(embed_model, text)
+            if cached is not None:
+                return cached
+        
+        limiter = self.rate_limits.get("embedding", embed_model)
+        reserved = SmartRateLimiter.estimate_tokens(text)
+        
+        for attempt in range(self.max_retries):
+            try:
+                await limiter.acquire_async(llm_tokens=reserved)
                 
-            except RateLimitError as e:
-                retry_after = self._extract_retry_after(e)
-                self.rate_limiter.report_rate_limit_error(retry_after)
+                response = await aembedding(
+                    model=embed_model,
+                    input=[text]
+                )
                 
-                wait_time = retry_after if retry_after else (2 ** attempt) * 10
-                wait_time = min(wait_time, 120)
-                print(f"LLM_PROVIDER: Embedding rate limit, waiting {wait_time:.1f}s...")
-                time.sleep(wait_time)
+                limiter.reconcile(reserved, self._usage_tokens(response))
+                return self._store_embedding(embed_model, text, response.data[0]['embedding'])
                 
             except Exception as e:
-                if attempt == self.max_retries - 1:
-                    raise
-                wait_time = (2 ** attempt) * 2
-                print(f"LLM_PROVIDER: Embedding error, retrying in {wait_time}s: {e}")
-                time.sleep(wait_time)
+                await asyncio.sleep(self._embed_retry_delay(e, attempt, limiter))
         
         raise Exception(f"Embedding call failed after {self.max_retries} attempts")
+    
+    def _store_embedding(self, model: str, text: str, vector: List[float]) -> List[float]:
+        if self.embedding_cache:
+            self.embedding_cache.put(model, text, vector)
+        return vector
+    
+    def _embedding_model(self, model: Optional[str] = None) -> str:
+        """Pick the embedding model matching the configured provider."""
+        if model:
+            return model
+        if self.model.startswith('gemini/'):
+            return "gemini/text-embedding-004"
+        if self.model.startswith('openai/'):
+            return "openai/text-embedding-3-small"
+        # Default to OpenAI-compatible embeddings
+        return "text-embedding-3-small"
+    
+    def _embed_retry_delay(self, error: Exception, attempt: int, limiter: SmartRateLimiter) -> float:
+        """Return seconds to wait after a failed embedding call; re-raises on the last attempt."""
+        if isinstance(error, RateLimitQueueFull):
+            raise error
+        
+        if isinstance(error, RateLimitError):
+            retry_after = self._extract_retry_after(error)
+            limiter.report_rate_limit_error(retry_after)
+            
+            wait_time = retry_after if retry_after else (2 ** attempt) * 10
+            wait_time = min(wait_time, 120)
+            print(f"LLM_PROVIDER: Embedding rate limit, waiting {wait_time:.1f}s...")
+            return wait_time
+        
+        if attempt == self.max_retries - 1:
+            raise error
+        wait_time = (2 ** attempt) * 2
+        print(f"LLM_PROVIDER: Embedding error, retrying in {wait_time}s: {error}")
+        return wait_time
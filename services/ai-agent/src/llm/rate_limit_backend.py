@@ -0,0 +1,296 @@
+"""
+Shared-state backends for SmartRateLimiter.
+The token bucket state can live in process memory (default), in a locked file
+shared by workers on one node, or in Redis shared by every replica, so a
+provider quota is enforced as one global budget.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional
+
+
+@dataclass
+class RateLimitState:
+    """Tracks rate limit state including API feedback."""
+    tokens: float
+    last_refill: float
+    token_budget: float = 0.0  # LLM tokens available under the TPM limit
+    retry_after: Optional[float] = None
+    retry_after_until: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class BucketConfig:
+    """Static limits of one bucket."""
+    max_tokens: float
+    tokens_per_second: float
+    tpm: float = 0.0
+    llm_tokens_per_second: float = 0.0
+
+    def initial_state(self, now: float) -> RateLimitState:
+        return RateLimitState(tokens=self.max_tokens, last_refill=now, token_budget=self.tpm)
+
+
+def take(state: RateLimitState, config: BucketConfig, now: float, llm_tokens: int = 0) -> float:
+    """
+    Refill a bucket and try to take one request token plus `llm_tokens`.
+
+    Mutates `state`. Returns 0 if acquired, otherwise seconds to wait.
+    """
+    # Check if we're in a Retry-After window
+    if state.retry_after_until and now < state.retry_after_until:
+        return state.retry_after_until - now
+
+    # Refill tokens
+    elapsed = max(0.0, now - state.last_refill)
+    state.tokens = min(config.max_tokens, state.tokens + elapsed * config.tokens_per_second)
+    if config.tpm:
+        state.token_budget = min(config.tpm, state.token_budget + elapsed * config.llm_tokens_per_second)
+    state.last_refill = now
+
+    # A single request larger than the whole quota waits for a full bucket
+    needed_budget = min(llm_tokens, config.tpm) if config.tpm else 0
+
+    # Try to consume a token
+    if state.tokens >= 1.0 and state.token_budget >= needed_budget:
+        state.tokens -= 1.0
+        if config.tpm:
+            state.token_budget -= llm_tokens
+        return 0
+
+    # Calculate wait time for next token (whichever bucket is slower)
+    wait = 0.0
+    if state.tokens < 1.0:
+        wait = (1.0 - state.tokens) / config.tokens_per_second
+    if state.token_budget < needed_budget:
+        wait = max(wait, (needed_budget - state.token_budget) / config.llm_tokens_per_second)
+    return wait
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage for bucket state, keyed by bucket name (e.g. "completion:gemini/gemini-2.5-flash").
+
+    Every operation must be atomic with respect to other callers sharing the backend.
+    Backends that do I/O set `blocking`, so async callers run them off the event loop.
+    """
+
+    blocking = True
+
+    @abstractmethod
+    def try_acquire(self, key: str, config: BucketConfig, llm_tokens: int = 0) -> float:
+        """Take a token; return 0 if acquired, otherwise seconds to wait."""
+
+    @abstractmethod
+    def adjust_budget(self, key: str, config: BucketConfig, delta: float) -> None:
+        """Add (refund) or subtract (charge) LLM tokens from the TPM budget."""
+
+    @abstractmethod
+    def block(self, key: str, config: BucketConfig, seconds: float, drain: bool = False) -> None:
+        """Start (or extend) a Retry-After window, optionally draining request tokens."""
+
+    @abstractmethod
+    def available(self, key: str, config: BucketConfig) -> float:
+        """Request tokens currently available (for monitoring)."""
+
+
+class _StateBackend(RateLimitBackend):
+    """Backend that loads a RateLimitState, applies the bucket math and saves it."""
+
+    clock: Callable[[], float] = time.time
+
+    @abstractmethod
+    def _update(self, key: str, config: BucketConfig, fn: Callable[[RateLimitState, float], float]) -> float:
+        """Atomically apply fn(state, now) to the stored state and return its result."""
+
+    def try_acquire(self, key: str, config: BucketConfig, llm_tokens: int = 0) -> float:
+        return self._update(key, config, lambda state, now: take(state, config, now, llm_tokens))
+
+    def adjust_budget(self, key: str, config: BucketConfig, delta: float) -> None:
+        def apply(state, now):
+            state.token_budget = min(config.tpm, state.token_budget + delta)
+            return 0
+        self._update(key, config, apply)
+
+    def block(self, key: str, config: BucketConfig, seconds: float, drain: bool = False) -> None:
+        def apply(state, now):
+            state.retry_after = seconds
+            state.retry_after_until = max(state.retry_after_until or 0, now + seconds)
+            if drain:
+                # Drain tokens to prevent immediate retry
+                state.tokens = 0
+            return 0
+        self._update(key, config, apply)
+
+    def available(self, key: str, config: BucketConfig) -> float:
+        def peek(state, now):
+            elapsed = max(0.0, now - state.last_refill)
+            return min(config.max_tokens, state.tokens + elapsed * config.tokens_per_second)
+        return self._update(key, config, peek)
+
+
+class LocalBackend(_StateBackend):
+    """In-process state (the default); each process enforces its own budget."""
+
+    clock = staticmethod(time.monotonic)
+    blocking = False
+
+    def __init__(self):
+        self._states: Dict[str, RateLimitState] = {}
+        self._lock = threading.Lock()
+
+    def _update(self, key, config, fn):
+        with self._lock:
+            now = self.clock()
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = config.initial_state(now)
+            return fn(state, now)
+
+
+class FileBackend(_StateBackend):
+    """
+    State in a JSON file guarded by an exclusive flock.
+
+    For workers on the same node sharing a volume (e.g. a hostPath or a pod's
+    emptyDir shared by several containers). Uses wall-clock time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _update(self, key, config, fn):
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                states = json.loads(raw) if raw.strip() else {}
+                now = self.clock()
+                state = RateLimitState(**states[key]) if key in states else config.initial_state(now)
+                result = fn(state, now)
+                states[key] = asdict(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(states))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RedisBackend(RateLimitBackend):
+    """
+    State in Redis hashes, updated by Lua scripts so every replica shares one budget.
+
+    Time comes from the Redis server, so replica clock skew does not matter.
+    Requires the `redis` package.
+    """
+
+    _TAKE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local capacity, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tpm, tpm_rate, need = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local s = redis.call('HMGET', KEYS[1], 'tokens', 'budget', 'last', 'blocked_until')
+local tokens = tonumber(s[1]) or capacity
+local budget = tonumber(s[2]) or tpm
+local last = tonumber(s[3]) or now
+local blocked = tonumber(s[4]) or 0
+if now < blocked then return tostring(blocked - now) end
+local elapsed = math.max(0, now - last)
+tokens = math.min(capacity, tokens + elapsed * rate)
+if tpm > 0 then budget = math.min(tpm, budget + elapsed * tpm_rate) end
+local needed = 0
+if tpm > 0 then needed = math.min(need, tpm) end
+local wait = 0
+if tokens >= 1 and budget >= needed then
+  tokens = tokens - 1
+  if tpm > 0 then budget = budget - need end
+else
+  if tokens < 1 then wait = (1 - tokens) / rate end
+  if budget < needed then wait = math.max(wait, (needed - budget) / tpm_rate) end
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'budget', budget, 'last', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+    _ADJUST = """
+local tpm, delta = tonumber(ARGV[1]), tonumber(ARGV[2])
+local budget = tonumber(redis.call('HGET', KEYS[1], 'budget')) or tpm
+redis.call('HSET', KEYS[1], 'budget', math.min(tpm, budget + delta))
+redis.call('EXPIRE', KEYS[1], 3600)
+return 0
+"""
+
+    _BLOCK = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local until_ts = now + tonumber(ARGV[1])
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+redis.call('HSET', KEYS[1], 'blocked_until', math.max(blocked, until_ts))
+if ARGV[2] == '1' then redis.call('HSET', KEYS[1], 'tokens', 0, 'last', now) end
+redis.call('EXPIRE', KEYS[1], 3600)
+return 0
+"""
+
+    def __init__(self, url: str, prefix: str = "ai-agent:ratelimit:"):
+        import redis  # Optional dependency, only needed for this backend
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self._TAKE)
+        self._adjust = self._client.register_script(self._ADJUST)
+        self._block = self._client.register_script(self._BLOCK)
+
+    def try_acquire(self, key, config, llm_tokens=0):
+        wait = self._take(
+            keys=[self.prefix + key],
+            args=[config.max_tokens, config.tokens_per_second, config.tpm, config.llm_tokens_per_second, llm_tokens]
+        )
+        return float(wait)
+
+    def adjust_budget(self, key, config, delta):
+        self._adjust(keys=[self.prefix + key], args=[config.tpm, delta])
+
+    def block(self, key, config, seconds, drain=False):
+        self._block(keys=[self.prefix + key], args=[seconds, "1" if drain else "0"])
+
+    def available(self, key, config):
+        tokens, last = self._client.hmget(self.prefix + key, "tokens", "last")
+        if tokens is None:
+            return config.max_tokens
+        elapsed = max(0.0, time.time() - float(last))
+        return min(config.max_tokens, float(tokens) + elapsed * config.tokens_per_second)
+
+
+def create_backend(kind: str, state_path: Optional[str] = None, redis_url: Optional[str] = None) -> RateLimitBackend:
+    """
+    Build a backend by name.
+
+    Args:
+        kind: "local", "file" or "redis"
+        state_path: State file for the file backend
+        redis_url: Connection URL for the redis backend
+    """
+    kind = (kind or "local").lower()
+    if kind == "file":
+        return FileBackend(state_path or "/tmp/ai-agent/ratelimit.json")
+    if kind == "redis":
+        if not redis_url:
+            raise ValueError("redis rate limit backend requires a Redis URL")
+        return RedisBackend(redis_url)
+    if kind != "local":
+        raise ValueError(f"Unknown rate limit backend: {kind}")
+    return LocalBackend()
@@ -1,21 +1,85 @@
 """
 Rate limiter with Retry-After header support for LLM API calls.
 Implements token bucket algorithm with dynamic adjustment based on API feedback.
+Requests per minute (RPM) and LLM tokens per minute (TPM) are tracked as two buckets.
 """
 
+import asyncio
+import heapq
+import itertools
 import time
 import threading
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
+from prometheus_client import Counter
 
-@dataclass
-class RateLimitState:
-    """Tracks rate limit state including API feedback."""
-    tokens: float
-    last_refill: float
-    retry_after: Optional[float] = None
-    retry_after_until: Optional[float] = None
+from llm.rate_limit_backend import BucketConfig, LocalBackend, RateLimitBackend
+
+REQUESTS_SHED = Counter('orchestrator_llm_requests_shed_total', 'LLM requests shed by the rate limiter queue', ['level'])
+
+
+@dataclass(frozen=True, order=True)
+class RequestPriority:
+    """Scheduling priority for an LLM call: lower level first, then older events first."""
+    level: int
+    created_at: float
+
+
+# Alert severity -> priority level (0 = most urgent)
+SEVERITY_LEVELS = {
+    "critical": 0,
+    "page": 0,
+    "high": 1,
+    "error": 1,
+    "warning": 2,
+    "medium": 2,
+    "low": 3,
+    "info": 3,
+}
+# Alerts without a recognised severity (and calls outside an incident): behind
+# high-severity work but never shed, since their urgency is unknown
+UNKNOWN_LEVEL = 1
+# Levels at or above this may be shed when the queue is deep (warning, info)
+SHED_LEVEL = 2
+
+# Priority of the incident being processed; set once per incident, inherited by
+# tasks and threads spawned from it so every LLM call is scheduled accordingly
+current_priority: ContextVar[Optional[RequestPriority]] = ContextVar("llm_request_priority", default=None)
+
+
+def priority_for(severity: str, created_at: Optional[float] = None) -> RequestPriority:
+    """Build a RequestPriority from an alert severity and event time (epoch seconds)."""
+    level = SEVERITY_LEVELS.get((severity or "").strip().lower(), UNKNOWN_LEVEL)
+    return RequestPriority(level=level, created_at=created_at or time.time())
+
+
+class RateLimitQueueFull(Exception):
+    """Raised when a low-priority request is shed because the wait queue is too deep."""
+
+
+class _Waiter:
+    """A caller blocked in acquire()/acquire_async(), woken via an event."""
+    
+    __slots__ = ("priority", "seq", "logged", "event", "loop", "async_event")
+    
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority: Optional[RequestPriority] = None
+        self.seq = 0
+        self.logged = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.async_event = asyncio.Event() if loop else None
+    
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+    
+    def wake(self) -> None:
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.async_event.set)
+        else:
+            self.event.set()
 
 
 class SmartRateLimiter:
@@ -24,16 +88,27 @@ class SmartRateLimiter:
     
     Features:
     - Proactive rate limiting (token bucket)
+    - Optional TPM bucket: reserve estimated prompt tokens, reconcile with actual usage
     - Reactive rate limiting (Retry-After header parsing)
-    - Thread-safe
+    - Priority queue: waiters are served by alert severity, then event age
+    - Load shedding of low-priority requests when the queue is deep
+    - Event-driven waiting: one timed sleeper, others woken on hand-off
+    - Thread-safe, with an asyncio-native acquire_async()
+    - Blocking backends (file, Redis) are called off the event loop from async code
     - Dynamic adjustment based on API feedback
+    - Pluggable state backend, so replicas can share one budget and Retry-After window
     """
     
     def __init__(
         self,
         requests_per_minute: float = 5.0,  # Gemini free tier default
         burst_size: Optional[int] = None,
-        enabled: bool = True
+        enabled: bool = True,
+        tokens_per_minute: Optional[float] = None,
+        max_queue_depth: int = 0,
+        shed_level: int = SHED_LEVEL,
+        backend: Optional[RateLimitBackend] = None,
+        key: str = "default"
     ):
         """
         Initialize the rate limiter.
@@ -42,78 +117,264 @@ class SmartRateLimiter:
             requests_per_minute: Sustained request rate limit
             burst_size: Max burst size (defaults to requests_per_minute)
             enabled: Whether rate limiting is active (disable for self-hosted)
+            tokens_per_minute: LLM token quota per minute (None/0 = not enforced)
+            max_queue_depth: Waiters allowed before shedding (0 = never shed)
+            shed_level: Priority level at or above which requests may be shed
+            backend: Where bucket state lives (defaults to this process's memory)
+            key: Bucket name within the backend
         """
         self.rpm = requests_per_minute
         self.tokens_per_second = requests_per_minute / 60.0
         self.max_tokens = burst_size if burst_size else max(1, int(requests_per_minute))
         self.enabled = enabled
         
-        self._state = RateLimitState(
-            tokens=self.max_tokens,
-            last_refill=time.monotonic()
+        self.tpm = tokens_per_minute or 0
+        self.llm_tokens_per_second = self.tpm / 60.0
+        
+        self.backend = backend or LocalBackend()
+        self.key = key
+        self._config = BucketConfig(
+            max_tokens=self.max_tokens,
+            tokens_per_second=self.tokens_per_second,
+            tpm=self.tpm,
+            llm_tokens_per_second=self.llm_tokens_per_second
         )
+        self.max_queue_depth = max_queue_depth
+        self.shed_level = shed_level
+        
         self._lock = threading.Lock()
+        # Min-heap of waiters; only the head may take a token
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
     
-    def acquire(self, timeout: Optional[float] = None) -> bool:
+    def acquire(self, timeout: Optional[float] = None, llm_tokens: int = 0) -> bool:
         """
         Acquire a token, waiting if necessary.
         
+        Waiters are served in priority order taken from `current_priority`
+        (alert severity, then event age); callers without one get UNKNOWN_LEVEL.
+        Only the head waiter sleeps on a timer; the others block until woken.
+        
         Args:
             timeout: Max time to wait (None = wait forever)
+            llm_tokens: Estimated LLM tokens to reserve from the TPM bucket;
+                        settle with reconcile() once actual usage is known
             
         Returns:
             True if token acquired, False if timed out
+            
+        Raises:
+            RateLimitQueueFull: If the request was shed
         """
         if not self.enabled:
             return True
         
-        start_time = time.monotonic()
+        waiter = self._enqueue(_Waiter())
+        deadline = time.monotonic() + timeout if timeout is not None else None
         
-        while True:
-            wait_time = self._try_acquire()
-            
-            if wait_time == 0:
-                return True
-            
-            # Check timeout
-            if timeout is not None:
-                elapsed = time.monotonic() - start_time
-                if elapsed + wait_time > timeout:
+        try:
+            while True:
+                wait_time = self._poll(waiter, llm_tokens)
+                if wait_time == 0:
+                    return True
+                
+                wait_for = self._wait_budget(waiter, wait_time, deadline)
+                if wait_for is not None and wait_for <= 0:
                     return False
-            
+                
+                waiter.event.wait(wait_for)
+                waiter.event.clear()
+        finally:
+            self._dequeue(waiter)
+    
+    async def acquire_async(self, timeout: Optional[float] = None, llm_tokens: int = 0) -> bool:
+        """
+        Async variant of acquire(); waits on the event loop without a thread.
+        
+        Same arguments, return value and exceptions as acquire().
+        """
+        if not self.enabled:
+            return True
+        
+        waiter = self._enqueue(_Waiter(asyncio.get_running_loop()))
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        
+        try:
+            while True:
+                wait_time = await self._apoll(waiter, llm_tokens)
+                if wait_time == 0:
+                    return True
+                
+                wait_for = self._wait_budget(waiter, wait_time, deadline)
+                if wait_for is not None and wait_for <= 0:
+                    return False
+                
+                try:
+                    await asyncio.wait_for(waiter.async_event.wait(), wait_for)
+                except asyncio.TimeoutError:
+                    pass
+                waiter.async_event.clear()
+        finally:
+            self._dequeue(waiter)
+    
+    def _wait_budget(self, waiter: "_Waiter", wait_time: Optional[float],
+                     deadline: Optional[float]) -> Optional[float]:
+        """
+        Seconds to block for this round (None = until woken); <= 0 means time out.
+        
+        Logs once per acquire rather than once per wakeup.
+        """
+        if not waiter.logged and wait_time:
+            waiter.logged = True
             print(f"RATE_LIMITER: Waiting {wait_time:.1f}s before next request...")
-            time.sleep(min(wait_time, 1.0))  # Sleep in chunks for responsiveness
+        
+        if deadline is None:
+            return wait_time
+        
+        remaining = deadline - time.monotonic()
+        # Head waiter: give up now if the next token lands after the deadline
+        if wait_time is not None and wait_time > remaining:
+            return 0
+        return remaining if wait_time is None else wait_time
+    
+    def _enqueue(self, waiter: "_Waiter") -> "_Waiter":
+        """Register a waiter, shedding low-priority requests when the queue is deep."""
+        waiter.priority = current_priority.get() or priority_for("")
+        waiter.seq = next(self._seq)
+        with self._lock:
+            if (self.max_queue_depth and len(self._waiters) >= self.max_queue_depth
+                    and waiter.priority.level >= self.shed_level):
+                REQUESTS_SHED.labels(level=str(waiter.priority.level)).inc()
+                raise RateLimitQueueFull(
+                    f"{len(self._waiters)} requests queued; shedding priority {waiter.priority.level} request"
+                )
+            heapq.heappush(self._waiters, waiter)
+        return waiter
     
-    def _try_acquire(self) -> float:
+    def _dequeue(self, waiter: "_Waiter") -> None:
+        """Remove a waiter that gave up (timeout/cancel); hand the head to the next one."""
+        with self._lock:
+            if waiter not in self._waiters:
+                return
+            was_head = self._waiters[0] is waiter
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            if was_head:
+                self._wake_head_locked()
+    
+    def _wake_head_locked(self) -> None:
+        if self._waiters:
+            self._waiters[0].wake()
+    
+    def _wake_head(self) -> None:
+        with self._lock:
+            self._wake_head_locked()
+    
+    def _is_head(self, waiter: "_Waiter") -> bool:
+        with self._lock:
+            return self._waiters[0] is waiter
+    
+    def _acquired(self, waiter: "_Waiter") -> None:
+        """Remove a waiter that got its token; the next in line becomes head and starts its timed wait."""
+        with self._lock:
+            if self._waiters and self._waiters[0] is waiter:
+                heapq.heappop(self._waiters)
+            elif waiter in self._waiters:
+                # A higher-priority waiter arrived while the backend call was in flight
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            self._wake_head_locked()
+    
+    def _poll(self, waiter: "_Waiter", llm_tokens: int) -> Optional[float]:
         """
-        Try to acquire a token.
+        Try to take a token for `waiter`.
+        
+        The backend is called outside the waiter lock; backends are atomic on
+        their own and may do I/O.
+        
+        Returns:
+            0 if acquired, seconds until the next token if `waiter` is the head,
+            or None if a higher-priority waiter is ahead (wait to be woken)
+        """
+        if not self._is_head(waiter):
+            return None
+        wait_time = self._try_acquire(llm_tokens)
+        if wait_time == 0:
+            self._acquired(waiter)
+        return wait_time
+    
+    async def _apoll(self, waiter: "_Waiter", llm_tokens: int) -> Optional[float]:
+        """Async variant of _poll(); blocking backends run in a worker thread."""
+        if not self._is_head(waiter):
+            return None
+        if self.backend.blocking:
+            wait_time = await asyncio.to_thread(self._try_acquire, llm_tokens)
+        else:
+            wait_time = self._try_acquire(llm_tokens)
+        if wait_time == 0:
+            self._acquired(waiter)
+        return wait_time
+    
+    def _try_acquire(self, llm_tokens: int = 0) -> float:
+        """
+        Try to acquire a request token and reserve LLM tokens, ignoring the wait queue.
         
         Returns:
             0 if acquired, otherwise seconds to wait
         """
-        with self._lock:
-            now = time.monotonic()
-            
-            # Check if we're in a Retry-After window
-            if self._state.retry_after_until and now < self._state.retry_after_until:
-                return self._state.retry_after_until - now
-            
-            # Refill tokens
-            elapsed = now - self._state.last_refill
-            self._state.tokens = min(
-                self.max_tokens,
-                self._state.tokens + elapsed * self.tokens_per_second
-            )
-            self._state.last_refill = now
-            
-            # Try to consume a token
-            if self._state.tokens >= 1.0:
-                self._state.tokens -= 1.0
-                return 0
-            
-            # Calculate wait time for next token
-            tokens_needed = 1.0 - self._state.tokens
-            return tokens_needed / self.tokens_per_second
+        return self.backend.try_acquire(self.key, self._config, llm_tokens)
+    
+    def _write(self, fn, *args, then=None) -> None:
+        """
+        Apply a backend update.
+        
+        Called from the event loop with a blocking backend, the update runs in
+        a worker thread without being awaited (callers don't need its result);
+        otherwise it runs inline. `then` runs once the update is applied.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        
+        if loop is None or not self.backend.blocking:
+            fn(*args)
+            if then:
+                then()
+            return
+        
+        def finished(future):
+            if future.exception():
+                print(f"RATE_LIMITER: Backend update failed: {future.exception()}")
+            elif then:
+                then()
+        
+        loop.run_in_executor(None, fn, *args).add_done_callback(finished)
+    
+    def reconcile(self, reserved: int, actual: Optional[int]) -> None:
+        """
+        Settle a TPM reservation against actual usage.
+        
+        Over-estimates are refunded; under-estimates are charged, possibly
+        driving the budget negative so later callers wait longer.
+        
+        Args:
+            reserved: Tokens passed to acquire()
+            actual: Tokens reported in the response usage (None = keep estimate)
+        """
+        if not self.enabled or not self.tpm or actual is None:
+            return
+        
+        # A refund may unblock the head waiter before its timer fires
+        self._write(
+            self.backend.adjust_budget, self.key, self._config, reserved - actual,
+            then=self._wake_head if reserved > actual else None
+        )
+    
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token estimate (~4 characters per token)."""
+        return len(text) // 4 + 1
     
     def update_from_headers(self, headers: dict) -> None:
         """
@@ -152,10 +413,8 @@ class SmartRateLimiter:
                 pass
         
         if retry_after and retry_after > 0:
-            with self._lock:
-                self._state.retry_after = retry_after
-                self._state.retry_after_until = time.monotonic() + retry_after
-                print(f"RATE_LIMITER: Received Retry-After header, waiting {retry_after:.1f}s")
+            self._write(self.backend.block, self.key, self._config, retry_after)
+            print(f"RATE_LIMITER: Received Retry-After header, waiting {retry_after:.1f}s")
     
     def _parse_retry_after(self, value: str) -> Optional[float]:
         """Parse Retry-After header value (seconds or HTTP-date)."""
@@ -187,27 +446,110 @@ class SmartRateLimiter:
         if not self.enabled:
             return
         
-        with self._lock:
-            if retry_after:
-                wait_time = retry_after
-            else:
-                # Default backoff: 60 seconds for Gemini free tier
-                wait_time = 60.0
-            
-            self._state.retry_after = wait_time
-            self._state.retry_after_until = time.monotonic() + wait_time
-            # Drain tokens to prevent immediate retry
-            self._state.tokens = 0
-            
-            print(f"RATE_LIMITER: Rate limit hit, backing off for {wait_time:.1f}s")
+        if retry_after:
+            wait_time = retry_after
+        else:
+            # Default backoff: 60 seconds for Gemini free tier
+            wait_time = 60.0
+        
+        # Shared backends propagate the window to every replica
+        self._write(self.backend.block, self.key, self._config, wait_time, True)
+        
+        print(f"RATE_LIMITER: Rate limit hit, backing off for {wait_time:.1f}s")
     
     @property
     def available_tokens(self) -> float:
         """Current available tokens (for monitoring)."""
+        return self.backend.available(self.key, self._config)
+
+
+class RateLimiterRegistry:
+    """
+    Independent rate limit buckets per endpoint and model.
+    
+    Completions and embeddings are billed and limited separately by providers,
+    so each (endpoint, model) pair gets its own SmartRateLimiter with its own
+    RPM/TPM and Retry-After window. Buckets are created lazily on first use.
+    All buckets share one state backend; with a file or Redis backend every
+    replica draws from the same budget.
+    
+    Usage:
+        registry = RateLimiterRegistry(
+            defaults={"completion": (5.0, 250000), "embedding": (60.0, None)},
+            overrides={("completion", "openai/gpt-4o-mini"): (500.0, 200000)}
+        )
+        registry.get("embedding", "gemini/text-embedding-004").acquire()
+    """
+    
+    # RPM at or above this is treated as unlimited (self-hosted models)
+    UNLIMITED_RPM = 1000
+    
+    def __init__(
+        self,
+        defaults: Dict[str, Tuple[float, Optional[float]]],
+        overrides: Optional[Dict[Tuple[str, str], Tuple[float, Optional[float]]]] = None,
+        enabled: bool = True,
+        max_queue_depth: int = 0,
+        backend: Optional[RateLimitBackend] = None,
+        shed_level: int = SHED_LEVEL
+    ):
+        """
+        Initialize the registry.
+        
+        Args:
+            defaults: endpoint -> (RPM, TPM) used when a model has no override
+            overrides: (endpoint, model) -> (RPM, TPM)
+            enabled: Whether rate limiting is active at all
+            max_queue_depth: Waiters per bucket before low-priority requests are shed
+            backend: Shared state for all buckets (defaults to process memory)
+            shed_level: Priority level at or above which requests may be shed
+        """
+        self.defaults = defaults
+        self.max_queue_depth = max_queue_depth
+        self.shed_level = shed_level
+        self.backend = backend or LocalBackend()
+        self.overrides = overrides or {}
+        self.enabled = enabled
+        self._limiters: Dict[Tuple[str, str], SmartRateLimiter] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, endpoint: str, model: str) -> SmartRateLimiter:
+        """Return the bucket for an endpoint/model pair, creating it if needed."""
+        key = (endpoint, model)
         with self._lock:
-            now = time.monotonic()
-            elapsed = now - self._state.last_refill
-            return min(
-                self.max_tokens,
-                self._state.tokens + elapsed * self.tokens_per_second
-            )
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                rpm, tpm = self.overrides.get(key, self.defaults.get(endpoint, (5.0, None)))
+                limiter = SmartRateLimiter(
+                    requests_per_minute=rpm,
+                    enabled=self.enabled and rpm < self.UNLIMITED_RPM,
+                    tokens_per_minute=tpm,
+                    max_queue_depth=self.max_queue_depth,
+                    shed_level=self.shed_level,
+                    backend=self.backend,
+                    key=f"{endpoint}:{model}"
+                )
+                self._limiters[key] = limiter
+            return limiter
+    
+    @staticmethod
+    def parse_overrides(endpoint: str, spec: Optional[str]) -> Dict[Tuple[str, str], Tuple[float, Optional[float]]]:
+        """
+        Parse per-model limits like "gemini/gemini-2.5-flash=5/250000,openai/gpt-4o-mini=500".
+        
+        Each value is RPM with an optional "/TPM". Invalid entries are skipped with a warning.
+        """
+        overrides = {}
+        for entry in (spec or "").split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            model, sep, value = entry.rpartition("=")
+            try:
+                if not sep or not model:
+                    raise ValueError("expected model=rpm[/tpm]")
+                rpm, _, tpm = value.partition("/")
+                overrides[(endpoint, model.strip())] = (float(rpm), float(tpm) if tpm else None)
+            except ValueError as e:
+                print(f"RATE_LIMITER: Ignoring invalid limit '{entry}': {e}")
+        return overrides
@@ -2,22 +2,55 @@ import os
 import signal
 import sys
 import threading
-from confluent_kafka import Consumer, Producer, KafkaError
+import time
+from confluent_kafka import Consumer, KafkaError, KafkaException, TopicPartition
 from google.protobuf.json_format import Parse, MessageToJson
 from protos.contracts import orchestrator_pb2
 from agent.agent import IncidentAgent
-from prometheus_client import start_http_server, Counter, Histogram
+from messaging.publisher import DecisionPublisher
+from messaging.worker_pool import EventWorkerPool, OffsetTracker
+from prometheus_client import start_http_server, Counter, Gauge, Histogram
 
 # Prometheus metrics
 EVENTS_RECEIVED = Counter('orchestrator_events_received_total', 'Total events received', ['service', 'domain'])
 EVENTS_PROCESSED = Counter('orchestrator_events_processed_total', 'Total events processed', ['service', 'status'])
 PROCESSING_DURATION = Histogram('orchestrator_processing_duration_seconds', 'Event processing time', ['service'])
+EVENTS_IN_FLIGHT = Gauge('orchestrator_events_in_flight', 'Events dispatched to workers but not yet completed')
+OFFSETS_PENDING_COMMIT = Gauge('orchestrator_offsets_pending_commit', 'Completed offsets held back by an earlier unfinished event')
+EVENTS_DEAD_LETTERED = Counter('orchestrator_events_dead_lettered_total', 'Events whose decision could not be delivered', ['topic', 'status'])
 
 # Config
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "localhost:9092")
 TOPICS = ["events.k8s", "events.infra", "events.db"]
 OUTPUT_TOPIC_PREFIX = "decisions."
 
+# Worker pool
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+# Max events in flight per worker before consumption is paused
+AGENT_QUEUE_DEPTH = int(os.getenv("AGENT_QUEUE_DEPTH", "10"))
+
+# Producer batching
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "20"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", "10000"))
+KAFKA_FLUSH_INTERVAL = float(os.getenv("KAFKA_FLUSH_INTERVAL", "5.0"))
+# Re-publish attempts for a decision whose delivery failed
+DECISION_DELIVERY_RETRIES = int(os.getenv("DECISION_DELIVERY_RETRIES", "3"))
+# Events whose decision still could not be delivered are sent here, then committed past
+DEAD_LETTER_TOPIC = os.getenv("DEAD_LETTER_TOPIC", "events.dead_letter")
+
+
+def commit_completed(consumer: Consumer, tracker: OffsetTracker, asynchronous: bool = True) -> None:
+    """Commit offsets for events whose decisions have been produced."""
+    ready = tracker.pop_committable()
+    if not ready:
+        return
+    offsets = [TopicPartition(topic, partition, offset) for (topic, partition), offset in ready.items()]
+    try:
+        consumer.commit(offsets=offsets, asynchronous=asynchronous)
+    except KafkaException as e:
+        print(f"Offset commit failed: {e}")
+
+
 def main():
     print("Starting AI Incident Analysis Agent (Protobuf + Gemini)...")
     
@@ -25,17 +58,95 @@ def main():
     start_http_server(9090)
     print("Metrics server listening on :9090")
     
-    producer = Producer({'bootstrap.servers': KAFKA_BROKER})
+    publisher = DecisionPublisher(
+        KAFKA_BROKER,
+        linger_ms=KAFKA_LINGER_MS,
+        batch_size=KAFKA_BATCH_SIZE,
+        flush_interval=KAFKA_FLUSH_INTERVAL
+    )
     
     consumer = Consumer({
         'bootstrap.servers': KAFKA_BROKER,
         'group.id': 'ai-agent-group',
-        'auto.offset.reset': 'earliest'
+        'auto.offset.reset': 'earliest',
+        # Offsets are committed manually once each decision is produced
+        'enable.auto.commit': False
     })
-    consumer.subscribe(TOPICS)
+
+    tracker = OffsetTracker()
+    paused = False
+
+    def on_assign(c, partitions):
+        c.assign(partitions)
+        if paused:
+            # Partitions gained in a rebalance start paused under backpressure too
+            c.pause(partitions)
+
+    def on_revoke(c, partitions):
+        commit_completed(c, tracker, asynchronous=False)
+        for p in partitions:
+            tracker.revoke(p.topic, p.partition)
+
+    consumer.subscribe(TOPICS, on_assign=on_assign, on_revoke=on_revoke)
 
     agent = IncidentAgent()
 
+    def handle(item):
+        msg, event = item
+        start = time.monotonic()
+
+        def done(status):
+            PROCESSING_DURATION.labels(service=event.service_name).observe(time.monotonic() - start)
+            EVENTS_PROCESSED.labels(service=event.service_name, status=status).inc()
+            tracker.complete(msg.topic(), msg.partition(), msg.offset())
+
+        def dead_letter():
+            def parked(ok):
+                EVENTS_DEAD_LETTERED.labels(topic=msg.topic(), status="delivered" if ok else "lost").inc()
+                if not ok:
+                    print(f"Dead-lettering {event.event_id} ({msg.topic()}[{msg.partition()}]@{msg.offset()}) failed; committing past it")
+                done("delivery_failed")
+
+            publisher.publish(DEAD_LETTER_TOPIC, msg.value(), on_delivery=parked)
+
+        def publish(topic, payload, attempt=0):
+            def delivered(ok):
+                if ok:
+                    done("success")
+                elif attempt < DECISION_DELIVERY_RETRIES:
+                    delay = 2 ** attempt
+                    print(f"Delivery of {event.event_id} failed, retrying in {delay}s ({attempt + 1}/{DECISION_DELIVERY_RETRIES})")
+                    # Off the publisher's poll thread, which runs this callback
+                    retry = threading.Timer(delay, publish, args=(topic, payload, attempt + 1))
+                    retry.daemon = True
+                    retry.start()
+                else:
+                    print(f"Delivery of {event.event_id} failed after {attempt + 1} attempts; sending event to {DEAD_LETTER_TOPIC}")
+                    # Hold the offset (without counting it as in flight) until the
+                    # original event is parked, then commit past it
+                    tracker.fail(msg.topic(), msg.partition(), msg.offset())
+                    threading.Thread(target=dead_letter, daemon=True).start()
+
+            publisher.publish(topic, payload, on_delivery=delivered)
+
+        try:
+            # Analyze
+            decision = agent.analyze(event)
+            # Serialize (Protobuf JSON)
+            output_topic = f"{OUTPUT_TOPIC_PREFIX}{event.domain}"
+            val = MessageToJson(decision)
+            
+            publish(output_topic, val.encode('utf-8'))
+            
+            print(f"Queued decision {decision.decision_id} for {event.event_id} on {output_topic} ({len(decision.proposed_actions)} actions)")
+            
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            done("error")
+
+    pool = EventWorkerPool(handler=handle, workers=AGENT_WORKERS)
+    max_in_flight = max(1, AGENT_WORKERS * AGENT_QUEUE_DEPTH)
+    print(f"Worker pool started: workers={pool.workers}, max_in_flight={max_in_flight}")
 
     running = True
     def signal_handler(sig, frame):
@@ -46,34 +157,48 @@ def main():
 
     while running:
         msg = consumer.poll(1.0)
+
+        commit_completed(consumer, tracker)
+
+        # Backpressure: stop fetching while workers are saturated
+        in_flight = tracker.in_flight
+        EVENTS_IN_FLIGHT.set(in_flight)
+        OFFSETS_PENDING_COMMIT.set(tracker.pending_commit)
+        if not paused and in_flight >= max_in_flight:
+            consumer.pause(consumer.assignment())
+            paused = True
+            print(f"Backpressure: pausing consumption ({in_flight} events in flight)")
+        elif paused and in_flight < max_in_flight // 2 + 1:
+            consumer.resume(consumer.assignment())
+            paused = False
+            print("Backpressure: resuming consumption")
+
         if msg is None: continue
         if msg.error():
             if msg.error().code() != KafkaError._PARTITION_EOF:
                 print(f"Consumer error: {msg.error()}")
             continue
 
+        tracker.track(msg.topic(), msg.partition(), msg.offset())
+
         try:
             # Deserialize (Protobuf JSON)
             event = orchestrator_pb2.DomainEvent()
             Parse(msg.value().decode('utf-8'), event)
-            
-            print(f"Received event: {event.event_id} Domain: {event.domain}")
-            
-            # Analyze
-            decision = agent.analyze(event)
-            print( decision )
-            # Serialize (Protobuf JSON)
-            output_topic = f"{OUTPUT_TOPIC_PREFIX}{event.domain}"
-            val = MessageToJson(decision)
-            
-            producer.produce(output_topic, val.encode('utf-8'))
-            producer.flush()
-            
-            print(f"Published decision to {output_topic}")
-            
         except Exception as e:
             print(f"Error processing message: {e}")
+            tracker.complete(msg.topic(), msg.partition(), msg.offset())
+            continue
+
+        print(f"Received event: {event.event_id} Domain: {event.domain}")
+        EVENTS_RECEIVED.labels(service=event.service_name, domain=event.domain).inc()
+
+        # Same service -> same worker lane, preserving per-service ordering
+        pool.submit(event.service_name, (msg, event))
 
+    pool.shutdown()
+    publisher.close()
+    commit_completed(consumer, tracker, asynchronous=False)
     consumer.close()
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+# Messaging Package
@@ -0,0 +1,113 @@
+"""
+Asynchronous Kafka publisher for decisions.
+Batches messages via librdkafka linger settings and reports delivery through callbacks
+instead of blocking on a broker round trip per message.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+from confluent_kafka import Producer
+from prometheus_client import Counter
+
+DECISIONS_PUBLISHED = Counter('orchestrator_decisions_published_total', 'Decisions delivered to Kafka', ['topic'])
+DELIVERY_FAILURES = Counter('orchestrator_decision_delivery_failures_total', 'Decisions that failed delivery', ['topic'])
+
+
+class DecisionPublisher:
+    """
+    Non-blocking producer wrapper.
+
+    Features:
+    - Delivery callbacks instead of flush-per-message
+    - Linger/batch settings so messages share broker requests
+    - Background poll thread serving callbacks and periodic flushes
+    - Final flush on close
+
+    Usage:
+        publisher = DecisionPublisher(broker)
+        publisher.publish("decisions.k8s", payload, on_delivery=done)
+        ...
+        publisher.close()
+    """
+
+    def __init__(
+        self,
+        bootstrap_servers: str,
+        linger_ms: int = 20,
+        batch_size: int = 10000,
+        flush_interval: float = 5.0,
+    ):
+        """
+        Initialize the publisher and start its poll thread.
+
+        Args:
+            bootstrap_servers: Kafka bootstrap servers
+            linger_ms: Time to wait for more messages before sending a batch
+            batch_size: Max messages per batch
+            flush_interval: Seconds between periodic flushes
+        """
+        self.flush_interval = flush_interval
+        self._producer = Producer({
+            'bootstrap.servers': bootstrap_servers,
+            'linger.ms': linger_ms,
+            'batch.num.messages': batch_size,
+            'compression.type': 'lz4',
+            'enable.idempotence': True,
+        })
+        self._running = threading.Event()
+        self._running.set()
+        self._thread = threading.Thread(target=self._poll_loop, name="decision-publisher", daemon=True)
+        self._thread.start()
+
+    def publish(
+        self,
+        topic: str,
+        value: bytes,
+        on_delivery: Optional[Callable[[bool], None]] = None,
+    ) -> None:
+        """
+        Queue a message for delivery without waiting for the broker.
+
+        Args:
+            topic: Destination topic
+            value: Serialized message
+            on_delivery: Called with True/False once delivery succeeds or fails
+        """
+        def callback(err, msg):
+            if err is not None:
+                DELIVERY_FAILURES.labels(topic=topic).inc()
+                print(f"PUBLISHER: Delivery to {topic} failed: {err}")
+            else:
+                DECISIONS_PUBLISHED.labels(topic=topic).inc()
+            if on_delivery:
+                on_delivery(err is None)
+
+        while True:
+            try:
+                self._producer.produce(topic, value, on_delivery=callback)
+                return
+            except BufferError:
+                # Local queue full: serve callbacks to free space, then retry
+                print("PUBLISHER: Local queue full, waiting for deliveries...")
+                self._producer.poll(0.5)
+
+    def _poll_loop(self) -> None:
+        last_flush = time.monotonic()
+        while self._running.is_set():
+            self._producer.poll(0.1)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                last_flush = time.monotonic()
+                # Zero timeout: push out lingering batches without blocking
+                remaining = self._producer.flush(0)
+                if remaining:
+                    print(f"PUBLISHER: {remaining} messages awaiting delivery")
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Stop the poll thread and flush outstanding messages."""
+        self._running.clear()
+        self._thread.join(timeout=timeout)
+        remaining = self._producer.flush(timeout)
+        if remaining:
+            print(f"PUBLISHER: {remaining} messages not delivered before shutdown")
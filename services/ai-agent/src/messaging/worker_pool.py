@@ -0,0 +1,175 @@
+"""
+Bounded worker pool for concurrent incident processing.
+Dispatches events to worker lanes keyed by service so per-service ordering is kept,
+and tracks Kafka offsets so they are only committed once an event is fully handled.
+"""
+
+import queue
+import threading
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Tuple
+
+
+class OffsetTracker:
+    """
+    Tracks in-flight Kafka offsets per partition.
+
+    Events complete out of order when processed concurrently, so the committable
+    offset for a partition only advances past the lowest offset still in flight.
+    Thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (topic, partition) -> offsets in dispatch order
+        self._in_flight: Dict[Tuple[str, int], deque] = {}
+        # (topic, partition) -> offsets completed ahead of the head
+        self._done: Dict[Tuple[str, int], set] = {}
+        # (topic, partition) -> next offset to commit
+        self._committable: Dict[Tuple[str, int], int] = {}
+        # (topic, partition) -> offsets that finished without a result
+        self._failed: Dict[Tuple[str, int], set] = {}
+
+    def track(self, topic: str, partition: int, offset: int) -> None:
+        """Register an offset as dispatched (not yet safe to commit)."""
+        with self._lock:
+            key = (topic, partition)
+            self._in_flight.setdefault(key, deque()).append(offset)
+            self._done.setdefault(key, set())
+
+    def complete(self, topic: str, partition: int, offset: int) -> None:
+        """Mark an offset as fully processed."""
+        with self._lock:
+            key = (topic, partition)
+            offsets = self._in_flight.get(key)
+            if not offsets or offset < offsets[0]:
+                # Partition was revoked or offset already committed
+                return
+
+            done = self._done[key]
+            done.add(offset)
+            self._failed.get(key, set()).discard(offset)
+
+            # Advance the commit point over the contiguous completed prefix
+            while offsets and offsets[0] in done:
+                head = offsets.popleft()
+                done.discard(head)
+                self._committable[key] = head + 1
+
+    def fail(self, topic: str, partition: int, offset: int) -> None:
+        """
+        Mark an offset as finished without a result, pending a later complete().
+
+        The partition's commit point stops before it until the event is settled
+        some other way (e.g. dead-lettered) and completed; it no longer counts
+        as in flight for backpressure meanwhile.
+        """
+        with self._lock:
+            key = (topic, partition)
+            offsets = self._in_flight.get(key)
+            if not offsets or offset < offsets[0]:
+                return
+            self._failed.setdefault(key, set()).add(offset)
+
+    def pop_committable(self) -> Dict[Tuple[str, int], int]:
+        """Return and clear offsets that are ready to commit."""
+        with self._lock:
+            ready = self._committable
+            self._committable = {}
+            return ready
+
+    def revoke(self, topic: str, partition: int) -> None:
+        """Drop state for a partition that is no longer assigned."""
+        with self._lock:
+            key = (topic, partition)
+            self._in_flight.pop(key, None)
+            self._done.pop(key, None)
+            self._committable.pop(key, None)
+            self._failed.pop(key, None)
+
+    @property
+    def pending_commit(self) -> int:
+        """Offsets finished but held back by an earlier unfinished or failed one."""
+        with self._lock:
+            return sum(len(done) for done in self._done.values())
+
+    @property
+    def in_flight(self) -> int:
+        """Number of dispatched events not yet completed (for backpressure)."""
+        with self._lock:
+            in_flight = sum(len(offsets) for offsets in self._in_flight.values())
+            # Offsets finished behind an unfinished head no longer occupy a worker
+            finished = sum(len(done) for done in self._done.values())
+            return in_flight - finished - sum(len(failed) for failed in self._failed.values())
+
+
+_STOP = object()
+
+
+class EventWorkerPool:
+    """
+    Fixed-size pool of worker threads with one FIFO lane per worker.
+
+    Items submitted with the same key always land on the same lane, so events
+    for one service are processed in the order they were consumed while
+    different services proceed in parallel.
+
+    Usage:
+        pool = EventWorkerPool(handler=process, workers=4)
+        pool.submit(event.service_name, (msg, event))
+        ...
+        pool.shutdown()
+    """
+
+    def __init__(self, handler: Callable[[Any], None], workers: int = 1):
+        """
+        Initialize the pool and start worker threads.
+
+        Args:
+            handler: Callable invoked with each submitted item
+            workers: Number of worker threads (lanes)
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._stopping = threading.Event()
+        self._lanes = [queue.Queue() for _ in range(self.workers)]
+        self._threads = []
+
+        for idx, lane in enumerate(self._lanes):
+            thread = threading.Thread(
+                target=self._run,
+                args=(lane,),
+                name=f"event-worker-{idx}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key: str, item: Any) -> None:
+        """Queue an item on the lane owned by `key`."""
+        lane = zlib.crc32(key.encode('utf-8')) % self.workers
+        self._lanes[lane].put(item)
+
+    def _run(self, lane: queue.Queue) -> None:
+        while True:
+            item = lane.get()
+            if item is _STOP or self._stopping.is_set():
+                return
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"WORKER: Unhandled error in handler: {e}")
+
+    def shutdown(self, timeout: float = 30.0) -> None:
+        """
+        Stop workers after their current item.
+
+        Queued items that have not started are dropped; their offsets are never
+        committed, so they are redelivered on the next start.
+        """
+        self._stopping.set()
+        for lane in self._lanes:
+            lane.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
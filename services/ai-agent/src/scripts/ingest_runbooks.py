@@ -9,6 +9,8 @@ from qdrant_client.http import models
 from litellm import embedding
 from pypdf import PdfReader
 
+from agent.command_planner import extract_command_templates
+
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -125,6 +127,10 @@ def main():
         )
         emb = result.data[0]['embedding']
 
+        # Read-only kubectl commands the agent can run without asking the LLM
+        templates = extract_command_templates(content)
+        logging.info(f"Extracted {len(templates)} command templates from {filename}")
+
         # 3. Prepare Vector Point
         point = models.PointStruct(
             id=idx,
@@ -133,7 +139,8 @@ def main():
                 "filename": filename,
                 "minio_bucket": BUCKET_NAME,
                 "minio_path": filename,
-                "title": filename
+                "title": filename,
+                "command_templates": templates
             }
         )
         points.append(point)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Use litellm's bundled model cost map instead of fetching it
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+# Same import roots as the container (PYTHONPATH=/app:/app/src)
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVICE_DIR, "src"))
+sys.path.insert(0, SERVICE_DIR)
@@ -0,0 +1,73 @@
+import time
+
+from llm.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+
+
+def _breaker(**kwargs):
+    settings = dict(error_rate=0.5, slow_call_seconds=1.0, slow_call_rate=0.8,
+                    window=60, min_calls=4, open_seconds=0.05)
+    settings.update(kwargs)
+    return CircuitBreaker("test-model", **settings)
+
+
+def test_opens_on_error_rate_after_min_calls():
+    breaker = _breaker()
+    for success in (True, False, True):
+        assert breaker.allow()
+        breaker.record(success, 0.1)
+    # Below min_calls: rates not evaluated yet
+    assert breaker.state == CLOSED
+
+    breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_opens_on_slow_call_rate():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.allow()
+        breaker.record(True, 2.0)
+
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.allow()
+        breaker.record(False, 0.1)
+    time.sleep(0.06)
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_released_probe_frees_the_slot():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.allow()
+        breaker.record(False, 0.1)
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_disabled_registry_returns_no_breaker():
+    assert CircuitBreakerRegistry(enabled=False).get("m") is None
+    registry = CircuitBreakerRegistry(min_calls=3)
+    assert registry.get("m") is registry.get("m")
+    assert registry.get("m").min_calls == 3
@@ -0,0 +1,92 @@
+from agent.command_planner import extract_command_templates, plan_commands, readable
+
+MATCHING = {"pods": ["checkout-7d9f8b6c5-x2k4p"], "deployments": ["checkout"]}
+EVENTS = "kubectl get events -n prod --sort-by=.lastTimestamp | tail -20"
+
+
+def test_extract_keeps_read_only_commands():
+    runbook = """
+    1. Check logs: `kubectl logs <pod> --previous`
+    2. Describe: `kubectl describe pod <pod>`
+    3. Scale: `kubectl scale deployment <name> --replicas=3`
+    4. Shell: `kubectl get pods; rm -rf /`
+    5. Again: `kubectl  logs <pod>   --previous`
+    """
+
+    assert extract_command_templates(runbook) == [
+        "kubectl logs <pod> --previous",
+        "kubectl describe pod <pod>",
+    ]
+
+
+def test_placeholders_filled_from_matched_resources():
+    commands = plan_commands(
+        ["kubectl describe pod <pod-name>", "kubectl logs <pod-name> --previous"],
+        "prod", MATCHING, service_name="checkout",
+    )
+
+    assert commands == [
+        "kubectl describe pod checkout-7d9f8b6c5-x2k4p -n prod",
+        "kubectl logs checkout-7d9f8b6c5-x2k4p --previous --tail=100 -n prod",
+        EVENTS,
+    ]
+
+
+def test_selector_for_another_service_is_pointed_at_the_alerting_one():
+    commands = plan_commands(
+        ["kubectl logs -l app=ingest-service", "kubectl top pod -l app=ingest-service"],
+        "prod", MATCHING, service_name="checkout",
+    )
+
+    assert commands == [
+        "kubectl logs -l app=checkout --tail=100 -n prod",
+        "kubectl top pod -l app=checkout -n prod",
+        EVENTS,
+    ]
+
+
+def test_selector_that_cannot_be_resolved_is_dropped():
+    commands = plan_commands(
+        ["kubectl get pods -l tier=backend", "kubectl describe pod <pod-name>"],
+        "prod", MATCHING, service_name="checkout",
+    )
+
+    assert commands == ["kubectl describe pod checkout-7d9f8b6c5-x2k4p -n prod", EVENTS]
+
+
+def test_generic_templates_alone_do_not_bypass_the_llm():
+    # Nothing here is specific to the alerting service
+    assert plan_commands(["kubectl get pvc", "kubectl top pod --sort-by=cpu"], "prod", MATCHING, "checkout") == []
+    # A component in its own namespace is not the alerting service either
+    assert plan_commands(
+        ["kubectl get pods -n kube-system -l k8s-app=kube-dns"], "prod", MATCHING, "checkout"
+    ) == []
+
+
+def test_generic_templates_ride_along_with_specific_ones():
+    commands = plan_commands(
+        ["kubectl get pvc", "kubectl logs <pod-name>"], "prod", MATCHING, service_name="checkout",
+    )
+
+    assert commands == [
+        "kubectl get pvc -n prod",
+        "kubectl logs checkout-7d9f8b6c5-x2k4p --tail=100 -n prod",
+        EVENTS,
+    ]
+
+
+def test_resources_outside_the_service_account_are_skipped():
+    assert not readable("kubectl get certificate -A")
+    assert not readable("kubectl get pods,secrets -n prod")
+    assert readable("kubectl get deploy/checkout -n prod")
+    assert readable("kubectl logs -l app=checkout")
+
+    commands = plan_commands(
+        ["kubectl get certificate -A", "kubectl describe deployment <deployment-name>"],
+        "prod", MATCHING, service_name="checkout",
+    )
+    assert commands == ["kubectl describe deployment checkout -n prod", EVENTS]
+
+
+def test_unfilled_placeholder_is_skipped():
+    assert plan_commands(["kubectl describe node <node-name>"], "prod", MATCHING, "checkout") == []
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from agent.diagnostics_backend import (
+    DiagnosticsBackend,
+    KubeApiBackend,
+    KubectlBackend,
+    UnsupportedCommand,
+    communicate_bounded,
+    parse_command,
+)
+from agent.log_digest import output_digest
+from scripts import fake_kube_api
+
+CRASHING_POD = "checkout-7d9f8b6c5-x2k4p"
+HEALTHY_POD = "checkout-7d9f8b6c5-q8m3z"
+
+
+class RecordingBackend(DiagnosticsBackend):
+    """Fallback that records the commands handed to it instead of running kubectl."""
+
+    name = "kubectl"
+
+    def __init__(self):
+        self.commands = []
+
+    async def run(self, cmd: str, timeout: float, digest: bool = False) -> tuple:
+        self.commands.append(cmd)
+        return 0, "from kubectl\n", ""
+
+
+@pytest.fixture(scope="module")
+def api_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fake_kube_api.Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def run(backend: KubeApiBackend, cmd: str, digest: bool = False) -> tuple:
+    async def main():
+        try:
+            return await backend.run(cmd, timeout=10, digest=digest)
+        finally:
+            await backend.close()
+
+    return asyncio.run(main())
+
+
+def test_parse_command():
+    cmd = parse_command("kubectl logs -n prod -l app=checkout --tail=50 -c checkout --previous | tail -20")
+
+    assert cmd.verb == "logs"
+    assert cmd.resource == "pods"
+    assert cmd.namespace == "prod"
+    assert cmd.selector == "app=checkout"
+    assert cmd.tail == 50
+    assert cmd.container == "checkout"
+    assert cmd.previous
+    assert cmd.pipes == [("tail", 20)]
+
+    cmd = parse_command("kubectl get deploy/checkout -n prod")
+    assert (cmd.resource, cmd.name) == ("deployments", "checkout")
+
+    cmd = parse_command("kubectl top po -A --sort-by=memory")
+    assert (cmd.resource, cmd.all_namespaces, cmd.sort_by) == ("pods", True, "memory")
+
+
+@pytest.mark.parametrize("cmd", [
+    "kubectl get pods -o yaml -n prod",
+    "kubectl get certificates -n prod",
+    "kubectl logs deployment/checkout -n prod",
+    "kubectl get pods -n prod | grep checkout",
+    "kubectl top services -n prod",
+])
+def test_parse_command_rejects_unsupported(cmd):
+    with pytest.raises(UnsupportedCommand):
+        parse_command(cmd)
+
+
+def test_get_pods_table(api_url):
+    returncode, stdout, stderr = run(KubeApiBackend(api_url), "kubectl get pods -n prod")
+
+    assert returncode == 0, stderr
+    lines = stdout.splitlines()
+    assert lines[0].split() == ["NAME", "READY", "STATUS", "RESTARTS", "AGE"]
+    assert lines[1].split()[:4] == [CRASHING_POD, "0/1", "CrashLoopBackOff", "7"]
+    assert lines[2].split()[:4] == [HEALTHY_POD, "1/1", "Running", "0"]
+
+
+def test_get_missing_object_reports_not_found(api_url):
+    returncode, stdout, stderr = run(KubeApiBackend(api_url), "kubectl get pod checkout-gone -n prod")
+
+    assert returncode == 1
+    assert stdout == ""
+    assert stderr.startswith("Error from server (NotFound)")
+
+
+def test_top_pods_table(api_url):
+    returncode, stdout, stderr = run(KubeApiBackend(api_url), "kubectl top pods -n prod --sort-by=memory")
+
+    assert returncode == 0, stderr
+    lines = stdout.splitlines()
+    assert lines[0].split() == ["NAME", "CPU(cores)", "MEMORY(bytes)"]
+    assert lines[1].split() == [CRASHING_POD, "412m", "251Mi"]
+    assert lines[2].split() == [HEALTHY_POD, "35m", "180Mi"]
+
+
+def test_describe_pod(api_url):
+    returncode, stdout, stderr = run(KubeApiBackend(api_url), f"kubectl describe pod {CRASHING_POD} -n prod")
+
+    assert returncode == 0, stderr
+    assert f"Name: {CRASHING_POD}" in stdout
+    assert "Namespace: prod" in stdout
+    assert "Last State: Terminated (OOMKilled, exit code 137)" in stdout
+    assert "Limits: cpu=500m, memory=256Mi" in stdout
+    events = stdout.split("Events:\n", 1)[1]
+    assert "OOMKilling" in events
+    assert "BackOff" in events
+
+
+def test_kubectl_digest_sees_output_beyond_windows():
+    # An error in the middle of a long log falls outside the head/tail windows
+    script = (
+        "for i in range(2000): print(f'INFO request {i} served in {i}ms')\n"
+        "print('ERROR connection refused by db-0')\n"
+        "for i in range(2000): print(f'INFO request {i} served in {i}ms')"
+    )
+    backend = KubectlBackend()
+    cmd = f'python3 -c "{script}" | cat'
+
+    raw = asyncio.run(backend.run(cmd, timeout=10))[1]
+    assert "connection refused" not in raw
+
+    async def digested():
+        # The digest is chosen by the kubectl verb; stand in a log command
+        proc = await asyncio.create_subprocess_shell(
+            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True
+        )
+        return await communicate_bounded(proc, 10, 1024 * 1024, output_digest("kubectl logs db-0"))
+
+    returncode, stdout, _ = asyncio.run(digested())
+    assert returncode == 0
+    assert stdout.startswith("[digest: 4001 lines -> 2 templates]")
+    assert "[x1] ERROR connection refused by db-0" in stdout
+    assert "[x4000] INFO request <*> served in <*>" in stdout
+
+
+def test_logs_request_limit_bytes(api_url):
+    returncode, stdout, stderr = run(
+        KubeApiBackend(api_url, max_output_bytes=20), f"kubectl logs {CRASHING_POD} -n prod"
+    )
+
+    assert returncode == 0, stderr
+    assert stdout == "INFO Starting checko"
+
+
+def test_logs_by_selector_split_limit_bytes(api_url):
+    returncode, stdout, stderr = run(
+        KubeApiBackend(api_url, max_output_bytes=200), "kubectl logs -l app=checkout -n prod --tail=1"
+    )
+
+    assert returncode == 0, stderr
+    assert stdout == (
+        f"==> {CRASHING_POD} <==\nERROR java.lang.OutOfMemoryError: Java heap space\n"
+        f"==> {HEALTHY_POD} <==\nINFO Listening on :8080\n"
+    )
+
+    returncode, stdout, stderr = run(
+        KubeApiBackend(api_url, max_output_bytes=20), "kubectl logs -l app=checkout -n prod --tail=1"
+    )
+    # 10 bytes per pod
+    assert stdout == f"==> {CRASHING_POD} <==\nERROR java\n==> {HEALTHY_POD} <==\nINFO Liste\n"
+
+
+def test_unsupported_command_falls_back_to_kubectl(api_url):
+    fallback = RecordingBackend()
+    backend = KubeApiBackend(api_url, fallback=fallback)
+
+    returncode, stdout, _ = run(backend, "kubectl get pods -n prod -o wide")
+
+    assert (returncode, stdout) == (0, "from kubectl\n")
+    assert fallback.commands == ["kubectl get pods -n prod -o wide"]
+
+
+def test_unsupported_command_without_fallback(api_url):
+    returncode, stdout, stderr = run(KubeApiBackend(api_url), "kubectl get pods -n prod -o wide")
+
+    assert returncode == 1
+    assert stderr == "error: unsupported by API backend: flag '-o'"
@@ -0,0 +1,38 @@
+import json
+
+from llm.json_stream import JsonObjectScanner
+
+
+def _scan(chunks):
+    scanner = JsonObjectScanner()
+    for i, chunk in enumerate(chunks):
+        if scanner.feed(chunk) is not None:
+            return scanner, i
+    return scanner, None
+
+
+def test_object_split_across_chunks_stops_at_closing_brace():
+    scanner, stopped_at = _scan(['Here you go: {"commands": ["kubectl get', ' pods"]', '}', " Hope this helps!"])
+
+    assert stopped_at == 2
+    assert json.loads(scanner.result) == {"commands": ["kubectl get pods"]}
+
+
+def test_braces_inside_strings_are_ignored():
+    scanner, _ = _scan(['{"analysis": "saw \\"}\\" and {x} in logs", ', '"confidence_score": 0.9}'])
+
+    assert json.loads(scanner.result) == {"analysis": 'saw "}" and {x} in logs', "confidence_score": 0.9}
+
+
+def test_non_json_braces_in_prose_are_skipped():
+    scanner, _ = _scan(["Use -n {namespace} first. ", '{"ok": true}'])
+
+    assert scanner.result == '{"ok": true}'
+
+
+def test_incomplete_object_keeps_all_text():
+    scanner, stopped_at = _scan(['{"analysis": "cut', " off"])
+
+    assert stopped_at is None
+    assert scanner.result is None
+    assert scanner.text == '{"analysis": "cut off'
@@ -0,0 +1,227 @@
+import asyncio
+from types import SimpleNamespace
+
+import litellm
+import pytest
+
+from llm import llm_provider
+from llm.llm_provider import LLMProvider
+
+
+def _completion(text, model="openai/test-model"):
+    return litellm.ModelResponse(
+        model=model,
+        choices=[{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    )
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setenv("LLM_CIRCUIT_ENABLED", "false")
+    return LLMProvider(model="openai/test-model", rate_limit_enabled=False, cache_enabled=False)
+
+
+def test_agenerate_returns_text(provider, monkeypatch):
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append(kwargs)
+        return _completion('{"commands": ["kubectl get pods -n prod"]}')
+
+    monkeypatch.setattr(llm_provider, "acompletion", fake_acompletion)
+
+    text = asyncio.run(provider.agenerate("which commands?", system_prompt="You are an SRE"))
+
+    assert text == '{"commands": ["kubectl get pods -n prod"]}'
+    assert len(calls) == 1
+    assert calls[0]["model"] == "openai/test-model"
+    assert calls[0]["messages"][0] == {"role": "system", "content": "You are an SRE"}
+
+
+def test_shed_request_fails_over_to_next_model(monkeypatch):
+    monkeypatch.setenv("LLM_CIRCUIT_ENABLED", "false")
+    provider = LLMProvider(
+        model="openai/primary", fallback_models=["openai/backup"],
+        rate_limit_enabled=False, cache_enabled=False
+    )
+    tried = []
+
+    def fake_call_model(model, *args, **kwargs):
+        tried.append(model)
+        if model == "openai/primary":
+            raise llm_provider.RateLimitQueueFull("queue full")
+        return llm_provider.LLMResponse(text="ok", model=model, usage={})
+
+    monkeypatch.setattr(provider, "_call_model", fake_call_model)
+
+    response = provider._call_with_retry([{"role": "user", "content": "hi"}])
+
+    assert response.text == "ok"
+    assert tried == ["openai/primary", "openai/backup"]
+
+
+def _hedged_provider(monkeypatch, delays):
+    monkeypatch.setenv("LLM_CIRCUIT_ENABLED", "false")
+    provider = LLMProvider(
+        model="openai/primary", fallback_models=["openai/backup"],
+        rate_limit_enabled=False, cache_enabled=False, hedge_after=0.05
+    )
+    events = []
+
+    async def fake_acall_model(model, *args, **kwargs):
+        events.append(("start", model))
+        try:
+            await asyncio.sleep(delays[model])
+        except asyncio.CancelledError:
+            events.append(("cancelled", model))
+            raise
+        return llm_provider.LLMResponse(text=f"from {model}", model=model, usage={})
+
+    monkeypatch.setattr(provider, "_acall_model", fake_acall_model)
+    return provider, events
+
+
+def test_slow_call_is_hedged_on_next_model(monkeypatch):
+    provider, events = _hedged_provider(monkeypatch, {"openai/primary": 5, "openai/backup": 0})
+
+    response = asyncio.run(provider._acall_with_retry([{"role": "user", "content": "hi"}]))
+
+    assert response.text == "from openai/backup"
+    assert events == [("start", "openai/primary"), ("start", "openai/backup"), ("cancelled", "openai/primary")]
+
+
+def test_fast_call_is_not_hedged(monkeypatch):
+    provider, events = _hedged_provider(monkeypatch, {"openai/primary": 0, "openai/backup": 0})
+
+    response = asyncio.run(provider._acall_with_retry([{"role": "user", "content": "hi"}]))
+
+    assert response.text == "from openai/primary"
+    assert events == [("start", "openai/primary")]
+
+
+def test_cache_is_keyed_by_answering_model_and_output_format(monkeypatch):
+    monkeypatch.setenv("LLM_CIRCUIT_ENABLED", "false")
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    provider = LLMProvider(
+        model="openai/primary", fallback_models=["openai/backup"],
+        rate_limit_enabled=False, cache_enabled=True
+    )
+    answers = iter(["from backup", '{"from": "primary"}', "from primary"])
+    tried = []
+
+    def fake_call_with_retry(messages, **kwargs):
+        text = next(answers)
+        model = "openai/backup" if "backup" in text else "openai/primary"
+        tried.append(model)
+        return llm_provider.LLMResponse(text=text, model=model, usage={})
+
+    monkeypatch.setattr(provider, "_call_with_retry", fake_call_with_retry)
+
+    assert provider.generate("status?", temperature=0) == "from backup"
+    # Served from the backup model's entry
+    assert provider.generate("status?", temperature=0) == "from backup"
+    # A JSON request is a different entry
+    assert provider.generate("status?", temperature=0, expect_json=True) == '{"from": "primary"}'
+    assert provider.generate("status?", temperature=0, expect_json=True) == '{"from": "primary"}'
+    assert len(tried) == 2
+
+    keys, _ = provider._cache_lookup(
+        [{"role": "user", "content": "status?"}], 0, None, False, None, None, {}
+    )
+    assert provider.response_cache.get(keys["openai/primary"]) is None
+    assert provider.response_cache.get(keys["openai/backup"]) == "from backup"
+
+
+def test_cache_only_deterministic_calls_and_keeps_ids(monkeypatch):
+    monkeypatch.setenv("LLM_CIRCUIT_ENABLED", "false")
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    provider = LLMProvider(model="openai/test-model", rate_limit_enabled=False, cache_enabled=True)
+    calls = []
+
+    def fake_call_with_retry(messages, **kwargs):
+        calls.append(messages[-1]["content"])
+        return llm_provider.LLMResponse(text=f"answer {len(calls)}", model="openai/test-model", usage={})
+
+    monkeypatch.setattr(provider, "_call_with_retry", fake_call_with_retry)
+
+    # Sampled calls are never replayed
+    assert provider.generate("analyze") == "answer 1"
+    assert provider.generate("analyze") == "answer 2"
+    # ...unless the caller opts in
+    assert provider.generate("analyze", cache=True) == "answer 3"
+    assert provider.generate("analyze", cache=True) == "answer 3"
+
+    first = "Incident 0b8e6a3e-1c1f-4a53-9d4f-6f0a8a4c2e11 at 2026-10-15T01:00:00Z"
+    second = "Incident 7f2d9c10-5b4e-4c2a-8e9b-3a1d6e5f7c22 at 2026-10-15T01:05:00Z"
+    assert provider.generate(first, temperature=0) == "answer 4"
+    assert provider.generate(first, temperature=0) == "answer 4"
+    # Another incident's prompt is its own entry
+    assert provider.generate(second, temperature=0) == "answer 5"
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+CHUNKS = ['{"commands": ', '["kubectl get pods"]}', ' and then some trailing prose', ' that is never read']
+
+
+class SyncWrapper:
+    """Shaped like litellm's sync CustomStreamWrapper: iterable, no close()."""
+
+    def __init__(self, read):
+        self.closed = False
+        self.completion_stream = self._provider_stream(read)
+
+    def _provider_stream(self, read):
+        try:
+            for text in CHUNKS:
+                read.append(text)
+                yield _chunk(text)
+        finally:
+            # Closing the generator releases the HTTP response
+            self.closed = True
+
+    def __iter__(self):
+        for chunk in self.completion_stream:
+            yield chunk
+
+
+class AsyncWrapper:
+    def __init__(self, read):
+        self.read = read
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for text in CHUNKS:
+            self.read.append(text)
+            yield _chunk(text)
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_sync_stream_early_stop_closes_provider_stream(provider):
+    read = []
+    stream = SyncWrapper(read)
+
+    text = provider._collect_stream(stream, "openai/test-model")
+
+    assert text == '{"commands": ["kubectl get pods"]}'
+    assert read == CHUNKS[:2]
+    assert stream.closed
+
+
+def test_async_stream_early_stop_closes_stream(provider):
+    read = []
+    stream = AsyncWrapper(read)
+
+    text = asyncio.run(provider._acollect_stream(stream, "openai/test-model"))
+
+    assert text == '{"commands": ["kubectl get pods"]}'
+    assert read == CHUNKS[:2]
+    assert stream.closed
@@ -0,0 +1,126 @@
+from agent.log_digest import digest_describe, digest_logs, digest_output, digest_table
+
+DESCRIBE = """Name:         checkout-7d9f8b6c5-x2k4p
+Namespace:    prod
+Priority:     0
+Node:         node-a/10.0.1.12
+Labels:       app=checkout
+Annotations:  kubectl.kubernetes.io/restartedAt: 2026-10-14T09:12:44Z
+Status:       Running
+IP:           10.244.1.17
+Containers:
+  checkout:
+    Image:          shop/checkout:1.4.2
+    Port:           8080/TCP
+    State:          Waiting
+      Reason:       CrashLoopBackOff
+    Last State:     Terminated
+      Reason:       OOMKilled
+      Exit Code:    137
+    Ready:          False
+    Restart Count:  7
+    Limits:
+      cpu:     500m
+      memory:  256Mi
+    Environment:
+      JAVA_OPTS:  -Xmx512m
+    Mounts:
+      /var/run/secrets/kubernetes.io/serviceaccount from kube-api-access (ro)
+QoS Class:       Guaranteed
+Tolerations:     node.kubernetes.io/not-ready:NoExecute op=Exists for 300s
+Events:
+  Type     Reason   Age                 From     Message
+  ----     ------   ----                ----     -------
+  Warning  BackOff  2m (x12 over 10m)   kubelet  Back-off restarting failed container
+"""
+
+
+def test_digest_logs_templates_repeated_lines():
+    lines = [f"2026-10-15T01:00:{i:02d}Z INFO request {i} served in {i * 3}ms" for i in range(40)]
+    lines += ["2026-10-15T01:01:00Z ERROR connection refused by 10.0.0.7:5432"] * 3
+    lines += ["2026-10-15T01:01:05Z INFO shutting down"]
+
+    digest = digest_logs("\n".join(lines) + "\n", last_lines=2)
+
+    assert digest.splitlines() == [
+        "[digest: 44 lines -> 3 templates]",
+        "Errors:",
+        "  [x3] <*> ERROR connection refused by <*>",
+        "Other:",
+        "  [x40] <*> INFO request <*> served in <*>",
+        "  [x1] 2026-10-15T01:01:05Z INFO shutting down",
+        "Last lines:",
+        "  2026-10-15T01:01:00Z ERROR connection refused by 10.0.0.7:5432",
+        "  2026-10-15T01:01:05Z INFO shutting down",
+    ]
+
+
+def test_digest_logs_keeps_truncation_markers():
+    text = "INFO start\n... [4096 bytes omitted] ...\nINFO start\n"
+
+    digest = digest_logs(text)
+
+    assert "... [4096 bytes omitted] ..." in digest.splitlines()
+    assert "  [x2] INFO start" in digest
+
+
+def test_digest_describe_explains_exit_code_137():
+    digest = digest_describe(DESCRIBE)
+    lines = digest.splitlines()
+
+    assert lines[1] == "Findings: exit code 137: SIGKILL (OOMKilled or killed by the kubelet)"
+    assert "      Reason:       OOMKilled" in lines
+    assert "      Exit Code:    137" in lines
+    assert "      memory:  256Mi" in lines
+    assert "Annotations:  kubectl.kubernetes.io/restartedAt: 2026-10-14T09:12:44Z" not in lines
+    assert "      JAVA_OPTS:  -Xmx512m" not in lines
+
+
+def test_digest_table_collapses_identical_rows():
+    text = (
+        "LAST SEEN   TYPE      REASON    OBJECT        MESSAGE\n"
+        "1m          Warning   BackOff   pod/checkout  Back-off restarting failed container\n"
+        "2m          Warning   BackOff   pod/checkout  Back-off restarting failed container\n"
+        "3m          Warning   BackOff   pod/checkout  Back-off restarting failed container\n"
+        "5m          Normal    Pulled    pod/checkout  Container image already present\n"
+    )
+
+    assert digest_table(text).splitlines() == [
+        "LAST SEEN   TYPE      REASON    OBJECT        MESSAGE",
+        "1m          Warning   BackOff   pod/checkout  Back-off restarting failed container  [x3]",
+        "5m          Normal    Pulled    pod/checkout  Container image already present",
+    ]
+    # Nothing repeated: unchanged
+    assert digest_table("NAME  AGE\ncheckout  5m\n") == "NAME  AGE\ncheckout  5m\n"
+
+
+def test_digest_table_keeps_distinct_statefulset_pods():
+    text = (
+        "NAME      READY   STATUS    RESTARTS   AGE\n"
+        "kafka-0   1/1     Running   0          5d\n"
+        "kafka-1   1/1     Running   9          5d\n"
+        "kafka-2   0/1     Running   7          5d\n"
+    )
+
+    assert digest_table(text) == text
+    assert digest_output("kubectl get pods -n data", text) == (text, False)
+
+
+def test_digest_table_keeps_events_for_different_objects():
+    text = (
+        "LAST SEEN   TYPE      REASON    OBJECT        MESSAGE\n"
+        "1m          Warning   BackOff   pod/kafka-1   Back-off restarting failed container\n"
+        "2m          Warning   BackOff   pod/kafka-2   Back-off restarting failed container\n"
+        "3m          Warning   BackOff   pod/kafka-2   Back-off restarting failed container\n"
+    )
+
+    assert digest_table(text).splitlines() == [
+        "LAST SEEN   TYPE      REASON    OBJECT        MESSAGE",
+        "1m          Warning   BackOff   pod/kafka-1   Back-off restarting failed container",
+        "2m          Warning   BackOff   pod/kafka-2   Back-off restarting failed container  [x2]",
+    ]
+
+
+def test_digest_output_keeps_original_when_not_shorter():
+    assert digest_output("kubectl logs checkout -n prod", "INFO ready\n") == ("INFO ready\n", False)
+    assert digest_output("kubectl rollout status deploy/checkout", "x\n" * 50) == ("x\n" * 50, False)
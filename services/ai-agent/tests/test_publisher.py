@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from messaging import publisher
+from messaging.publisher import DecisionPublisher
+
+
+class FakeProducer:
+    """Stands in for confluent_kafka.Producer: produce() queues, poll()/flush() deliver."""
+
+    def __init__(self, config):
+        self.config = config
+        self.queue_limit = None
+        self.fail_topics = set()
+        self.delivered = []
+        self._queue = []
+        self._lock = threading.Lock()
+
+    def produce(self, topic, value, on_delivery=None):
+        with self._lock:
+            if self.queue_limit is not None and len(self._queue) >= self.queue_limit:
+                raise BufferError("Local: Queue full")
+            self._queue.append((topic, value, on_delivery))
+
+    def poll(self, timeout=0):
+        with self._lock:
+            queued, self._queue = self._queue, []
+        for topic, value, on_delivery in queued:
+            err = "Broker: Not enough in-sync replicas" if topic in self.fail_topics else None
+            if err is None:
+                self.delivered.append((topic, value))
+            on_delivery(err, None)
+        return len(queued)
+
+    def flush(self, timeout=None):
+        self.poll()
+        return 0
+
+
+@pytest.fixture
+def publisher_under_test(monkeypatch):
+    monkeypatch.setattr(publisher, "Producer", FakeProducer)
+    pub = DecisionPublisher("kafka:9092", flush_interval=0.05)
+    yield pub
+    pub.close(timeout=1)
+
+
+def test_delivery_outcome_reaches_callback(publisher_under_test):
+    producer = publisher_under_test._producer
+    producer.fail_topics.add("decisions.bad")
+    outcomes = {}
+    done = threading.Event()
+
+    def recorder(key):
+        def on_delivery(ok):
+            outcomes[key] = ok
+            if len(outcomes) == 2:
+                done.set()
+        return on_delivery
+
+    publisher_under_test.publish("decisions.k8s", b"a", on_delivery=recorder("good"))
+    publisher_under_test.publish("decisions.bad", b"b", on_delivery=recorder("bad"))
+
+    # Served by the background poll thread, not by publish()
+    assert done.wait(timeout=2)
+    assert outcomes == {"good": True, "bad": False}
+    assert producer.delivered == [("decisions.k8s", b"a")]
+
+
+def test_full_local_queue_waits_for_deliveries(publisher_under_test):
+    producer = publisher_under_test._producer
+    publisher_under_test.close(timeout=1)  # stop the poll thread so the queue stays full
+    producer.queue_limit = 1
+
+    publisher_under_test.publish("decisions.k8s", b"a")
+    publisher_under_test.publish("decisions.k8s", b"b")
+
+    assert producer.delivered == [("decisions.k8s", b"a")]
+    publisher_under_test.close(timeout=1)
+    assert producer.delivered == [("decisions.k8s", b"a"), ("decisions.k8s", b"b")]
+
+
+def test_producer_config_batches_and_is_idempotent(publisher_under_test):
+    config = publisher_under_test._producer.config
+
+    assert config["bootstrap.servers"] == "kafka:9092"
+    assert config["linger.ms"] == 20
+    assert config["enable.idempotence"] is True
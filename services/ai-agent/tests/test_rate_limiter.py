@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm.rate_limit_backend import LocalBackend
+from llm.rate_limiter import RateLimitQueueFull, SmartRateLimiter, current_priority, priority_for
+
+
+class SlowBackend(LocalBackend):
+    """Local state with the latency of a network round trip."""
+
+    blocking = True
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.threads = set()
+
+    def _update(self, key, config, fn):
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        return super()._update(key, config, fn)
+
+
+def test_acquire_async_keeps_event_loop_responsive():
+    backend = SlowBackend(delay=0.2)
+    limiter = SmartRateLimiter(requests_per_minute=600, backend=backend)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        acquired = await limiter.acquire_async()
+        limiter.reconcile(100, 50)
+        task.cancel()
+        return acquired, ticks
+
+    acquired, ticks = asyncio.run(scenario())
+
+    assert acquired
+    # The loop kept running while the backend call was in flight
+    assert ticks >= 10
+    assert threading.get_ident() not in backend.threads
+
+
+def test_sync_acquire_respects_rate():
+    limiter = SmartRateLimiter(requests_per_minute=60, burst_size=1)
+
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0)
+
+
+def test_unknown_severity_is_not_shed():
+    limiter = SmartRateLimiter(requests_per_minute=60, burst_size=1, max_queue_depth=1)
+    assert limiter.acquire(timeout=0)
+
+    # Fill the queue with one waiter
+    waiter = threading.Thread(target=limiter.acquire, kwargs={"timeout": 1.0})
+    waiter.start()
+    time.sleep(0.1)
+
+    # No severity: waits its turn instead of being shed
+    assert not limiter.acquire(timeout=0.1)
+
+    token = current_priority.set(priority_for("info"))
+    try:
+        with pytest.raises(RateLimitQueueFull):
+            limiter.acquire(timeout=0.1)
+    finally:
+        current_priority.reset(token)
+    waiter.join()
@@ -0,0 +1,54 @@
+from agent.resource_index import ResourceIndex, ResourceInfo
+
+
+def _index():
+    return ResourceIndex([
+        ResourceInfo("Deployment", "payment-api"),
+        ResourceInfo("Deployment", "payment-api-canary"),
+        ResourceInfo("Deployment", "api-gateway"),
+        ResourceInfo("Deployment", "billing", app_labels=["payments"]),
+        ResourceInfo("ReplicaSet", "payment-api-5d8f7", owner_kind="Deployment", owner_name="payment-api"),
+        ResourceInfo("ReplicaSet", "billing-6c9d4", owner_kind="Deployment", owner_name="billing"),
+        # Named nothing like the service: only the owner chain ties it to payment-api
+        ResourceInfo("Pod", "worker-x7k2p", owner_kind="ReplicaSet", owner_name="payment-api-5d8f7"),
+        ResourceInfo("Pod", "payment-api-canary-q8m3z"),
+        ResourceInfo("Pod", "legacy-payment-api-tool"),
+        ResourceInfo("Pod", "billing-6c9d4-abcde", owner_kind="ReplicaSet", owner_name="billing-6c9d4"),
+        ResourceInfo("Service", "payment-api"),
+    ])
+
+
+def test_match_ranks_exact_then_prefix_then_tokens():
+    match = _index().match("payment-api")
+
+    # Exact deployment name first, then the "<service>-" prefix
+    assert match["deployments"] == ["payment-api", "payment-api-canary"]
+    # Pod inherits the exact score through ReplicaSet -> Deployment; then the
+    # prefix match; then a name that merely contains every token
+    assert match["pods"] == ["worker-x7k2p", "payment-api-canary-q8m3z", "legacy-payment-api-tool"]
+
+
+def test_label_match_and_inheritance():
+    index = _index()
+    match = index.match("payments")
+
+    assert match["deployments"] == ["billing"]
+    assert match["pods"] == ["billing-6c9d4-abcde"]
+    assert index.deployment_of("billing-6c9d4-abcde") == "billing"
+    assert index.deployment_of("payment-api-canary-q8m3z") is None
+
+
+def test_single_token_never_matches_by_substring():
+    match = _index().match("api")
+
+    # "api-gateway" is a prefix match; "payment-api" only contains the token
+    assert match == {"pods": [], "deployments": ["api-gateway"]}
+
+
+def test_resources_listing_and_empty_service():
+    index = _index()
+
+    assert index.resources["services"] == ["payment-api"]
+    assert index
+    assert not ResourceIndex([])
+    assert index.match("  ") == {"pods": [], "deployments": []}
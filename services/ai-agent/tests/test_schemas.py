@@ -0,0 +1,27 @@
+from agent.schemas import ACTION_TYPES, COMMANDS_SCHEMA, DECISION_SCHEMA
+
+
+def test_decision_schema_shape():
+    assert DECISION_SCHEMA["type"] == "object"
+    assert DECISION_SCHEMA["required"] == ["analysis", "proposed_actions", "confidence_score"]
+
+    props = DECISION_SCHEMA["properties"]
+    assert props["analysis"] == {"type": "string"}
+    assert props["confidence_score"] == {"type": "number", "minimum": 0, "maximum": 1}
+
+    actions = props["proposed_actions"]
+    assert actions["type"] == "array"
+    action = actions["items"]
+    # Server-assigned fields are never asked of the model
+    assert set(action["properties"]) == {"action_type", "target", "params", "reasoning"}
+    assert action["properties"]["action_type"] == {"type": "string", "enum": ACTION_TYPES}
+    assert action["properties"]["params"] == {"type": "object", "additionalProperties": {"type": "string"}}
+
+
+def test_commands_schema_shape():
+    assert COMMANDS_SCHEMA["properties"]["commands"] == {"type": "array", "items": {"type": "string"}}
+
+
+def test_agent_module_imports():
+    # agent.agent builds its prompts from these schemas at import time
+    import agent.agent  # noqa: F401
@@ -0,0 +1,94 @@
+import asyncio
+
+from agent.agent import IncidentAgent
+from llm.llm_provider import LLMResponse
+from protos.contracts import orchestrator_pb2
+
+NAMESPACE = "prod"
+DECISION = '{"analysis": "checkout is OOMKilled", "confidence_score": 0.8, "proposed_actions": []}'
+
+
+class ScriptedLLM:
+    """Answers achat() from a list of responses and records the messages it was sent."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    async def achat(self, messages, tools=None, **kwargs):
+        self.calls.append({"messages": list(messages), "tools": tools, **kwargs})
+        return self.responses.pop(0)
+
+
+def _tool_call(call_id, command, name="run_diagnostic"):
+    return {"id": call_id, "name": name, "arguments": {"command": command}}
+
+
+def _agent(responses, max_steps=4):
+    agent = IncidentAgent.__new__(IncidentAgent)
+    agent.llm = ScriptedLLM(responses)
+    agent.tool_max_steps = max_steps
+    agent.ran = []
+
+    async def fake_run_diagnostics(commands, namespace=None):
+        agent.ran.extend(commands)
+        return f"=== {commands[0]} ===\nok"
+
+    agent._run_diagnostics = fake_run_diagnostics
+    return agent
+
+
+def _analyze(agent):
+    event = orchestrator_pb2.DomainEvent(event_id="evt-1", service_name="checkout", domain="kubernetes")
+    return asyncio.run(agent._analyze_with_tools(event, "runbook", NAMESPACE, {"pods": ["checkout-1"]}, {}))
+
+
+def _tool_outputs(messages):
+    return {msg["tool_call_id"]: msg["content"] for msg in messages if msg["role"] == "tool"}
+
+
+def test_tool_calls_run_and_final_answer_is_parsed():
+    agent = _agent([
+        LLMResponse(text="", model="m", usage={}, tool_calls=[
+            _tool_call("c1", "kubectl logs checkout-1 -n prod --tail=100"),
+            _tool_call("c2", "kubectl delete pod checkout-1 -n prod"),
+            _tool_call("c3", "kubectl get pods -n prod", name="shell"),
+        ]),
+        LLMResponse(text=DECISION, model="m", usage={}),
+    ])
+
+    decision = _analyze(agent)
+
+    assert decision.analysis == "checkout is OOMKilled"
+    assert decision.confidence_score == 0.8
+    assert agent.ran == ["kubectl logs checkout-1 -n prod --tail=100"]
+    outputs = _tool_outputs(agent.llm.calls[1]["messages"])
+    assert outputs["c1"].endswith("ok")
+    assert outputs["c2"] == "Blocked: only kubectl get/describe/logs/top are allowed"
+    assert outputs["c3"] == "Unknown tool: shell"
+
+
+def test_tool_calls_beyond_per_round_limit_are_skipped():
+    calls = [_tool_call(f"c{i}", f"kubectl get pod checkout-{i} -n prod") for i in range(7)]
+    agent = _agent([
+        LLMResponse(text="", model="m", usage={}, tool_calls=calls),
+        LLMResponse(text=DECISION, model="m", usage={}),
+    ])
+
+    _analyze(agent)
+
+    assert len(agent.ran) == IncidentAgent.MAX_TOOL_CALLS_PER_STEP
+    outputs = _tool_outputs(agent.llm.calls[1]["messages"])
+    assert outputs["c6"] == "Skipped: at most 5 diagnostics per round"
+
+
+def test_exhausted_step_budget_forces_an_answer():
+    keep_asking = LLMResponse(text="", model="m", usage={}, tool_calls=[_tool_call("c", "kubectl get pods -n prod")])
+    agent = _agent([keep_asking, keep_asking, LLMResponse(text=DECISION, model="m", usage={})], max_steps=2)
+
+    decision = _analyze(agent)
+
+    assert decision.analysis == "checkout is OOMKilled"
+    assert len(agent.llm.calls) == 3
+    assert "tool_choice" not in agent.llm.calls[1]
+    assert agent.llm.calls[2]["tool_choice"] == "none"
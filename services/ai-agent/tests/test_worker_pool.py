@@ -0,0 +1,59 @@
+from messaging.worker_pool import OffsetTracker
+
+
+def test_commit_point_waits_for_out_of_order_completion():
+    tracker = OffsetTracker()
+    for offset in (10, 11, 12):
+        tracker.track("events.k8s", 0, offset)
+
+    tracker.complete("events.k8s", 0, 11)
+    assert tracker.pop_committable() == {}
+
+    tracker.complete("events.k8s", 0, 10)
+    assert tracker.pop_committable() == {("events.k8s", 0): 12}
+    assert tracker.in_flight == 1
+
+
+def test_failed_offset_blocks_commit_but_not_backpressure():
+    tracker = OffsetTracker()
+    for offset in (10, 11, 12):
+        tracker.track("events.k8s", 0, offset)
+
+    tracker.complete("events.k8s", 0, 10)
+    tracker.fail("events.k8s", 0, 11)
+    tracker.complete("events.k8s", 0, 12)
+
+    # Nothing past the failed offset is committed, so it is redelivered
+    assert tracker.pop_committable() == {("events.k8s", 0): 11}
+    assert tracker.pop_committable() == {}
+    assert tracker.in_flight == 0
+
+    tracker.revoke("events.k8s", 0)
+    assert tracker.in_flight == 0
+
+
+def test_failed_offset_completed_later_releases_commit_point():
+    tracker = OffsetTracker()
+    for offset in range(1000):
+        tracker.track("events.k8s", 0, offset)
+
+    tracker.fail("events.k8s", 0, 0)
+    for offset in range(1, 1000):
+        tracker.complete("events.k8s", 0, offset)
+
+    # Everything behind the failed head waits for it
+    assert tracker.pop_committable() == {}
+    assert tracker.pending_commit == 999
+    assert tracker.in_flight == 0
+
+    # Dead-lettered: the commit point moves past the whole partition
+    tracker.complete("events.k8s", 0, 0)
+    assert tracker.pop_committable() == {("events.k8s", 0): 1000}
+    assert tracker.pending_commit == 0
+    assert tracker.in_flight == 0
+
+    # No per-offset state is left behind
+    tracker.track("events.k8s", 0, 1000)
+    tracker.complete("events.k8s", 0, 1000)
+    assert tracker.pop_committable() == {("events.k8s", 0): 1001}
+    assert tracker.pending_commit == 0